@@ -0,0 +1,261 @@
+# benchmark.py
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import shutil
+import tempfile
+import time
+from datetime import date, datetime, timedelta
+
+from PIL import Image
+
+import postar_kriasys
+import rajada
+from contas import PoolContas
+from estado import abrir_estado
+from fila import abrir_fila
+from metricas import METRICAS, percentil
+from planejador import calcular_semana, inicio_da_semana
+from preconversao import PipelineMidia
+from telegram_falso import SERVIDOR
+
+# -----------------------------------------------------------------------------
+# Benchmark de ponta a ponta usando o Telegram falso (telegram_falso.py):
+# gera um catálogo de posts e mídias numa pasta temporária, roda o modo de
+# teste, o caminho do agendamento (plano -> fila -> pool -> envio) ou o modo
+# rajada (rajada.py) e mede posts/s, latência dos envios, bytes enviados, CPU
+# da conversão e o tempo gasto gravando o estado da rotação.
+# -----------------------------------------------------------------------------
+TAMANHOS_PADRAO = (10, 1000, 100000)
+MODOS = ('teste', 'agendado', 'rajada')
+
+
+def gerar_catalogo(pasta, quantidade_posts, midias_por_pasta, lado, album=0, videos=0, video_mb=0):
+    """
+    Cria posts.txt e as pastas de mídia (imagens .webp de ruído, que comprimem mal
+    como fotos reais). Com 'album', um a cada três posts é do tipo 'galeria'
+    (álbum); com 'videos', cada pasta ganha vídeos .mp4 de 'video_mb' MB.
+    """
+    with open(os.path.join(pasta, 'posts.txt'), 'w', encoding='utf-8') as f:
+        for numero in range(quantidade_posts):
+            tipo = 'usuario' if numero % 2 == 0 else 'revenda'
+            if album and numero % 3 == 2:
+                tipo = 'galeria'
+            f.write(f"-- INICIO {tipo}\n"
+                    f"Post de teste número {numero}.\n"
+                    f"{'Texto de exemplo para o benchmark. ' * random.randint(1, 8)}\n"
+                    f"-- FIM\n\n")
+    for nome_pasta in postar_kriasys.PASTAS_POR_TIPO.values():
+        destino = os.path.join(pasta, nome_pasta)
+        os.makedirs(destino, exist_ok=True)
+        for numero in range(midias_por_pasta):
+            imagem = Image.frombytes('RGB', (lado, lado), os.urandom(lado * lado * 3))
+            imagem.save(os.path.join(destino, f'midia_{numero}.webp'), 'WEBP', quality=90)
+        for numero in range(videos):
+            # Só o tamanho importa para o Telegram falso
+            with open(os.path.join(destino, f'video_{numero}.mp4'), 'wb') as f:
+                f.write(os.urandom(int(video_mb * 1024 * 1024)))
+
+
+def escrever_config(pasta, args):
+    config = {
+        'target_id': -1000000000001,
+        'posts_per_day': 1,
+        'scheduled_times': ['12:00'],
+        'variation_minutes': 30,
+        'transport': 'fake',
+        'fake_transport': {
+            'latency_ms': args.latencia_ms,
+            'upload_mbps': args.banda_mbps,
+            'limit_per_minute': args.limite_por_minuto,
+            'flood_seconds': args.flood_segundos,
+        },
+        'accounts': [{'session': f'conta{numero}'} for numero in range(args.contas)],
+        'upload_workers': args.trabalhadores_upload,
+        'rate_per_minute': args.envios_por_minuto,
+        'burst': args.envios_por_minuto,
+        'state_backend': args.estado,
+        'targets': [{'nome': f'alvo{numero}', 'target_id': -1000000000000 - numero}
+                    for numero in range(args.alvos)],
+    }
+    if args.rotacao == 'weighted':
+        config.update({'rotation': 'weighted', 'rotation_cooldown': args.cooldown})
+    if args.album:
+        config['albuns'] = {'galeria': {'midias': 'usuario', 'quantidade': args.album}}
+    with open(os.path.join(pasta, 'config.json'), 'w', encoding='utf-8') as f:
+        json.dump(config, f)
+
+
+async def rodar_agendado(config, alvos, fila, envios):
+    """
+    Caminho do agendamento com o tempo comprimido: os horários vêm do planejador
+    (semana após semana) e cada um é disparado como o job do scheduler faria.
+    """
+    pool = PoolContas.do_config(config)
+    await pool.iniciar()
+    pipeline = PipelineMidia()
+    trabalhador = asyncio.create_task(fila.trabalhar(postar_kriasys.criar_executor(alvos, pool, pipeline, fila)))
+    try:
+        segunda = inicio_da_semana(date.today())
+        disparados = 0
+        while disparados < envios:
+            for alvo in alvos:
+                for item in calcular_semana(alvo.config, segunda, semente=0):
+                    if disparados >= envios:
+                        break
+                    chave = f"{alvo.nome}:{item['data']}:{item['slot']}"
+                    await postar_kriasys.disparar_post(fila, alvo, datetime.now(), chave)
+                    disparados += 1
+            segunda += timedelta(weeks=1)
+        await fila.aguardar_envios()
+    finally:
+        trabalhador.cancel()
+        pipeline.encerrar()
+        await pool.encerrar()
+
+
+def medir(modo, quantidade_posts, args):
+    pasta = tempfile.mkdtemp(prefix='kriasys_bench_')
+    pasta_original = os.getcwd()
+    try:
+        os.chdir(pasta)
+        gerar_catalogo(pasta, quantidade_posts, args.midias, args.lado,
+                       args.album, args.videos, args.video_mb)
+        escrever_config(pasta, args)
+        SERVIDOR.zerar()
+        METRICAS.zerar()
+        config = postar_kriasys.carregar_config('config.json')
+
+        inicio = time.perf_counter()
+        estado = abrir_estado(config)
+        alvos = postar_kriasys.criar_alvos(config, estado)
+        tempo_indexacao = time.perf_counter() - inicio
+
+        # Conversão medida à parte; o modo testado depois encontra tudo no cache em disco
+        pipeline = PipelineMidia()
+        inicio = time.perf_counter()
+        asyncio.run(pipeline.preparar(postar_kriasys.todas_as_midias(
+            postar_kriasys.indices_dos_alvos(alvos))))
+        tempo_conversao = time.perf_counter() - inicio
+        pipeline.encerrar()
+
+        fila = abrir_fila(config)
+        envios = args.envios or quantidade_posts
+        inicio = time.perf_counter()
+        if modo == 'teste':
+            rodadas = max(1, envios // len(alvos))
+            esperados = rodadas * len(alvos)
+            asyncio.run(postar_kriasys.modo_teste(config, alvos, fila, intervalo=0, rodadas=rodadas))
+        elif modo == 'rajada':
+            quantidade = max(1, envios // len(alvos))
+            esperados = quantidade * len(alvos)
+            asyncio.run(rajada.executar_rajada(config, alvos, fila, quantidade, args.rajada_trabalhadores))
+        else:
+            esperados = envios
+            asyncio.run(rodar_agendado(config, alvos, fila, envios))
+        duracao = time.perf_counter() - inicio
+        estado.fechar()
+
+        latencias = [linha[0] for linha in fila.conn.execute(
+            "SELECT enviado_em - executar_em FROM envios WHERE status = 'enviado'")]
+        fila.fechar()
+
+        servidor = SERVIDOR.resumo()
+        return {
+            'modo': modo,
+            'posts_no_catalogo': quantidade_posts,
+            'enviados': len(latencias),
+            'esperados': esperados,
+            'posts_por_segundo': len(latencias) / duracao if duracao else 0.0,
+            'latencia_p50_ms': percentil(latencias, 50) * 1000,
+            'latencia_p99_ms': percentil(latencias, 99) * 1000,
+            'bytes_enviados': servidor['bytes_recebidos'],
+            'uploads': servidor['uploads'],
+            'reusos': servidor['reusos'],
+            'floodwaits': servidor['floodwaits'],
+            'cpu_conversao_s': pipeline.tempo_cpu,
+            'tempo_conversao_s': tempo_conversao,
+            'tempo_indexacao_s': tempo_indexacao,
+            'tempo_estado_s': METRICAS.tempo_total('save_state'),
+            'gravacoes_estado': METRICAS.contagem('save_state'),
+            'metricas': METRICAS.como_dict(),
+        }
+    finally:
+        os.chdir(pasta_original)
+        shutil.rmtree(pasta, ignore_errors=True)
+
+
+def imprimir(resultado):
+    print(f"[{resultado['modo']}] catálogo de {resultado['posts_no_catalogo']} posts: "
+          f"{resultado['enviados']} enviados, {resultado['posts_por_segundo']:.1f} posts/s, "
+          f"latência p50 {resultado['latencia_p50_ms']:.0f} ms / p99 {resultado['latencia_p99_ms']:.0f} ms")
+    print(f"    upload: {resultado['bytes_enviados']} bytes em {resultado['uploads']} upload(s), "
+          f"{resultado['reusos']} reuso(s) do cache, {resultado['floodwaits']} FloodWait(s)")
+    print(f"    conversão: {resultado['cpu_conversao_s']:.2f} s de CPU ({resultado['tempo_conversao_s']:.2f} s no total) | "
+          f"indexação: {resultado['tempo_indexacao_s']:.2f} s | "
+          f"estado: {resultado['tempo_estado_s'] * 1000:.1f} ms em {resultado['gravacoes_estado']} gravação(ões)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark do bot com o Telegram falso (sem rede).")
+    parser.add_argument('--posts', type=int, nargs='+', default=list(TAMANHOS_PADRAO),
+                        help="Tamanhos de catálogo (quantidade de posts no posts.txt).")
+    parser.add_argument('--modos', nargs='+', choices=MODOS, default=list(MODOS))
+    parser.add_argument('--envios', type=int, default=200,
+                        help="Posts enviados em cada rodada (0 = um por post do catálogo).")
+    parser.add_argument('--alvos', type=int, default=2)
+    parser.add_argument('--contas', type=int, default=2)
+    parser.add_argument('--midias', type=int, default=10, help="Mídias em cada pasta.")
+    parser.add_argument('--lado', type=int, default=1600, help="Lado (px) das imagens geradas.")
+    parser.add_argument('--album', type=int, default=0,
+                        help="Mídias por álbum nos posts do tipo 'galeria' (0 = sem álbuns).")
+    parser.add_argument('--videos', type=int, default=0, help="Vídeos .mp4 em cada pasta.")
+    parser.add_argument('--video-mb', type=float, default=50, help="Tamanho (MB) de cada vídeo.")
+    parser.add_argument('--trabalhadores-upload', type=int, default=4,
+                        help="Partes aguardando resposta ao mesmo tempo (na mesma conexão) no upload de "
+                             "arquivos grandes ('upload_workers').")
+    parser.add_argument('--rotacao', choices=('shuffle', 'weighted'), default='shuffle',
+                        help="Modo de rotação dos posts e mídias ('rotation').")
+    parser.add_argument('--cooldown', type=int, default=5,
+                        help="Janela sem repetição da rotação ponderada ('rotation_cooldown').")
+    parser.add_argument('--rajada-trabalhadores', type=int, default=rajada.TRABALHADORES_PADRAO,
+                        help="Posts preparados ao mesmo tempo no modo rajada.")
+    parser.add_argument('--estado', choices=('json', 'sqlite'), default='json')
+    parser.add_argument('--latencia-ms', type=float, default=50)
+    parser.add_argument('--banda-mbps', type=float, default=20)
+    parser.add_argument('--limite-por-minuto', type=int, default=0,
+                        help="Envios por minuto por conta antes do FloodWait simulado (0 = sem limite).")
+    parser.add_argument('--flood-segundos', type=int, default=5)
+    parser.add_argument('--envios-por-minuto', type=float, default=60000,
+                        help="Token bucket de cada conta ('rate_per_minute').")
+    parser.add_argument('--json', help="Grava os resultados neste arquivo.")
+    parser.add_argument('--verboso', action='store_true', help="Mostra as mensagens do bot.")
+    args = parser.parse_args()
+    # As mensagens do bot (várias por post) só aparecem com --verboso
+    logging.basicConfig(level=logging.INFO if args.verboso else logging.WARNING,
+                        format='%(asctime)s %(levelname)s %(name)s: %(message)s')
+
+    resultados = []
+    for quantidade_posts in args.posts:
+        for modo in args.modos:
+            resultado = medir(modo, quantidade_posts, args)
+            imprimir(resultado)
+            resultados.append(resultado)
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(resultados, f, ensure_ascii=False, indent=2)
+
+    # Com o limite de envios, os FloodWaits só atrasam: nenhum post pode ficar de fora
+    incompletos = [r for r in resultados if r['enviados'] < r['esperados']]
+    if args.limite_por_minuto and incompletos:
+        for resultado in incompletos:
+            print(f"ERRO: [{resultado['modo']}] {resultado['enviados']} de {resultado['esperados']} "
+                  f"post(s) enviados com --limite-por-minuto {args.limite_por_minuto}.")
+        exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,418 @@
+# cache_midia.py
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import tempfile
+from contextlib import AsyncExitStack
+
+from telethon.errors import (FilePart0MissingError, FilePartMissingError, FilePartsInvalidError,
+                             FileReferenceExpiredError, MediaEmptyError)
+from telethon.tl.types import InputDocument, InputPhoto
+
+from metricas import METRICAS
+from similaridade import SIMILARES
+from upload_paralelo import enviar_arquivos, formatacao
+
+logger = logging.getLogger(__name__)
+
+# -----------------------------------------------------------------------------
+# Erros que o Telegram devolve quando a referência salva não vale mais.
+# Nesses casos basta fazer o upload de novo.
+# -----------------------------------------------------------------------------
+ERROS_DE_REFERENCIA = (FileReferenceExpiredError, MediaEmptyError)
+# Erros de quando as partes de um arquivo grande enviadas antes não valem mais
+ERROS_DE_UPLOAD = (FilePartMissingError, FilePart0MissingError, FilePartsInvalidError)
+
+
+def calcular_hash(caminho, tamanho_bloco=1024 * 1024):
+    """Calcula o SHA-256 do conteúdo do arquivo, lendo em blocos."""
+    sha = hashlib.sha256()
+    with open(caminho, 'rb') as f:
+        for bloco in iter(lambda: f.read(tamanho_bloco), b''):
+            sha.update(bloco)
+    return sha.hexdigest()
+
+
+# -----------------------------------------------------------------------------
+# Cache persistente de uploads: para cada arquivo de mídia guarda a referência
+# (foto ou documento) devolvida pelo Telegram no primeiro envio, para que os
+# próximos posts do mesmo arquivo mandem só a referência, sem reenviar os bytes.
+# -----------------------------------------------------------------------------
+class CacheMidia:
+    def __init__(self, caminho='cache_midia.json'):
+        """
+        :param caminho: Arquivo JSON onde o cache é gravado. As referências valem
+                        apenas para a conta que fez o upload, por isso cada sessão
+                        deve ter o seu próprio arquivo.
+        """
+        self.caminho = caminho
+        self.itens = {}
+        self.bytes_enviados = 0
+        self.bytes_economizados = 0
+        # Um lock por arquivo: se vários alvos pedem a mesma mídia ao mesmo tempo,
+        # só o primeiro faz o upload e os outros reaproveitam a referência
+        self._locks = {}
+        # hash do conteúdo -> caminhos com referência salva (busca por conteúdo em O(1))
+        self._por_hash = {}
+        # caminho -> (mídia do upload em partes, mtime, tamanho, bytes enviados) dos arquivos grandes
+        # cujas partes já subiram mas o send_file não terminou (ex.: FloodWait). Fica só
+        # em memória: as partes valem só nesta conta e o Telegram as guarda por pouco tempo.
+        self._uploads = {}
+        self._carregar()
+
+    def _carregar(self):
+        if not os.path.exists(self.caminho):
+            return
+        try:
+            with open(self.caminho, 'r', encoding='utf-8') as f:
+                dados = json.load(f)
+            self.itens = dados.get('itens', {})
+            self.bytes_enviados = dados.get('bytes_enviados', 0)
+            self.bytes_economizados = dados.get('bytes_economizados', 0)
+        except (OSError, ValueError) as e:
+            # Cache corrompido não impede o envio: apenas começa vazio
+            logger.warning("Não foi possível ler o cache de mídia '%s': %s", self.caminho, e)
+            self.itens = {}
+        for caminho_midia, entrada in self.itens.items():
+            self._por_hash.setdefault(entrada['hash'], set()).add(caminho_midia)
+
+    def _guardar(self, caminho_midia, entrada):
+        self._remover(caminho_midia)
+        self.itens[caminho_midia] = entrada
+        self._por_hash.setdefault(entrada['hash'], set()).add(caminho_midia)
+
+    def _remover(self, caminho_midia):
+        entrada = self.itens.pop(caminho_midia, None)
+        if entrada is None:
+            return None
+        caminhos = self._por_hash.get(entrada['hash'])
+        if caminhos is not None:
+            caminhos.discard(caminho_midia)
+            if not caminhos:
+                del self._por_hash[entrada['hash']]
+        return entrada
+
+    def salvar(self):
+        """Grava o cache de forma atômica (arquivo temporário + rename)."""
+        dados = {
+            'itens': self.itens,
+            'bytes_enviados': self.bytes_enviados,
+            'bytes_economizados': self.bytes_economizados,
+        }
+        pasta = os.path.dirname(os.path.abspath(self.caminho))
+        fd, temporario = tempfile.mkstemp(dir=pasta, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump(dados, f, ensure_ascii=False, separators=(',', ':'))
+            os.replace(temporario, self.caminho)
+        except OSError:
+            if os.path.exists(temporario):
+                os.remove(temporario)
+            raise
+
+    def _entrada_valida(self, caminho_midia):
+        """
+        Devolve a entrada do cache se o arquivo não mudou desde o upload.
+        O hash só é recalculado quando o mtime ou o tamanho mudam.
+        """
+        entrada = self.itens.get(caminho_midia)
+        if entrada is None:
+            return None
+        try:
+            st = os.stat(caminho_midia)
+        except OSError:
+            return None
+        if entrada['mtime'] == st.st_mtime_ns and entrada['tamanho'] == st.st_size:
+            return entrada
+        if calcular_hash(caminho_midia) == entrada['hash']:
+            # Só o mtime mudou (ex.: arquivo copiado); o conteúdo é o mesmo
+            entrada['mtime'] = st.st_mtime_ns
+            entrada['tamanho'] = st.st_size
+            return entrada
+        return None
+
+    def _entrada_por_conteudo(self, caminho_midia):
+        """
+        Procura outro arquivo com o mesmo conteúdo que já foi enviado
+        (ex.: a mesma imagem nas pastas de dois alvos diferentes). Com
+        "media_dedup", vale também uma mídia quase igual do mesmo grupo.
+        """
+        try:
+            hash_midia = calcular_hash(caminho_midia)
+            st = os.stat(caminho_midia)
+        except OSError:
+            return None
+        candidatos = sorted(self._por_hash.get(hash_midia, ()))
+        if SIMILARES.ativo:
+            candidatos += [outro for outro in SIMILARES.membros(caminho_midia) if outro in self.itens]
+        for outro in candidatos:
+            entrada = self._entrada_valida(outro)
+            if entrada is not None:
+                # A cópia descreve este arquivo: deixa de valer se ele mudar
+                copia = dict(entrada, hash=hash_midia, mtime=st.st_mtime_ns, tamanho=st.st_size)
+                self._guardar(caminho_midia, copia)
+                return copia
+        return None
+
+    def obter(self, caminho_midia):
+        """Devolve um InputPhoto/InputDocument reaproveitável ou None se for preciso fazer upload."""
+        entrada = self._entrada_valida(caminho_midia)
+        if entrada is None and caminho_midia not in self.itens:
+            entrada = self._entrada_por_conteudo(caminho_midia)
+        if entrada is None:
+            return None
+        classe = InputPhoto if entrada['tipo'] == 'foto' else InputDocument
+        return classe(
+            id=entrada['id'],
+            access_hash=entrada['access_hash'],
+            file_reference=bytes.fromhex(entrada['file_reference'])
+        )
+
+    async def consultar(self, caminho_midia):
+        """
+        obter() para quem está no loop de eventos: roda numa thread (o hash de
+        arquivos grandes pode demorar) e sob o lock do arquivo, como no envio.
+        """
+        async with self.lock_para(caminho_midia):
+            return await asyncio.to_thread(self.obter, caminho_midia)
+
+    def registrar(self, caminho_midia, mensagem, bytes_enviados):
+        """Guarda a referência da mídia contida na mensagem recém-enviada."""
+        self._uploads.pop(caminho_midia, None)
+        self.bytes_enviados += bytes_enviados
+        METRICAS.incrementar('bytes_enviados_total', bytes_enviados)
+        midia = mensagem.photo or mensagem.document
+        if midia is None:
+            self.salvar()
+            return
+        st = os.stat(caminho_midia)
+        self._guardar(caminho_midia, {
+            'hash': calcular_hash(caminho_midia),
+            'mtime': st.st_mtime_ns,
+            'tamanho': st.st_size,
+            'tamanho_upload': bytes_enviados,
+            'tipo': 'foto' if mensagem.photo is not None else 'documento',
+            'id': midia.id,
+            'access_hash': midia.access_hash,
+            'file_reference': midia.file_reference.hex(),
+        })
+        self.salvar()
+
+    def registrar_reuso(self, caminho_midia, mensagem=None):
+        """Contabiliza os bytes que deixaram de ser enviados e atualiza a file_reference."""
+        entrada = self.itens[caminho_midia]
+        self.bytes_economizados += entrada['tamanho_upload']
+        METRICAS.incrementar('bytes_economizados_total', entrada['tamanho_upload'])
+        midia = mensagem and (mensagem.photo or mensagem.document)
+        if midia is not None:
+            entrada['file_reference'] = midia.file_reference.hex()
+        self.salvar()
+
+    def invalidar(self, caminho_midia):
+        """Remove a entrada (ex.: quando o Telegram diz que a referência expirou)."""
+        if self._remover(caminho_midia) is not None:
+            self.salvar()
+
+    def guardar_upload(self, caminho_midia, arquivo, bytes_enviados):
+        """Guarda a mídia de um upload em partes cujo envio falhou, para a próxima tentativa."""
+        st = os.stat(caminho_midia)
+        self._uploads[caminho_midia] = (arquivo, st.st_mtime_ns, st.st_size, bytes_enviados)
+
+    def upload_pendente(self, caminho_midia):
+        """(mídia do upload, bytes enviados) de um upload ainda não enviado, ou None (também se o arquivo mudou)."""
+        pendente = self._uploads.get(caminho_midia)
+        if pendente is None:
+            return None
+        arquivo, mtime, tamanho, bytes_enviados = pendente
+        try:
+            st = os.stat(caminho_midia)
+        except OSError:
+            st = None
+        if st is None or (st.st_mtime_ns, st.st_size) != (mtime, tamanho):
+            del self._uploads[caminho_midia]
+            return None
+        return arquivo, bytes_enviados
+
+    def descartar_upload(self, caminho_midia):
+        self._uploads.pop(caminho_midia, None)
+
+    def lock_para(self, caminho_midia):
+        if caminho_midia not in self._locks:
+            self._locks[caminho_midia] = asyncio.Lock()
+        return self._locks[caminho_midia]
+
+    def resumo(self):
+        return (f"Bytes enviados: {self.bytes_enviados} | "
+                f"bytes economizados pelo cache: {self.bytes_economizados}")
+
+
+# -----------------------------------------------------------------------------
+# Envia uma mídia usando o cache: se houver referência salva, manda só ela;
+# se não houver (ou tiver expirado), prepara o arquivo e faz o upload.
+# -----------------------------------------------------------------------------
+async def enviar_midia(gerenciador, entidade, caminho_midia, legenda, preparar, entidades=None):
+    """
+    :param gerenciador: GerenciadorCliente com a conexão e o cache da conta.
+    :param entidade: Grupo ou canal de destino.
+    :param caminho_midia: Caminho do arquivo original (chave do cache).
+    :param legenda: Texto enviado junto com a mídia.
+    :param preparar: Função que recebe o caminho original e devolve
+                     (arquivo_para_upload, temporario) ou (None, False) em caso de erro.
+    :param entidades: Formatação da legenda já interpretada (None = o Telethon interpreta o markdown).
+    :return: A mensagem enviada, ou None se não foi possível preparar a mídia.
+    """
+    cache = gerenciador.cache_midia
+    async with cache.lock_para(caminho_midia):
+        return await _enviar_midia(gerenciador, cache, entidade, caminho_midia, legenda, preparar, entidades)
+
+
+async def _enviar_midia(gerenciador, cache, entidade, caminho_midia, legenda, preparar, entidades):
+    referencia = cache.obter(caminho_midia)
+    if referencia is not None:
+        try:
+            with METRICAS.cronometrar('send_file', upload='nao'):
+                mensagem = await gerenciador.enviar(lambda client: client.send_file(
+                    entidade, referencia, caption=legenda, **formatacao(entidades)
+                ))
+            cache.registrar_reuso(caminho_midia, mensagem)
+            logger.debug("Mídia %s reaproveitada do cache (sem novo upload).", caminho_midia)
+            return mensagem
+        except ERROS_DE_REFERENCIA as e:
+            logger.info("Referência da mídia expirou (%s). Fazendo upload novamente.", e)
+            METRICAS.incrementar('referencias_expiradas_total')
+            cache.invalidar(caminho_midia)
+
+    pendente = cache.upload_pendente(caminho_midia)
+    if pendente is not None:
+        # As partes já subiram numa tentativa anterior (ex.: FloodWait no send_file)
+        arquivo, tamanho = pendente
+        try:
+            with METRICAS.cronometrar('send_file', upload='nao'):
+                mensagem = await gerenciador.enviar(lambda client: client.send_file(
+                    entidade, arquivo, caption=legenda, **formatacao(entidades)
+                ))
+            cache.registrar(caminho_midia, mensagem, tamanho)
+            logger.debug("Mídia %s enviada com as partes do upload anterior.", caminho_midia)
+            return mensagem
+        except ERROS_DE_UPLOAD as e:
+            logger.info("As partes enviadas antes não valem mais (%s). Fazendo upload novamente.", e)
+            cache.descartar_upload(caminho_midia)
+
+    arquivo, temporario = preparar(caminho_midia)
+    if not arquivo:
+        return None
+    subidos = {}
+    try:
+        tamanho = os.path.getsize(arquivo)
+        with METRICAS.cronometrar('send_file', upload='sim'):
+            mensagem = await gerenciador.enviar(lambda client: enviar_arquivos(
+                client, entidade, arquivo, legenda, gerenciador.trabalhadores_upload, entidades, subidos
+            ))
+        cache.registrar(caminho_midia, mensagem, tamanho)
+        return mensagem
+    except Exception as e:
+        if subidos and not isinstance(e, ERROS_DE_UPLOAD):
+            cache.guardar_upload(caminho_midia, subidos[0], tamanho)
+        raise
+    finally:
+        if temporario:
+            try:
+                os.remove(arquivo)
+            except Exception as e:
+                logger.error("Erro ao remover arquivo temporário: %s", e)
+
+
+# -----------------------------------------------------------------------------
+# Envia um álbum (2 a 10 mídias) num único send_file. Cada mídia do álbum usa
+# o cache como no envio simples: as já enviadas vão só como referência e as
+# outras são preparadas e enviadas (as grandes em partes).
+# -----------------------------------------------------------------------------
+async def enviar_album(gerenciador, entidade, caminhos_midia, legenda, preparar, entidades=None):
+    """
+    Mesmos parâmetros de enviar_midia(), mas com a lista de caminhos do álbum.
+    A legenda vai na primeira mídia.
+    :return: A lista de mensagens enviadas, ou None se nenhuma mídia pôde ser preparada.
+    """
+    cache = gerenciador.cache_midia
+    async with AsyncExitStack() as locks:
+        # Sempre na mesma ordem: dois álbuns com mídias em comum não travam um ao outro
+        for caminho in sorted(set(caminhos_midia)):
+            await locks.enter_async_context(cache.lock_para(caminho))
+        referencias = {caminho: cache.obter(caminho) for caminho in caminhos_midia}
+        if any(referencias.values()):
+            try:
+                return await _enviar_album(gerenciador, cache, entidade, caminhos_midia,
+                                           referencias, legenda, preparar, entidades)
+            except ERROS_DE_REFERENCIA as e:
+                # Não dá para saber qual das referências expirou: todas são enviadas de novo
+                logger.info("Referência de mídia do álbum expirou (%s). Fazendo upload novamente.", e)
+                METRICAS.incrementar('referencias_expiradas_total')
+                for caminho, referencia in referencias.items():
+                    if referencia is not None:
+                        cache.invalidar(caminho)
+                referencias = dict.fromkeys(caminhos_midia)
+        return await _enviar_album(gerenciador, cache, entidade, caminhos_midia,
+                                   referencias, legenda, preparar, entidades)
+
+
+async def _enviar_album(gerenciador, cache, entidade, caminhos_midia, referencias, legenda, preparar,
+                        entidades):
+    incluidos, arquivos, temporarios = [], [], []
+    # caminho -> bytes enviados das mídias que precisam de upload
+    tamanhos = {}
+    # Mídias que vão com as partes de um upload anterior
+    pendentes = []
+    # posição -> mídia dos arquivos grandes que subiram nesta tentativa
+    subidos = {}
+    try:
+        for caminho in caminhos_midia:
+            arquivo = referencias[caminho]
+            pendente = cache.upload_pendente(caminho) if arquivo is None else None
+            if pendente is not None:
+                arquivo, tamanhos[caminho] = pendente
+                pendentes.append(caminho)
+            elif arquivo is None:
+                arquivo, temporario = preparar(caminho)
+                if not arquivo:
+                    logger.warning("Mídia %s ficou fora do álbum: não foi possível prepará-la.", caminho)
+                    continue
+                if temporario:
+                    temporarios.append(arquivo)
+                tamanhos[caminho] = os.path.getsize(arquivo)
+            incluidos.append(caminho)
+            arquivos.append(arquivo)
+        if not arquivos:
+            return None
+
+        try:
+            with METRICAS.cronometrar('send_album', upload='sim' if tamanhos else 'nao'):
+                mensagens = await gerenciador.enviar(lambda client: enviar_arquivos(
+                    client, entidade, arquivos, legenda, gerenciador.trabalhadores_upload, entidades, subidos
+                ))
+        except ERROS_DE_UPLOAD as e:
+            if not pendentes:
+                raise
+            logger.info("As partes enviadas antes não valem mais (%s). Fazendo upload novamente.", e)
+            for caminho in pendentes:
+                cache.descartar_upload(caminho)
+            return await _enviar_album(gerenciador, cache, entidade, caminhos_midia, referencias, legenda,
+                                       preparar, entidades)
+        except Exception:
+            for posicao, arquivo in subidos.items():
+                cache.guardar_upload(incluidos[posicao], arquivo, tamanhos[incluidos[posicao]])
+            raise
+        # As mensagens voltam na mesma ordem das mídias
+        for caminho, mensagem in zip(incluidos, mensagens):
+            if caminho in tamanhos:
+                cache.registrar(caminho, mensagem, tamanhos[caminho])
+            else:
+                cache.registrar_reuso(caminho, mensagem)
+        return mensagens
+    finally:
+        for arquivo in temporarios:
+            try:
+                os.remove(arquivo)
+            except Exception as e:
+                logger.error("Erro ao remover arquivo temporário: %s", e)
@@ -0,0 +1,203 @@
+# cliente_telegram.py
+import asyncio
+import logging
+import random
+import time
+
+from telethon import TelegramClient
+from telethon.errors import FloodWaitError
+
+from cache_midia import CacheMidia
+from metricas import METRICAS
+
+logger = logging.getLogger(__name__)
+
+# -----------------------------------------------------------------------------
+# Erros que indicam queda de conexão (e não erro da própria requisição)
+# -----------------------------------------------------------------------------
+ERROS_DE_CONEXAO = (ConnectionError, asyncio.TimeoutError)
+
+
+# -----------------------------------------------------------------------------
+# Cria o cliente do transporte escolhido em 'transport': o Telegram de verdade
+# ('telegram', padrão) ou o Telegram falso local ('fake'), sem rede nem credenciais.
+# -----------------------------------------------------------------------------
+def criar_cliente(config, session):
+    if config.get('transport', 'telegram') == 'fake':
+        from telegram_falso import SERVIDOR, ClienteFalso
+        SERVIDOR.configurar(**config.get('fake_transport', {}))
+        return ClienteFalso(session, SERVIDOR)
+    # flood_sleep_threshold=0: todo FloodWait chega até nós, para que a conta
+    # seja estacionada e o envio vá para outra conta em vez de dormir aqui
+    return TelegramClient(
+        session, config['api_id'], config['api_hash'],
+        flood_sleep_threshold=0
+    )
+
+
+# -----------------------------------------------------------------------------
+# Token bucket: libera até 'rajada' envios de uma vez e depois repõe
+# 'por_minuto' fichas por minuto.
+# -----------------------------------------------------------------------------
+class LimitadorTaxa:
+    def __init__(self, por_minuto, rajada=1):
+        self.taxa = por_minuto / 60.0
+        self.capacidade = rajada
+        self.fichas = float(rajada)
+        self._atualizado = time.monotonic()
+
+    def _repor(self):
+        agora = time.monotonic()
+        self.fichas = min(self.capacidade, self.fichas + (agora - self._atualizado) * self.taxa)
+        self._atualizado = agora
+
+    async def adquirir(self):
+        """Espera até haver uma ficha disponível e a consome."""
+        while True:
+            self._repor()
+            if self.fichas >= 1:
+                self.fichas -= 1
+                return
+            await asyncio.sleep((1 - self.fichas) / self.taxa)
+
+
+# -----------------------------------------------------------------------------
+# Classe que mantém um único TelegramClient vivo durante toda a execução,
+# reconectando com backoff exponencial quando a conexão cai.
+# -----------------------------------------------------------------------------
+class GerenciadorCliente:
+    def __init__(self, config, session='session_name',
+                 backoff_inicial=2, backoff_maximo=300):
+        """
+        :param config: Configuração da conta (api_id, api_hash e limites de envio).
+        :param session: Nome do arquivo de sessão do Telethon.
+        :param backoff_inicial: Espera (segundos) antes da primeira nova tentativa de conexão.
+        :param backoff_maximo: Espera máxima (segundos) entre tentativas.
+        """
+        self.config = config
+        self.session = session
+        self.backoff_inicial = backoff_inicial
+        self.backoff_maximo = backoff_maximo
+        self.client = None
+        self._lock = None
+        self._vagas = None
+        # Limites de envio da conta, compartilhados por todos os alvos.
+        # Sem 'rate_per_minute', o ritmo vem de 'min_send_interval_seconds'.
+        self.max_envios_simultaneos = config.get('max_concurrent_sends', 3)
+        intervalo = config.get('min_send_interval_seconds', 1)
+        por_minuto = config.get('rate_per_minute') or (60.0 / intervalo if intervalo else 6000)
+        self.limitador = LimitadorTaxa(por_minuto, config.get('burst', 1))
+        # Partes enviadas ao mesmo tempo no upload de arquivos grandes (1 = upload normal do Telethon)
+        self.trabalhadores_upload = config.get('upload_workers', 4)
+        # Até quando a conta está parada por causa de um FloodWait (time.monotonic)
+        self.parado_ate = 0.0
+        # Cache das entidades já resolvidas (target_id -> entidade)
+        self._entidades = {}
+        # Cache de uploads: as referências de mídia só valem para esta conta
+        self.cache_midia = CacheMidia(f'{session}.midia.json')
+
+    def _obter_lock(self):
+        # O lock é criado sob demanda para ficar preso ao loop que está rodando
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        return self._lock
+
+    def vagas(self):
+        """
+        Semáforo dos envios simultâneos da conta. Fica na conta (e não no pool)
+        para valer também quando vários bots usam a mesma conta (multibot.py).
+        """
+        if self._vagas is None:
+            self._vagas = asyncio.Semaphore(self.max_envios_simultaneos)
+        return self._vagas
+
+    async def _conectar(self):
+        """Conecta (ou reconecta) o cliente, repetindo com backoff até conseguir."""
+        if self.client is None:
+            self.client = criar_cliente(self.config, self.session)
+
+        espera = self.backoff_inicial
+        while True:
+            try:
+                with METRICAS.cronometrar('cliente_start'):
+                    await self.client.start()
+                logger.info("Cliente '%s' iniciado com sucesso.", self.session)
+                return self.client
+            except FloodWaitError as e:
+                logger.warning("FloodWait ao conectar '%s': aguardando %d segundos.", self.session, e.seconds)
+                METRICAS.incrementar('floodwait_total', conta=self.session)
+                await asyncio.sleep(e.seconds)
+            except ERROS_DE_CONEXAO as e:
+                atraso = espera + random.uniform(0, espera / 2)
+                logger.warning("Erro ao conectar o cliente Telethon: %s. Nova tentativa em %.0f segundos.",
+                               e, atraso)
+                await asyncio.sleep(atraso)
+                espera = min(espera * 2, self.backoff_maximo)
+
+    async def iniciar(self):
+        """Inicia o cliente uma única vez (chamado no começo do agendador ou do modo de teste)."""
+        return await self.garantir_conexao()
+
+    async def garantir_conexao(self):
+        """Devolve o cliente conectado, reconectando se a conexão tiver caído."""
+        async with self._obter_lock():
+            if self.client is None or not self.client.is_connected():
+                await self._conectar()
+            return self.client
+
+    async def obter_entidade(self, target_id):
+        """Resolve a entidade do grupo/canal apenas na primeira vez e reaproveita depois."""
+        if target_id not in self._entidades:
+            client = await self.garantir_conexao()
+            with METRICAS.cronometrar('get_entity'):
+                entity = await client.get_entity(target_id)
+            entity_name = (entity.title if hasattr(entity, 'title')
+                           else (entity.username if hasattr(entity, 'username')
+                                 else 'Nome Desconhecido'))
+            logger.info("Entidade encontrada: %s", entity_name)
+            self._entidades[target_id] = entity
+        return self._entidades[target_id]
+
+    async def executar(self, operacao, tentativas=3):
+        """
+        Executa `operacao(client)` reconectando e repetindo se a conexão cair no meio.
+        Erros que não são de conexão são repassados para quem chamou.
+        """
+        espera = self.backoff_inicial
+        for tentativa in range(1, tentativas + 1):
+            client = await self.garantir_conexao()
+            try:
+                return await operacao(client)
+            except ERROS_DE_CONEXAO as e:
+                if tentativa == tentativas:
+                    raise
+                logger.warning("Conexão perdida (%s). Reconectando para a tentativa %d...", e, tentativa + 1)
+                METRICAS.incrementar('reconexoes_total', conta=self.session)
+                await asyncio.sleep(espera)
+                espera = min(espera * 2, self.backoff_maximo)
+
+    async def enviar(self, operacao):
+        """Igual a executar(), mas esperando o token bucket da conta antes de enviar."""
+        await self.limitador.adquirir()
+        return await self.executar(operacao)
+
+    def estacionar(self, segundos):
+        """Tira a conta de uso até o FloodWait terminar."""
+        self.parado_ate = max(self.parado_ate, time.monotonic() + segundos)
+        logger.warning("Conta '%s' em FloodWait: parada por %d segundos.", self.session, segundos)
+        METRICAS.incrementar('floodwait_total', conta=self.session)
+        METRICAS.incrementar('floodwait_segundos_total', segundos, conta=self.session)
+
+    def disponivel(self):
+        return time.monotonic() >= self.parado_ate
+
+    async def aguardar_liberacao(self):
+        """Espera o fim do FloodWait (se houver)."""
+        restante = self.parado_ate - time.monotonic()
+        if restante > 0:
+            await asyncio.sleep(restante)
+
+    async def encerrar(self):
+        """Desconecta o cliente no fim da execução."""
+        if self.client is not None and self.client.is_connected():
+            await self.client.disconnect()
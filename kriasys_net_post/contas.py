@@ -0,0 +1,142 @@
+# contas.py
+import asyncio
+import logging
+import os
+
+from telethon.errors import FloodWaitError
+
+from cliente_telegram import GerenciadorCliente
+
+logger = logging.getLogger(__name__)
+
+# -----------------------------------------------------------------------------
+# Quantas vezes um envio volta para a fila por causa de FloodWait antes de desistir
+# -----------------------------------------------------------------------------
+MAX_REENFILEIRAMENTOS = 10
+
+
+# -----------------------------------------------------------------------------
+# Contas compartilhadas por vários bots no mesmo processo (multibot.py): cada
+# arquivo de sessão vira um único GerenciadorCliente (uma conexão, um token
+# bucket, um cache de uploads), usado pelos pools de todos os bots.
+# -----------------------------------------------------------------------------
+# Limites que valem para a conta inteira; o primeiro bot que a usa define
+LIMITES_DA_CONTA = ('rate_per_minute', 'burst', 'min_send_interval_seconds', 'max_concurrent_sends',
+                    'upload_workers')
+
+
+class RegistroContas:
+    def __init__(self):
+        # caminho absoluto da sessão -> GerenciadorCliente
+        self.contas = {}
+
+    def obter(self, config_conta):
+        chave = os.path.abspath(config_conta['session'])
+        conta = self.contas.get(chave)
+        if conta is None:
+            conta = self.contas[chave] = GerenciadorCliente(config_conta, session=config_conta['session'])
+        elif any(conta.config.get(limite) != config_conta.get(limite) for limite in LIMITES_DA_CONTA):
+            logger.warning("A conta '%s' é usada por mais de um bot com limites diferentes; "
+                           "valem os do primeiro.", config_conta['session'])
+        return conta
+
+    async def encerrar(self):
+        await asyncio.gather(*(conta.encerrar() for conta in self.contas.values()))
+
+
+# -----------------------------------------------------------------------------
+# Pool de contas (sessões) do Telegram. Os envios entram numa fila única e
+# cada conta tem um trabalhador que só pega um envio quando tem vaga livre e
+# não está parada por FloodWait. Um FloodWait estaciona a conta e devolve o
+# envio para a fila, para que outra conta (ou a mesma, depois da espera) o faça.
+# -----------------------------------------------------------------------------
+class PoolContas:
+    def __init__(self, gerenciadores):
+        """
+        :param gerenciadores: Lista de GerenciadorCliente, um por conta.
+        """
+        self.contas = list(gerenciadores)
+        self._fila = None
+        self._trabalhadores = []
+
+    @classmethod
+    def do_config(cls, config, registro=None):
+        """
+        Cria o pool a partir de config['accounts']. Cada conta herda do nível
+        principal o que não definir (api_id, api_hash e limites de envio).
+        Com 'registro' (RegistroContas), contas já abertas por outro bot são reaproveitadas.
+        """
+        gerenciadores = []
+        for conta in config['accounts']:
+            config_conta = dict(config)
+            config_conta.update(conta)
+            if registro is not None:
+                gerenciadores.append(registro.obter(config_conta))
+            else:
+                gerenciadores.append(GerenciadorCliente(config_conta, session=config_conta['session']))
+        return cls(gerenciadores)
+
+    async def iniciar(self):
+        """Conecta todas as contas e inicia um trabalhador por conta."""
+        await asyncio.gather(*(conta.iniciar() for conta in self.contas))
+        self._fila = asyncio.Queue()
+        self._trabalhadores = [asyncio.create_task(self._trabalhador(conta)) for conta in self.contas]
+
+    async def executar(self, trabalho):
+        """
+        Coloca `trabalho(gerenciador)` na fila e espera o resultado.
+        O trabalho deve funcionar em qualquer conta (resolver a entidade e
+        enviar usando o gerenciador recebido).
+        """
+        futuro = asyncio.get_running_loop().create_future()
+        await self._fila.put((trabalho, futuro, 0))
+        return await futuro
+
+    async def _trabalhador(self, conta):
+        semaforo = asyncio.Semaphore(conta.max_envios_simultaneos)
+        while True:
+            # Só pega um envio da fila quando a conta está livre para enviar
+            await semaforo.acquire()
+            await conta.aguardar_liberacao()
+            item = await self._fila.get()
+            trabalho, futuro, reenfileiramentos = item
+            if futuro.done():
+                semaforo.release()
+                continue
+            if not conta.disponivel():
+                # A conta entrou em FloodWait enquanto esperava: deixa o envio para outra
+                self._fila.put_nowait(item)
+                semaforo.release()
+                continue
+            asyncio.create_task(
+                self._executar(conta, semaforo, trabalho, futuro, reenfileiramentos)
+            )
+
+    async def _executar(self, conta, semaforo, trabalho, futuro, reenfileiramentos):
+        try:
+            # As vagas da própria conta só apertam quando outro bot (outro pool) também a usa
+            async with conta.vagas():
+                resultado = await trabalho(conta)
+        except FloodWaitError as e:
+            conta.estacionar(e.seconds)
+            if reenfileiramentos >= MAX_REENFILEIRAMENTOS:
+                if not futuro.done():
+                    futuro.set_exception(e)
+            else:
+                logger.info("Envio devolvido para a fila para ser feito por uma conta disponível.")
+                self._fila.put_nowait((trabalho, futuro, reenfileiramentos + 1))
+        except Exception as e:
+            if not futuro.done():
+                futuro.set_exception(e)
+        else:
+            if not futuro.done():
+                futuro.set_result(resultado)
+        finally:
+            semaforo.release()
+
+    async def encerrar(self, desconectar=True):
+        """Para os trabalhadores; com 'desconectar' (o padrão), desconecta as contas."""
+        for tarefa in self._trabalhadores:
+            tarefa.cancel()
+        if desconectar:
+            await asyncio.gather(*(conta.encerrar() for conta in self.contas))
@@ -0,0 +1,285 @@
+# conteudo.py
+import asyncio
+import hashlib
+import logging
+import os
+import re
+import threading
+from collections import namedtuple
+
+from similaridade import SIMILARES
+
+logger = logging.getLogger(__name__)
+
+# -----------------------------------------------------------------------------
+# Extensões de mídia aceitas (imagens e vídeos .mp4)
+# -----------------------------------------------------------------------------
+EXTENSOES_VALIDAS = (
+    '.jpg', '.jpeg', '.png', '.gif', '.bmp',
+    '.webp', '.tiff', '.svg', '.heic', '.mp4'
+)
+
+# -----------------------------------------------------------------------------
+# Marcadores dos blocos do posts.txt: -- INICIO tipo ... -- FIM
+# -----------------------------------------------------------------------------
+PADRAO_INICIO = re.compile(r'-- INICIO (\w+)')
+MARCADOR_FIM = '-- FIM'
+
+# Posição de um post dentro do posts.txt: o texto só é lido quando o post é escolhido
+RefPost = namedtuple('RefPost', 'tipo offset tamanho')
+
+
+def id_post(tipo, texto):
+    """Id estável de um post: hash curto do tipo + texto."""
+    return hashlib.sha1(f"{tipo}\n{texto}".encode('utf-8')).hexdigest()[:16]
+
+
+def id_midia(caminho, tamanho_bloco=1024 * 1024):
+    """Id estável de uma mídia: hash curto do conteúdo do arquivo."""
+    sha = hashlib.sha256()
+    with open(caminho, 'rb') as f:
+        for bloco in iter(lambda: f.read(tamanho_bloco), b''):
+            sha.update(bloco)
+    return sha.hexdigest()[:16]
+
+
+def _normalizar(texto):
+    """Mesmas quebras de linha que a leitura em modo texto produziria."""
+    return texto.replace('\r\n', '\n').replace('\r', '\n')
+
+
+def _fechar_bloco(tipo, partes, inicio_corpo):
+    """Calcula id, offset e tamanho (em bytes) do texto do bloco já sem espaços nas pontas."""
+    corpo = ''.join(partes)
+    sem_inicio = corpo.lstrip()
+    texto = sem_inicio.rstrip()
+    espacos_iniciais = corpo[:len(corpo) - len(sem_inicio)]
+    offset = inicio_corpo + len(espacos_iniciais.encode('utf-8'))
+    return id_post(tipo, _normalizar(texto)), RefPost(tipo, offset, len(texto.encode('utf-8')))
+
+
+def indexar_posts(posts_path):
+    """
+    Gerador que lê o posts.txt linha a linha e devolve (id, RefPost) para cada
+    bloco -- INICIO tipo / -- FIM. Só o bloco atual fica em memória.
+    """
+    with open(posts_path, 'rb') as f:
+        offset = 0
+        tipo = None
+        partes = []
+        inicio_corpo = 0
+        for linha in f:
+            texto_linha = linha.decode('utf-8')
+            pos = 0
+            while True:
+                if tipo is None:
+                    m = PADRAO_INICIO.search(texto_linha, pos)
+                    if not m:
+                        break
+                    tipo = m.group(1)
+                    inicio_corpo = offset + len(texto_linha[:m.end()].encode('utf-8'))
+                    partes = []
+                    pos = m.end()
+                else:
+                    fim = texto_linha.find(MARCADOR_FIM, pos)
+                    if fim < 0:
+                        partes.append(texto_linha[pos:])
+                        break
+                    partes.append(texto_linha[pos:fim])
+                    yield _fechar_bloco(tipo, partes, inicio_corpo)
+                    tipo = None
+                    pos = fim + len(MARCADOR_FIM)
+            offset += len(linha)
+
+
+# -----------------------------------------------------------------------------
+# Índice de conteúdo: posts e mídias com ids estáveis, recarregados a quente.
+# A verificação é feita por polling de mtime/tamanho; só o que mudou é relido.
+# -----------------------------------------------------------------------------
+class IndiceConteudo:
+    def __init__(self, posts_path='posts.txt', pastas=('imagens_usuario', 'imagens_revenda')):
+        """
+        :param posts_path: Caminho do arquivo de posts.
+        :param pastas: Pastas de mídia que devem ser indexadas.
+        """
+        self.posts_path = posts_path
+        self.pastas = list(pastas)
+        self.posts = {}
+        self.midias = {pasta: {} for pasta in self.pastas}
+        self._assinatura_posts = None
+        # caminho -> (mtime_ns, tamanho, id) para não recalcular hash de arquivo que não mudou
+        self._arquivos = {}
+        self._inscritos = {}
+        self._carregado = False
+        # A verificação roda sempre numa thread (vigiar, atualizar_posts). 'posts' e
+        # 'midias' nunca são alterados no lugar: a verificação monta os novos e troca
+        # a referência, e quem lê no loop vê o índice antigo ou o novo inteiro
+        self._lock = threading.Lock()
+
+    def inscrever(self, chave, callback):
+        """
+        Registra uma função chamada quando 'posts' ou uma das pastas mudar.
+        O callback recebe o novo dicionário {id: item}.
+        """
+        self._inscritos.setdefault(chave, []).append(callback)
+
+    def desinscrever(self, chave, callback):
+        """Remove um callback registrado com inscrever (ex.: alvo removido na recarga do config)."""
+        inscritos = self._inscritos.get(chave, [])
+        if callback in inscritos:
+            inscritos.remove(callback)
+
+    def todas_midias(self):
+        """Lista os caminhos de todas as mídias de todas as pastas."""
+        midias = self.midias
+        return [caminho for pasta in self.pastas for caminho in midias[pasta].values()]
+
+    def apelidos_midias(self, pasta):
+        """
+        Mapeia caminho -> id (estados antigos guardavam o caminho como id das mídias).
+        O caminho aparece com os dois separadores, pois o estado pode ter vindo do Windows.
+        """
+        apelidos = {}
+        for item_id, caminho in self.midias[pasta].items():
+            for variante in (caminho, caminho.replace('/', '\\'), caminho.replace('\\', '/')):
+                apelidos[variante] = item_id
+        return apelidos
+
+    def _verificar_posts(self):
+        try:
+            st = os.stat(self.posts_path)
+        except FileNotFoundError:
+            if not self._carregado:
+                raise
+            logger.warning("'%s' não foi encontrado. Mantendo os posts atuais.", self.posts_path)
+            return False
+        assinatura = (st.st_mtime_ns, st.st_size)
+        if assinatura == self._assinatura_posts:
+            return False
+        posts = dict(indexar_posts(self.posts_path))
+        if not posts and self._carregado:
+            logger.warning("Nenhum post em '%s'. Mantendo os posts atuais.", self.posts_path)
+            return False
+        self._assinatura_posts = assinatura
+        # Os offsets sempre são atualizados; os inscritos só são avisados se os ids mudaram
+        mudou = posts.keys() != self.posts.keys()
+        self.posts = posts
+        return mudou
+
+    def _posts_mudaram(self):
+        try:
+            st = os.stat(self.posts_path)
+        except FileNotFoundError:
+            return False
+        return (st.st_mtime_ns, st.st_size) != self._assinatura_posts
+
+    def verificar_posts(self):
+        """Relê só o posts.txt (se mudou); devolve True se os ids mudaram."""
+        with self._lock:
+            return self._verificar_posts()
+
+    async def atualizar_posts(self):
+        """
+        Chamado no loop antes de escolher ou ler posts: se o posts.txt foi editado
+        depois da última indexação (os offsets mudaram), ele é reindexado numa
+        thread e os inscritos são avisados aqui, no loop.
+        """
+        if not self._posts_mudaram():
+            return
+        try:
+            mudou = await asyncio.to_thread(self.verificar_posts)
+        except Exception as e:
+            logger.error("Erro ao recarregar '%s': %s", self.posts_path, e)
+            return
+        if mudou:
+            self.notificar({'posts'})
+
+    def ler_post(self, item_id):
+        """
+        Lê do disco (por seek) o texto do post escolhido e devolve (tipo, texto),
+        ou None se o post não existe mais no posts.txt. Não reindexa: no loop,
+        chame atualizar_posts antes; um post que mudou de lugar depois disso
+        (arquivo editado agora) não confere com o id e também volta None.
+        """
+        ref = self.posts.get(item_id)
+        if ref is None:
+            return None
+        try:
+            with open(self.posts_path, 'rb') as f:
+                f.seek(ref.offset)
+                texto = _normalizar(f.read(ref.tamanho).decode('utf-8', errors='replace'))
+        except FileNotFoundError:
+            return None
+        if id_post(ref.tipo, texto) != item_id:
+            return None
+        return ref.tipo, texto
+
+    def _verificar_pasta(self, pasta):
+        midias = {}
+        vistos = {}
+        for entrada in os.scandir(pasta):
+            if not entrada.is_file() or not entrada.name.lower().endswith(EXTENSOES_VALIDAS):
+                continue
+            caminho = os.path.join(pasta, entrada.name)
+            st = entrada.stat()
+            vistos[caminho] = (st.st_mtime_ns, st.st_size)
+            conhecido = self._arquivos.get(caminho)
+            if conhecido and conhecido[0] == st.st_mtime_ns and conhecido[1] == st.st_size:
+                item_id = conhecido[2]
+            else:
+                item_id = id_midia(caminho)
+                self._arquivos[caminho] = (st.st_mtime_ns, st.st_size, item_id)
+            # Cópias idênticas do mesmo arquivo viram um único item
+            midias.setdefault(item_id, caminho)
+        for caminho in [c for c in self._arquivos if os.path.dirname(c) == pasta]:
+            if caminho not in vistos:
+                del self._arquivos[caminho]
+        if SIMILARES.ativo:
+            # Mídias quase iguais (hash perceptual próximo) também viram um único item
+            SIMILARES.atualizar(pasta, vistos)
+            midias = SIMILARES.agrupar_pasta(midias)
+        # O caminho de um id pode mudar (cópia renomeada, representante do grupo)
+        if midias == self.midias[pasta]:
+            return False
+        self.midias = {**self.midias, pasta: midias}
+        return True
+
+    def verificar(self):
+        """Relê o que mudou e devolve o conjunto de chaves alteradas ('posts' e/ou pastas)."""
+        with self._lock:
+            return self._verificar()
+
+    def _verificar(self):
+        mudancas = set()
+        if self._verificar_posts():
+            mudancas.add('posts')
+        for pasta in self.pastas:
+            try:
+                if self._verificar_pasta(pasta):
+                    mudancas.add(pasta)
+            except FileNotFoundError:
+                if not self._carregado:
+                    raise
+                logger.warning("A pasta '%s' não foi encontrada. Mantendo as mídias atuais.", pasta)
+        self._carregado = True
+        return mudancas
+
+    def notificar(self, mudancas):
+        for chave in mudancas:
+            novos = self.posts if chave == 'posts' else self.midias[chave]
+            for callback in self._inscritos.get(chave, []):
+                callback(novos)
+
+    async def vigiar(self, intervalo=30):
+        """Verifica periodicamente os arquivos e avisa os inscritos sobre o que mudou."""
+        while True:
+            await asyncio.sleep(intervalo)
+            try:
+                # Leitura e hash dos arquivos fora do loop de eventos
+                mudancas = await asyncio.to_thread(self.verificar)
+            except Exception as e:
+                logger.error("Erro ao recarregar o conteúdo: %s", e)
+                continue
+            if mudancas:
+                logger.info("Conteúdo atualizado: %s", ', '.join(sorted(mudancas)))
+                self.notificar(mudancas)
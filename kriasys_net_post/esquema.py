@@ -0,0 +1,71 @@
+# esquema.py
+import copy
+from collections import namedtuple
+
+# -----------------------------------------------------------------------------
+# Esquema tipado do config.json: cada chave simples é descrita por um Campo
+# (tipos aceitos, valor padrão, regra extra e mensagem de erro). A validação
+# junta todos os erros em vez de parar no primeiro, então um config com vários
+# problemas é corrigido de uma vez só.
+# -----------------------------------------------------------------------------
+# Valor padrão das chaves que o usuário precisa definir
+OBRIGATORIO = object()
+# Valor padrão das chaves opcionais que não ganham valor quando faltam
+OPCIONAL = object()
+
+INTEIRO = (int,)
+NUMERO = (int, float)
+TEXTO = (str,)
+BOOLEANO = (bool,)
+LISTA = (list,)
+OBJETO = (dict,)
+NULO = (type(None),)
+
+Campo = namedtuple('Campo', 'chave tipos padrao regra mensagem')
+
+
+def campo(chave, tipos, padrao, mensagem, regra=None):
+    """
+    :param tipos: Tupla de tipos aceitos (INTEIRO, TEXTO + NULO, ...). bool
+                  nunca vale como número, mesmo sendo subclasse de int.
+    :param padrao: Valor usado quando a chave falta, OBRIGATORIO ou OPCIONAL.
+    :param regra: Função opcional chamada com o valor já no tipo certo.
+    """
+    return Campo(chave, tipos, padrao, regra, mensagem)
+
+
+class ConfigInvalida(Exception):
+    """Config com um ou mais erros; 'erros' tem uma mensagem por problema."""
+
+    def __init__(self, erros):
+        self.erros = list(erros)
+        super().__init__('\n'.join(self.erros))
+
+
+def do_tipo(valor, tipos):
+    if isinstance(valor, bool) and bool not in tipos:
+        return False
+    return isinstance(valor, tipos)
+
+
+def aplicar(dados, campos, erros, prefixo=''):
+    """
+    Preenche os valores padrão de 'campos' em 'dados' e anexa a 'erros' uma
+    mensagem (com o 'prefixo' do alvo) para cada valor fora do esquema.
+    Devolve o conjunto das chaves válidas, para as verificações que dependem delas.
+    """
+    validas = set()
+    for item in campos:
+        if item.chave not in dados:
+            if item.padrao is OBRIGATORIO:
+                erros.append(prefixo + item.mensagem)
+                continue
+            if item.padrao is OPCIONAL:
+                continue
+            dados[item.chave] = copy.deepcopy(item.padrao)
+        valor = dados[item.chave]
+        if not do_tipo(valor, item.tipos) or (item.regra is not None and not item.regra(valor)):
+            erros.append(prefixo + item.mensagem)
+        else:
+            validas.add(item.chave)
+    return validas
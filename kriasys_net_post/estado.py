@@ -0,0 +1,212 @@
+# estado.py
+import json
+import logging
+import os
+import sqlite3
+import tempfile
+
+from metricas import METRICAS
+
+logger = logging.getLogger(__name__)
+
+# -----------------------------------------------------------------------------
+# Arquivos padrão do estado. O state.json guarda apenas ids e cursores;
+# o .journal recebe um registro pequeno a cada post e é compactado no snapshot
+# de tempos em tempos.
+# -----------------------------------------------------------------------------
+STATE_FILE = 'state.json'
+STATE_DB = 'state.sqlite3'
+VERSAO_ESTADO = 2
+
+
+def _gravar_atomico(caminho, dados):
+    """Grava JSON em arquivo temporário, faz fsync e troca pelo definitivo com rename."""
+    pasta = os.path.dirname(os.path.abspath(caminho))
+    fd, temporario = tempfile.mkstemp(dir=pasta, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(dados, f, ensure_ascii=False, separators=(',', ':'))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temporario, caminho)
+    except OSError:
+        if os.path.exists(temporario):
+            os.remove(temporario)
+        raise
+
+
+# -----------------------------------------------------------------------------
+# Backend em arquivo: snapshot compacto + journal de registros pequenos
+# -----------------------------------------------------------------------------
+class ArmazemJSON:
+    def __init__(self, caminho=STATE_FILE, max_registros=500):
+        """
+        :param caminho: Arquivo de snapshot do estado.
+        :param max_registros: Quantidade de registros no journal antes de compactar.
+        """
+        self.caminho = caminho
+        self.caminho_journal = caminho + '.journal'
+        self.max_registros = max_registros
+        self._registros = 0
+
+    def _ler_snapshot(self):
+        if not os.path.exists(self.caminho):
+            return {}
+        try:
+            with open(self.caminho, 'r', encoding='utf-8') as f:
+                dados = json.load(f)
+        except (OSError, ValueError) as e:
+            # Se houver qualquer problema para carregar, começa com estado vazio
+            logger.warning("Não foi possível ler '%s': %s", self.caminho, e)
+            return {}
+        if dados.get('versao') == VERSAO_ESTADO:
+            return dados.get('rotacoes', {})
+        # Formato antigo: {chave: [itens restantes]}. Os selecionadores
+        # convertem esses itens para ids na primeira vez que abrem a chave.
+        return {chave: {'legado': itens} for chave, itens in dados.items()
+                if isinstance(itens, list)}
+
+    def _aplicar_journal(self, rotacoes):
+        if not os.path.exists(self.caminho_journal):
+            return
+        with open(self.caminho_journal, 'r', encoding='utf-8') as f:
+            for linha in f:
+                try:
+                    registro = json.loads(linha)
+                except ValueError:
+                    # Última linha incompleta (processo interrompido no meio da escrita)
+                    break
+                entrada = rotacoes.setdefault(registro['k'], {'perm': [], 'cursor': 0})
+                entrada.pop('legado', None)
+                if 'p' in registro:
+                    entrada['perm'] = registro['p']
+                entrada['cursor'] = registro['c']
+                self._registros += 1
+
+    def carregar(self):
+        rotacoes = self._ler_snapshot()
+        self._aplicar_journal(rotacoes)
+        return rotacoes
+
+    def _anexar(self, registro, rotacoes):
+        with open(self.caminho_journal, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(registro, ensure_ascii=False, separators=(',', ':')) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+        self._registros += 1
+        if self._registros >= self.max_registros:
+            self.compactar(rotacoes)
+
+    def gravar_permutacao(self, chave, perm, cursor, rotacoes):
+        self._anexar({'k': chave, 'p': perm, 'c': cursor}, rotacoes)
+
+    def gravar_cursor(self, chave, cursor, rotacoes):
+        self._anexar({'k': chave, 'c': cursor}, rotacoes)
+
+    def compactar(self, rotacoes):
+        """Grava o snapshot completo e zera o journal."""
+        _gravar_atomico(self.caminho, {'versao': VERSAO_ESTADO, 'rotacoes': rotacoes})
+        if os.path.exists(self.caminho_journal):
+            os.remove(self.caminho_journal)
+        self._registros = 0
+
+    def fechar(self, rotacoes):
+        self.compactar(rotacoes)
+
+
+# -----------------------------------------------------------------------------
+# Backend SQLite: cada avanço do cursor é um UPDATE de uma linha
+# -----------------------------------------------------------------------------
+class ArmazemSQLite:
+    def __init__(self, caminho=STATE_DB, importar_de=STATE_FILE):
+        """
+        :param caminho: Arquivo do banco SQLite.
+        :param importar_de: state.json usado para importar o estado na primeira execução.
+        """
+        self.caminho = caminho
+        self.importar_de = importar_de
+        self.conn = sqlite3.connect(caminho)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.execute(
+            'CREATE TABLE IF NOT EXISTS rotacao ('
+            ' chave TEXT PRIMARY KEY,'
+            ' perm TEXT NOT NULL,'
+            ' cursor INTEGER NOT NULL)'
+        )
+        self.conn.commit()
+
+    def carregar(self):
+        linhas = self.conn.execute('SELECT chave, perm, cursor FROM rotacao').fetchall()
+        if not linhas and self.importar_de and os.path.exists(self.importar_de):
+            # Banco novo: aproveita o ciclo que estava no state.json e já o grava
+            # no banco (o formato antigo só entra depois de convertido para ids)
+            rotacoes = ArmazemJSON(self.importar_de).carregar()
+            with self.conn:
+                self.conn.executemany(
+                    'INSERT OR IGNORE INTO rotacao (chave, perm, cursor) VALUES (?, ?, ?)',
+                    [(chave, json.dumps(entrada['perm'], ensure_ascii=False), entrada['cursor'])
+                     for chave, entrada in rotacoes.items() if 'perm' in entrada]
+                )
+            return rotacoes
+        return {chave: {'perm': json.loads(perm), 'cursor': cursor}
+                for chave, perm, cursor in linhas}
+
+    def gravar_permutacao(self, chave, perm, cursor, rotacoes):
+        with self.conn:
+            self.conn.execute(
+                'INSERT INTO rotacao (chave, perm, cursor) VALUES (?, ?, ?) '
+                'ON CONFLICT(chave) DO UPDATE SET perm = excluded.perm, cursor = excluded.cursor',
+                (chave, json.dumps(perm, ensure_ascii=False), cursor)
+            )
+
+    def gravar_cursor(self, chave, cursor, rotacoes):
+        with self.conn:
+            # Upsert: se a linha ainda não existir, grava a rotação inteira em vez de perder o avanço
+            self.conn.execute(
+                'INSERT INTO rotacao (chave, perm, cursor) VALUES (?, ?, ?) '
+                'ON CONFLICT(chave) DO UPDATE SET cursor = excluded.cursor',
+                (chave, json.dumps(rotacoes[chave].get('perm', []), ensure_ascii=False), cursor)
+            )
+
+    def fechar(self, rotacoes):
+        self.conn.close()
+
+
+# -----------------------------------------------------------------------------
+# Estado único compartilhado por todos os selecionadores: para cada chave
+# ('posts', 'midias_usuario', ...) guarda a permutação de ids e o cursor.
+# -----------------------------------------------------------------------------
+class EstadoRotacao:
+    def __init__(self, armazem):
+        self.armazem = armazem
+        self.rotacoes = armazem.carregar()
+
+    def obter(self, chave):
+        """Devolve {'perm': [...], 'cursor': n} (ou {'legado': [...]}) ou None."""
+        return self.rotacoes.get(chave)
+
+    def definir_permutacao(self, chave, perm, cursor=0):
+        self.rotacoes[chave] = {'perm': perm, 'cursor': cursor}
+        with METRICAS.cronometrar('save_state', operacao='permutacao'):
+            self.armazem.gravar_permutacao(chave, perm, cursor, self.rotacoes)
+
+    def avancar(self, chave, cursor):
+        self.rotacoes[chave]['cursor'] = cursor
+        with METRICAS.cronometrar('save_state', operacao='cursor'):
+            self.armazem.gravar_cursor(chave, cursor, self.rotacoes)
+
+    def fechar(self):
+        with METRICAS.cronometrar('save_state', operacao='fechar'):
+            self.armazem.fechar(self.rotacoes)
+
+
+def abrir_estado(config, pasta=''):
+    """
+    Abre o estado com o backend escolhido em 'state_backend' ('json' ou 'sqlite'),
+    na 'pasta' do bot (padrão: o diretório atual).
+    """
+    backend = config.get('state_backend', 'json')
+    if backend == 'sqlite':
+        return EstadoRotacao(ArmazemSQLite(os.path.join(pasta, STATE_DB), os.path.join(pasta, STATE_FILE)))
+    return EstadoRotacao(ArmazemJSON(os.path.join(pasta, STATE_FILE)))
@@ -0,0 +1,443 @@
+# fila.py
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import time
+from collections import namedtuple
+from datetime import datetime
+
+from metricas import METRICAS
+
+logger = logging.getLogger(__name__)
+
+# -----------------------------------------------------------------------------
+# Fila persistente de envios. Cada post planejado é gravado com o horário exato
+# em que deve sair, antes de qualquer espera, para sobreviver a reinícios.
+#
+# Estados de um envio:
+#   pendente  -> aguardando o horário (ou a próxima tentativa)
+#   enviando  -> entregue ao pool de contas
+#   enviado   -> confirmado pelo Telegram
+#   falhou    -> esgotou as tentativas
+#   incerto   -> o processo caiu durante o envio, ou a mídia saiu e o resto do
+#                texto não; não é reenviado para não duplicar
+#   expirado  -> ficou atrasado demais (bot desligado por muito tempo)
+#   apagado   -> enviado e depois apagado do canal (historico.py)
+#   cancelado -> o alvo ou o post foi removido antes do envio; nada foi enviado
+#
+# Envios cancelados ficam fora do histórico, das estatísticas e do engajamento
+# (a não ser que o filtro peça esse status).
+#
+# Os envios feitos ficam na tabela como histórico: ids de todas as mensagens
+# do post, conta que enviou, chat e duração do envio (ver historico.py).
+# -----------------------------------------------------------------------------
+FILA_DB = 'fila.sqlite3'
+
+# Colunas acrescentadas depois da primeira versão (criadas ao abrir filas antigas)
+COLUNAS_NOVAS = (
+    ('album', 'TEXT'),
+    ('mensagem_id', 'INTEGER'),
+    ('visualizacoes', 'INTEGER'),
+    ('reacoes', 'INTEGER'),
+    ('mensagens', 'TEXT'),
+    ('conta', 'TEXT'),
+    ('chat_id', 'INTEGER'),
+    ('duracao_envio', 'REAL'),
+    ('editado_em', 'REAL'),
+)
+
+# Índices das consultas do histórico (por alvo, por post e por período)
+INDICES = (
+    ('envios_pendentes', 'status, executar_em'),
+    ('envios_alvo', 'alvo, enviado_em'),
+    ('envios_post', 'post_id, enviado_em'),
+    ('envios_enviado_em', 'enviado_em'),
+)
+
+# Resultado de um post enviado: todas as mensagens (mídia ou álbum, texto e
+# continuações), a conta que enviou e o chat (target_id) em que foram parar
+Entrega = namedtuple('Entrega', 'mensagens conta chat_id')
+
+
+class EnvioIncompleto(Exception):
+    """
+    A primeira parte do post (mídia, álbum ou texto) saiu, mas a continuação
+    do texto falhou. 'entrega' tem as mensagens que chegaram ao canal: o envio
+    não é repetido (a mídia sairia de novo) e fica como 'incerto'.
+    """
+    def __init__(self, entrega, causa):
+        super().__init__(f"{len(entrega.mensagens)} mensagem(ns) enviada(s), a continuação falhou: {causa}")
+        self.entrega = entrega
+
+
+class FilaEnvios:
+    def __init__(self, caminho=FILA_DB, max_tentativas=5, backoff_inicial=60,
+                 backoff_maximo=3600, expira_em_horas=24):
+        """
+        :param caminho: Arquivo do banco SQLite da fila.
+        :param max_tentativas: Tentativas de envio antes de marcar como 'falhou'.
+        :param backoff_inicial: Espera (segundos) antes da segunda tentativa; dobra a cada falha.
+        :param backoff_maximo: Espera máxima (segundos) entre tentativas.
+        :param expira_em_horas: Envios atrasados mais do que isso não são mais feitos.
+        """
+        self.caminho = caminho
+        self.max_tentativas = max_tentativas
+        self.backoff_inicial = backoff_inicial
+        self.backoff_maximo = backoff_maximo
+        self.expira_em_horas = expira_em_horas
+        self.conn = sqlite3.connect(caminho)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute(
+            'CREATE TABLE IF NOT EXISTS envios ('
+            ' id INTEGER PRIMARY KEY AUTOINCREMENT,'
+            ' chave TEXT NOT NULL UNIQUE,'
+            ' alvo TEXT NOT NULL,'
+            ' post_id TEXT NOT NULL,'
+            ' midia TEXT,'
+            ' album TEXT,'
+            ' executar_em REAL NOT NULL,'
+            ' status TEXT NOT NULL DEFAULT \'pendente\','
+            ' tentativas INTEGER NOT NULL DEFAULT 0,'
+            ' ultimo_erro TEXT,'
+            ' criado_em REAL NOT NULL,'
+            ' enviado_em REAL,'
+            ' mensagem_id INTEGER,'
+            ' visualizacoes INTEGER,'
+            ' reacoes INTEGER,'
+            ' mensagens TEXT,'
+            ' conta TEXT,'
+            ' chat_id INTEGER,'
+            ' duracao_envio REAL,'
+            ' editado_em REAL)'
+        )
+        colunas = {linha['name'] for linha in self.conn.execute('PRAGMA table_info(envios)')}
+        for coluna, tipo in COLUNAS_NOVAS:
+            if coluna not in colunas:
+                self.conn.execute(f'ALTER TABLE envios ADD COLUMN {coluna} {tipo}')
+        for nome, colunas_indice in INDICES:
+            self.conn.execute(f'CREATE INDEX IF NOT EXISTS {nome} ON envios ({colunas_indice})')
+        self.conn.commit()
+        self._em_andamento = set()
+        self._novo = None
+
+    def existe(self, chave):
+        return self.conn.execute('SELECT 1 FROM envios WHERE chave = ?', (chave,)).fetchone() is not None
+
+    def agendar(self, chave, alvo, post_id, midia, executar_em):
+        """
+        Grava um envio planejado. A chave identifica o envio (ex.: alvo + dia + horário)
+        e impede que o mesmo envio seja gravado duas vezes. Devolve False se já existia.
+        'midia' é o caminho da mídia ou, num álbum, a lista de caminhos.
+        """
+        album = None
+        if isinstance(midia, list):
+            album = json.dumps(midia, ensure_ascii=False)
+            midia = midia[0] if midia else None
+        try:
+            with self.conn:
+                self.conn.execute(
+                    'INSERT INTO envios (chave, alvo, post_id, midia, album, executar_em, criado_em) '
+                    'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                    (chave, alvo, post_id, midia, album, executar_em, time.time())
+                )
+        except sqlite3.IntegrityError:
+            return False
+        if self._novo is not None:
+            self._novo.set()
+        return True
+
+    def registrar_envio(self, chave, alvo, post_id, midia, executar_em, entrega=None, erro=None,
+                        duracao=None):
+        """
+        Grava um envio feito fora do trabalhador da fila (modo rajada) já como
+        'enviado' (ou 'falhou', com o erro), para o engajamento e o histórico.
+        Sem erro e sem entrega, o envio não aconteceu e fica 'cancelado'.
+        """
+        album = None
+        if isinstance(midia, list):
+            album = json.dumps(midia, ensure_ascii=False)
+            midia = midia[0] if midia else None
+        agora = time.time()
+        status = 'falhou' if erro else 'cancelado' if entrega is None else 'enviado'
+        campos = dict(chave=chave, alvo=alvo, post_id=post_id, midia=midia, album=album,
+                      executar_em=executar_em, status=status, tentativas=1,
+                      ultimo_erro=erro, criado_em=agora, enviado_em=agora if status == 'enviado' else None,
+                      duracao_envio=duracao, **colunas_da_entrega(entrega))
+        with self.conn:
+            self.conn.execute(
+                f'INSERT OR IGNORE INTO envios ({", ".join(campos)}) VALUES ({", ".join("?" * len(campos))})',
+                tuple(campos.values())
+            )
+
+    def recuperar(self):
+        """
+        Chamado na inicialização: envios que estavam 'enviando' quando o processo caiu
+        viram 'incerto' (não são repetidos) e os muito atrasados viram 'expirado'.
+        Os demais pendentes, inclusive os atrasados, continuam na fila.
+        """
+        limite = time.time() - self.expira_em_horas * 3600
+        with self.conn:
+            incertos = self.conn.execute(
+                "UPDATE envios SET status = 'incerto' WHERE status = 'enviando'"
+            ).rowcount
+            expirados = self.conn.execute(
+                "UPDATE envios SET status = 'expirado' WHERE status = 'pendente' AND executar_em < ?",
+                (limite,)
+            ).rowcount
+        pendentes = self.conn.execute(
+            "SELECT COUNT(*) FROM envios WHERE status = 'pendente'"
+        ).fetchone()[0]
+        if incertos:
+            logger.warning("%d envio(s) interrompido(s) no meio ficaram como 'incerto' e não serão repetidos.",
+                           incertos)
+        if expirados:
+            logger.warning("%d envio(s) atrasado(s) mais de %dh foram descartados.", expirados, self.expira_em_horas)
+        if pendentes:
+            logger.info("Fila recuperada: %d envio(s) pendente(s).", pendentes)
+
+    def _vencidos(self, agora):
+        linhas = self.conn.execute(
+            "SELECT * FROM envios WHERE status = 'pendente' AND executar_em <= ? ORDER BY executar_em",
+            (agora,)
+        ).fetchall()
+        return [linha for linha in linhas if linha['id'] not in self._em_andamento]
+
+    def _proximo_horario(self):
+        linha = self.conn.execute(
+            "SELECT MIN(executar_em) FROM envios WHERE status = 'pendente'"
+        ).fetchone()
+        return linha[0]
+
+    def _marcar(self, envio_id, **campos):
+        colunas = ', '.join(f'{nome} = ?' for nome in campos)
+        with self.conn:
+            self.conn.execute(f'UPDATE envios SET {colunas} WHERE id = ?', (*campos.values(), envio_id))
+
+    def registrar_mensagens(self, envio_id, entrega):
+        """
+        Grava as mensagens já enviadas de um envio ainda em andamento (antes da
+        continuação do texto): se ele não terminar, o histórico sabe o que apagar.
+        """
+        self._marcar(envio_id, **colunas_da_entrega(entrega))
+
+    async def trabalhar(self, executar):
+        """
+        Drena a fila para sempre: espera o horário de cada envio e chama
+        `executar(envio)` (uma linha da tabela). Falhas são repetidas com
+        backoff exponencial até 'max_tentativas'.
+        """
+        self._novo = asyncio.Event()
+        while True:
+            self._novo.clear()
+            for envio in self._vencidos(time.time()):
+                self._em_andamento.add(envio['id'])
+                # Marcado antes de enviar: se o processo cair agora, não haverá envio duplicado
+                self._marcar(envio['id'], status='enviando')
+                asyncio.create_task(self._processar(envio, executar))
+            proximo = self._proximo_horario()
+            espera = None if proximo is None else max(0.0, proximo - time.time())
+            try:
+                await asyncio.wait_for(self._novo.wait(), timeout=espera)
+            except asyncio.TimeoutError:
+                pass
+
+    async def concluir_em_andamento(self, limite, intervalo=0.05):
+        """
+        Espera até 'limite' segundos os envios já iniciados terminarem (usado no
+        encerramento). Devolve quantos ainda estavam em andamento no fim da espera.
+        """
+        prazo = time.monotonic() + limite
+        while self._em_andamento and time.monotonic() < prazo:
+            await asyncio.sleep(intervalo)
+        return len(self._em_andamento)
+
+    async def aguardar_envios(self, intervalo=0.05):
+        """Espera até não haver nada pendente nem em andamento na fila."""
+        while self._em_andamento or self._proximo_horario() is not None:
+            await asyncio.sleep(intervalo)
+
+    async def _processar(self, envio, executar):
+        inicio = time.perf_counter()
+        try:
+            entrega = await executar(envio)
+        except EnvioIncompleto as e:
+            logger.error("[%s] Envio '%s' ficou pela metade (%s). Não será repetido; veja no histórico.",
+                         envio['alvo'], envio['chave'], e)
+            METRICAS.incrementar('envios_falhas_total', alvo=envio['alvo'])
+            self._marcar(envio['id'], status='incerto', tentativas=envio['tentativas'] + 1, ultimo_erro=str(e),
+                         duracao_envio=time.perf_counter() - inicio, **colunas_da_entrega(e.entrega))
+        except Exception as e:
+            tentativas = envio['tentativas'] + 1
+            METRICAS.incrementar('envios_falhas_total', alvo=envio['alvo'])
+            if tentativas >= self.max_tentativas:
+                logger.error("[%s] Envio '%s' falhou %d vez(es): %s. Desistindo.",
+                             envio['alvo'], envio['chave'], tentativas, e)
+                METRICAS.incrementar('envios_desistidos_total', alvo=envio['alvo'])
+                self._marcar(envio['id'], status='falhou', tentativas=tentativas, ultimo_erro=str(e))
+            else:
+                espera = min(self.backoff_inicial * 2 ** (tentativas - 1), self.backoff_maximo)
+                nova_hora = time.time() + espera
+                logger.warning("[%s] Envio '%s' falhou (%s). Nova tentativa às %s.",
+                               envio['alvo'], envio['chave'], e, datetime.fromtimestamp(nova_hora).strftime('%H:%M:%S'))
+                self._marcar(envio['id'], status='pendente', tentativas=tentativas,
+                             ultimo_erro=str(e), executar_em=nova_hora)
+        else:
+            if entrega is None:
+                # O alvo ou o post foi removido: nada foi enviado
+                self._marcar(envio['id'], status='cancelado')
+                return
+            agora = time.time()
+            self._marcar(envio['id'], status='enviado', enviado_em=agora,
+                         duracao_envio=time.perf_counter() - inicio, **colunas_da_entrega(entrega))
+            METRICAS.incrementar('envios_total', alvo=envio['alvo'])
+            METRICAS.observar('atraso_envio', max(0.0, agora - envio['executar_em']))
+        finally:
+            self._em_andamento.discard(envio['id'])
+            self._novo.set()
+
+    # -------------------------------------------------------------------------
+    # Engajamento (visualizações e reações) dos posts já enviados
+    # -------------------------------------------------------------------------
+    def enviados_desde(self, alvo, desde):
+        """Envios do alvo feitos depois de 'desde' (timestamp) cuja mensagem é conhecida."""
+        return self.conn.execute(
+            "SELECT id, mensagem_id FROM envios WHERE alvo = ? AND status = 'enviado' "
+            "AND mensagem_id IS NOT NULL AND enviado_em >= ? ORDER BY enviado_em",
+            (alvo, desde)
+        ).fetchall()
+
+    def registrar_engajamento(self, contagens):
+        """Grava [(envio_id, visualizacoes, reacoes), ...] numa única transação."""
+        with self.conn:
+            self.conn.executemany(
+                'UPDATE envios SET visualizacoes = ?, reacoes = ? WHERE id = ?',
+                [(visualizacoes, reacoes, envio_id) for envio_id, visualizacoes, reacoes in contagens]
+            )
+
+    def engajamento(self, alvo, peso_reacao):
+        """
+        Engajamento médio (visualizações + peso_reacao * reações) por post e por
+        mídia do alvo. Devolve ({post_id: pontos}, {caminho_midia: pontos}).
+        """
+        resultado = []
+        for coluna in ('post_id', 'midia'):
+            linhas = self.conn.execute(
+                f"SELECT {coluna}, AVG(visualizacoes + ? * COALESCE(reacoes, 0)) FROM envios "
+                f"WHERE alvo = ? AND status != 'cancelado' AND visualizacoes IS NOT NULL "
+                f"AND {coluna} IS NOT NULL GROUP BY {coluna}",
+                (peso_reacao, alvo)
+            )
+            resultado.append({item: pontos for item, pontos in linhas})
+        return tuple(resultado)
+
+    # -------------------------------------------------------------------------
+    # Histórico dos envios (consultas, estatísticas e posts apagados/editados)
+    # -------------------------------------------------------------------------
+    @staticmethod
+    def _filtro(alvo=None, post_id=None, desde=None, ate=None, status=None, chave=None):
+        """
+        Cláusula WHERE (e parâmetros) dos filtros do histórico. 'desde' e 'ate'
+        são timestamps do envio; 'post_id' e 'chave' são prefixos (ex.: o começo
+        do id do post, ou 'canal:rajada:' para os envios das rajadas).
+        Sem filtro de status, os envios cancelados ficam de fora.
+        """
+        condicoes, parametros = [], []
+        if status is None:
+            condicoes.append("status != 'cancelado'")
+        for coluna, valor in (('alvo', alvo), ('status', status)):
+            if valor is not None:
+                condicoes.append(f'{coluna} = ?')
+                parametros.append(valor)
+        if desde is not None:
+            condicoes.append('enviado_em >= ?')
+            parametros.append(desde)
+        if ate is not None:
+            condicoes.append('enviado_em < ?')
+            parametros.append(ate)
+        for coluna, prefixo in (('post_id', post_id), ('chave', chave)):
+            if prefixo is not None:
+                # Intervalo [prefixo, prefixo + maior caractere): usa o índice da coluna
+                condicoes.append(f'{coluna} >= ? AND {coluna} < ?')
+                parametros.extend((prefixo, prefixo + '\U0010ffff'))
+        return (' WHERE ' + ' AND '.join(condicoes)) if condicoes else '', parametros
+
+    def historico(self, limite=None, **filtros):
+        """Envios que passam nos filtros, do mais recente ao mais antigo."""
+        where, parametros = self._filtro(**filtros)
+        sql = f'SELECT * FROM envios{where} ORDER BY COALESCE(enviado_em, executar_em) DESC'
+        if limite:
+            sql += ' LIMIT ?'
+            parametros.append(limite)
+        return self.conn.execute(sql, parametros).fetchall()
+
+    def estatisticas(self, **filtros):
+        """
+        Uma linha por alvo e post: envios feitos, falhas, apagados, médias de
+        visualizações, reações e duração do envio, e o último envio.
+        """
+        where, parametros = self._filtro(**filtros)
+        return self.conn.execute(
+            "SELECT alvo, post_id,"
+            " SUM(status = 'enviado') AS enviados,"
+            " SUM(status = 'falhou') AS falhas,"
+            " SUM(status = 'apagado') AS apagados,"
+            " AVG(visualizacoes) AS visualizacoes,"
+            " AVG(reacoes) AS reacoes,"
+            " AVG(duracao_envio) AS duracao_envio,"
+            " MAX(enviado_em) AS ultimo_envio"
+            f" FROM envios{where} GROUP BY alvo, post_id ORDER BY enviados DESC, ultimo_envio DESC",
+            parametros
+        ).fetchall()
+
+    def marcar_apagados(self, envio_ids):
+        with self.conn:
+            self.conn.executemany("UPDATE envios SET status = 'apagado' WHERE id = ?",
+                                  [(envio_id,) for envio_id in envio_ids])
+
+    def marcar_editados(self, envio_ids):
+        agora = time.time()
+        with self.conn:
+            self.conn.executemany('UPDATE envios SET editado_em = ? WHERE id = ?',
+                                  [(agora, envio_id) for envio_id in envio_ids])
+
+    def fechar(self):
+        self.conn.close()
+
+
+def colunas_da_entrega(entrega):
+    """
+    Colunas gravadas de um post enviado. 'mensagem_id' é a primeira mensagem
+    (a da mídia ou da legenda), usada no engajamento; 'mensagens' tem todas.
+    """
+    if entrega is None:
+        return {'mensagem_id': None}
+    ids = [mensagem.id for mensagem in entrega.mensagens]
+    return {
+        'mensagem_id': ids[0] if ids else None,
+        'mensagens': json.dumps(ids),
+        'conta': entrega.conta,
+        'chat_id': entrega.chat_id,
+    }
+
+
+def midia_do_envio(envio):
+    """Caminho da mídia do envio, ou a lista de caminhos se for um álbum."""
+    if envio['album'] is not None:
+        return json.loads(envio['album'])
+    return envio['midia']
+
+
+def abrir_fila(config, pasta=''):
+    """
+    Abre a fila de envios da 'pasta' do bot com os limites de 'queue_max_attempts',
+    'queue_retry_seconds' e 'queue_expire_hours'.
+    """
+    return FilaEnvios(
+        os.path.join(pasta, FILA_DB),
+        max_tentativas=config.get('queue_max_attempts', 5),
+        backoff_inicial=config.get('queue_retry_seconds', 60),
+        expira_em_horas=config.get('queue_expire_hours', 24),
+    )
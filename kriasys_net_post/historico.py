@@ -0,0 +1,280 @@
+# historico.py
+import argparse
+import asyncio
+import json
+import logging
+import os
+from datetime import datetime, timedelta
+
+from fila import FILA_DB, FilaEnvios
+
+logger = logging.getLogger(__name__)
+
+# -----------------------------------------------------------------------------
+# Histórico dos posts enviados, guardado na própria fila (fila.sqlite3): ids de
+# todas as mensagens de cada post, conta, chat, duração do envio e engajamento.
+# Pela linha de comando dá para consultar, ver estatísticas por post e apagar
+# ou editar de uma vez os posts de uma "campanha" (um alvo, um período, um
+# post ou um prefixo de chave, como os envios de uma rajada).
+#
+# Apagar junta as mensagens de vários posts em cada requisição (até 100 ids
+# por delete_messages, o limite do Telegram). O Telegram não tem edição em
+# lote: as edições são uma requisição por post, em paralelo até o limite de
+# envios simultâneos de cada conta e no ritmo do token bucket dela.
+# -----------------------------------------------------------------------------
+# Mensagens por requisição de delete_messages
+LOTE_APAGAR = 100
+
+FORMATOS_DATA = ('%Y-%m-%d %H:%M', '%Y-%m-%d')
+
+
+def _timestamp(texto, fim=False):
+    """'AAAA-MM-DD' ou 'AAAA-MM-DD HH:MM'. Com 'fim', uma data sem hora inclui o dia todo."""
+    for formato in FORMATOS_DATA:
+        try:
+            data = datetime.strptime(texto, formato)
+        except ValueError:
+            continue
+        if fim and formato == '%Y-%m-%d':
+            data += timedelta(days=1)
+        return data.timestamp()
+    raise argparse.ArgumentTypeError(f"Data inválida: '{texto}' (use AAAA-MM-DD ou 'AAAA-MM-DD HH:MM').")
+
+
+def _hora(timestamp):
+    return datetime.fromtimestamp(timestamp).strftime('%Y-%m-%d %H:%M') if timestamp else '-'
+
+
+def ids_das_mensagens(envio):
+    """Ids de todas as mensagens do post (envios antigos só têm a primeira)."""
+    if envio['mensagens']:
+        return json.loads(envio['mensagens'])
+    return [envio['mensagem_id']] if envio['mensagem_id'] is not None else []
+
+
+# -----------------------------------------------------------------------------
+# Operações em lote no Telegram
+# -----------------------------------------------------------------------------
+def _destinos(envios, pool, config):
+    """
+    Agrupa os envios por (conta, chat). Cada post é apagado ou editado pela
+    conta que o enviou; envios antigos (ou de contas que saíram do config) usam
+    a primeira conta e o target_id atual do alvo.
+    """
+    contas = {conta.session: conta for conta in pool.contas}
+    target_ids = {alvo['nome']: alvo['target_id'] for alvo in config['targets']}
+    grupos = {}
+    for envio in envios:
+        conta = contas.get(envio['conta'], pool.contas[0])
+        chat_id = envio['chat_id'] if envio['chat_id'] is not None else target_ids.get(envio['alvo'])
+        if chat_id is None:
+            logger.warning("Envio '%s': o alvo '%s' não está no config e o chat não foi gravado. Ignorado.",
+                           envio['chave'], envio['alvo'])
+            continue
+        grupos.setdefault((conta, chat_id), []).append(envio)
+    return grupos
+
+
+async def _com_floodwait(gerenciador, operacao):
+    """Requisição no ritmo da conta; num FloodWait espera e repete na mesma conta."""
+    from telethon.errors import FloodWaitError
+
+    while True:
+        try:
+            return await gerenciador.enviar(operacao)
+        except FloodWaitError as e:
+            gerenciador.estacionar(e.seconds)
+            await gerenciador.aguardar_liberacao()
+
+
+async def apagar(fila, envios, pool, config, lote=LOTE_APAGAR):
+    """
+    Apaga as mensagens dos envios com o mínimo de requisições. Os posts de cada
+    requisição são marcados como 'apagado' assim que ela termina. Devolve
+    (posts apagados, requisições feitas).
+    """
+    apagados = requisicoes = 0
+    for (gerenciador, chat_id), itens in _destinos(envios, pool, config).items():
+        entity = await gerenciador.obter_entidade(chat_id)
+        # Um post nunca fica dividido entre duas requisições (um álbum tem no máximo 10 mídias)
+        lotes, atual, ids = [], [], []
+        for envio in itens:
+            mensagens = ids_das_mensagens(envio)
+            if ids and len(ids) + len(mensagens) > lote:
+                lotes.append((atual, ids))
+                atual, ids = [], []
+            atual.append(envio['id'])
+            ids.extend(mensagens)
+        if atual:
+            lotes.append((atual, ids))
+        for envio_ids, mensagens in lotes:
+            if mensagens:
+                await _com_floodwait(gerenciador, lambda client: client.delete_messages(entity, mensagens))
+                requisicoes += 1
+            fila.marcar_apagados(envio_ids)
+            apagados += len(envio_ids)
+            logger.info("%d post(s) apagado(s) (%d mensagens) em %s pela conta '%s'.",
+                        len(envio_ids), len(mensagens), chat_id, gerenciador.session)
+    return apagados, requisicoes
+
+
+async def editar(fila, envios, pool, config, texto):
+    """
+    Troca o texto (ou a legenda) da primeira mensagem de cada post por 'texto'
+    (markdown). Devolve (posts editados, falhas).
+    """
+    from legenda import LIMITE_LEGENDA, LIMITE_MENSAGEM, analisar, comprimento
+    from upload_paralelo import formatacao
+
+    parte = analisar(texto)
+    tamanho = comprimento(texto)
+    limites = {alvo['nome']: alvo['caption_limit'] for alvo in config['targets']}
+    # Posts com mídia têm legenda; os de texto aceitam até 4096
+    for envio in envios:
+        limite = limites.get(envio['alvo'], LIMITE_LEGENDA) if envio['midia'] else LIMITE_MENSAGEM
+        if tamanho > limite:
+            raise ValueError(f"O texto novo tem {tamanho} caracteres e a legenda "
+                             f"de '{envio['alvo']}' aceita {limite}.")
+
+    editados, falhas = [], 0
+
+    async def editar_grupo(gerenciador, chat_id, itens):
+        nonlocal falhas
+        entity = await gerenciador.obter_entidade(chat_id)
+
+        async def editar_um(envio):
+            nonlocal falhas
+            async with gerenciador.vagas():
+                try:
+                    await _com_floodwait(gerenciador, lambda client: client.edit_message(
+                        entity, envio['mensagem_id'], parte.texto, **formatacao(parte.entidades)
+                    ))
+                except Exception as e:
+                    falhas += 1
+                    logger.error("Não foi possível editar o envio '%s': %s", envio['chave'], e)
+                else:
+                    editados.append(envio['id'])
+
+        await asyncio.gather(*(editar_um(envio) for envio in itens if envio['mensagem_id'] is not None))
+
+    await asyncio.gather(*(editar_grupo(gerenciador, chat_id, itens)
+                           for (gerenciador, chat_id), itens in _destinos(envios, pool, config).items()))
+    fila.marcar_editados(editados)
+    return len(editados), falhas
+
+
+async def _no_telegram(config, operacao):
+    from contas import PoolContas
+
+    pool = PoolContas.do_config(config)
+    await pool.iniciar()
+    try:
+        return await operacao(pool)
+    finally:
+        await pool.encerrar()
+
+
+# -----------------------------------------------------------------------------
+# Linha de comando
+# -----------------------------------------------------------------------------
+def imprimir_historico(envios):
+    for envio in envios:
+        duracao = f"{envio['duracao_envio'] * 1000:.0f} ms" if envio['duracao_envio'] is not None else '-'
+        midia = os.path.basename(envio['midia']) if envio['midia'] else '(texto)'
+        print(f"{_hora(envio['enviado_em'] or envio['executar_em'])}  {envio['alvo']:<12} {envio['status']:<9} "
+              f"post {envio['post_id'][:12]}  {len(ids_das_mensagens(envio))} msg  {midia:<24} "
+              f"conta {envio['conta'] or '-'}  {duracao}  "
+              f"{envio['visualizacoes'] if envio['visualizacoes'] is not None else '-'} visualizações  "
+              f"{envio['reacoes'] if envio['reacoes'] is not None else '-'} reações")
+
+
+def imprimir_estatisticas(linhas):
+    print(f"{'alvo':<12} {'post':<12} {'enviados':>8} {'falhas':>6} {'apagados':>8} "
+          f"{'visualiz.':>9} {'reações':>7} {'envio':>8}  último envio")
+    for linha in linhas:
+        visualizacoes = f"{linha['visualizacoes']:.0f}" if linha['visualizacoes'] is not None else '-'
+        reacoes = f"{linha['reacoes']:.1f}" if linha['reacoes'] is not None else '-'
+        duracao = f"{linha['duracao_envio'] * 1000:.0f} ms" if linha['duracao_envio'] is not None else '-'
+        print(f"{linha['alvo']:<12} {linha['post_id'][:12]:<12} {linha['enviados']:>8} {linha['falhas']:>6} "
+              f"{linha['apagados']:>8} {visualizacoes:>9} {reacoes:>7} {duracao:>8}  {_hora(linha['ultimo_envio'])}")
+
+
+def main():
+    filtros = argparse.ArgumentParser(add_help=False)
+    filtros.add_argument('--alvo', help="Nome do alvo (\"nome\" em targets).")
+    filtros.add_argument('--post', help="Id do post (ou o começo dele, como aparece no 'listar').")
+    filtros.add_argument('--desde', help="Enviados a partir de AAAA-MM-DD ou 'AAAA-MM-DD HH:MM'.")
+    filtros.add_argument('--ate', help="Enviados até AAAA-MM-DD (o dia todo) ou 'AAAA-MM-DD HH:MM'.")
+    filtros.add_argument('--chave', help="Prefixo da chave do envio (ex.: 'canal:rajada:' ou 'canal:2026-10-').")
+    filtros.add_argument('--status', help="enviado, falhou, apagado, cancelado, pendente, ...")
+
+    parser = argparse.ArgumentParser(description="Consulta, estatísticas e edição dos posts já enviados.")
+    parser.add_argument('--config', default='config.json', help="Arquivo de configuração (para apagar e editar).")
+    parser.add_argument('--fila', default=FILA_DB, help=f"Banco da fila (padrão: {FILA_DB}).")
+    comandos = parser.add_subparsers(dest='comando', required=True)
+    listar = comandos.add_parser('listar', parents=[filtros], help="Lista os envios.")
+    listar.add_argument('--limite', type=int, default=50, help="Quantidade máxima (0 = todos).")
+    listar.add_argument('--json', action='store_true', help="Um envio por linha em JSON.")
+    comandos.add_parser('stats', parents=[filtros], help="Estatísticas por post.")
+    apagar_cmd = comandos.add_parser('apagar', parents=[filtros], help="Apaga do canal os posts enviados.")
+    apagar_cmd.add_argument('--confirmar', action='store_true', help="Sem isto, só mostra o que seria apagado.")
+    editar_cmd = comandos.add_parser('editar', parents=[filtros], help="Troca o texto dos posts enviados.")
+    editar_cmd.add_argument('--texto', required=True, help="Texto novo (markdown), igual para todos os posts.")
+    editar_cmd.add_argument('--confirmar', action='store_true', help="Sem isto, só mostra o que seria editado.")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(name)s: %(message)s')
+
+    try:
+        desde = _timestamp(args.desde) if args.desde else None
+        ate = _timestamp(args.ate, fim=True) if args.ate else None
+    except argparse.ArgumentTypeError as e:
+        parser.error(str(e))
+    status = args.status
+    if status is None and args.comando in ('apagar', 'editar'):
+        # Só o que ainda está no canal
+        status = 'enviado'
+    filtro = dict(alvo=args.alvo, post_id=args.post, desde=desde, ate=ate, status=status, chave=args.chave)
+
+    fila = FilaEnvios(args.fila)
+    try:
+        if args.comando == 'stats':
+            imprimir_estatisticas(fila.estatisticas(**filtro))
+            return
+        if args.comando == 'listar':
+            envios = fila.historico(args.limite, **filtro)
+            if args.json:
+                for envio in envios:
+                    print(json.dumps(dict(envio), ensure_ascii=False))
+            else:
+                imprimir_historico(envios)
+            return
+
+        envios = fila.historico(**filtro)
+        if not envios:
+            print("Nenhum envio encontrado com esses filtros.")
+            return
+        mensagens = sum(len(ids_das_mensagens(envio)) for envio in envios)
+        if not args.confirmar:
+            print(f"{len(envios)} post(s) ({mensagens} mensagens) seriam afetados. "
+                  f"Repita com --confirmar para {args.comando}.")
+            return
+
+        from postar_kriasys import carregar_config
+        config = carregar_config(args.config)
+        if args.comando == 'apagar':
+            apagados, requisicoes = asyncio.run(_no_telegram(
+                config, lambda pool: apagar(fila, envios, pool, config)))
+            print(f"{apagados} post(s) apagado(s) em {requisicoes} requisição(ões).")
+        else:
+            try:
+                editados, falhas = asyncio.run(_no_telegram(
+                    config, lambda pool: editar(fila, envios, pool, config, args.texto)))
+            except ValueError as e:
+                parser.error(str(e))
+            print(f"{editados} post(s) editado(s), {falhas} falha(s).")
+    finally:
+        fila.fechar()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,146 @@
+# legenda.py
+import copy
+from collections import OrderedDict, namedtuple
+
+# -----------------------------------------------------------------------------
+# Diagramação dos posts: o Telegram limita a legenda de uma mídia a 1024 e uma
+# mensagem de texto a 4096 caracteres, contados depois do markdown (sem os
+# ** e [](...)) e em unidades UTF-16 (um emoji costuma contar 2). Posts que não
+# cabem na legenda saem com a mídia e o começo do texto, e o resto vai logo em
+# seguida em mensagens de texto, dividido nos parágrafos.
+# -----------------------------------------------------------------------------
+LIMITE_LEGENDA = 1024
+LIMITE_MENSAGEM = 4096
+# Onde o texto pode ser dividido, do preferido ao último recurso
+SEPARADORES = ('\n\n', '\n', ' ')
+
+# Texto já sem o markdown e as entidades (negrito, links, ...) prontas para o envio
+Parte = namedtuple('Parte', 'texto entidades')
+# legenda: Parte que vai com a mídia; continuacao: lista de Partes enviadas depois como texto
+Diagramacao = namedtuple('Diagramacao', 'legenda continuacao')
+
+
+def analisar(texto_markdown):
+    """Interpreta o markdown como o Telethon faria no envio."""
+    # Importado aqui: o Telethon só é carregado quando o primeiro post é diagramado
+    from telethon.extensions import markdown
+
+    texto, entidades = markdown.parse(texto_markdown)
+    return Parte(texto, entidades)
+
+
+def comprimento(texto_markdown):
+    """Tamanho que o Telegram mede: depois do markdown e em unidades UTF-16."""
+    from telethon.helpers import add_surrogate
+
+    return len(add_surrogate(analisar(texto_markdown).texto))
+
+
+def _dentro_de_entidade(entidades, posicao):
+    """Um corte em 'posicao' quebraria um link, um negrito, etc."""
+    return any(entidade.offset < posicao < entidade.offset + entidade.length for entidade in entidades)
+
+
+def _ponto_de_corte(texto, entidades, inicio, limite):
+    """
+    Onde termina o bloco que começa em 'inicio' (texto já sem markdown e em
+    unidades UTF-16, como os offsets das entidades). Devolve (fim, próximo início).
+    Preferência: um separador fora das entidades; o começo da entidade que
+    passaria do limite; um separador dentro de uma entidade maior que o
+    limite; e, por último, o corte seco no limite.
+    """
+    fim = inicio + limite
+    if fim >= len(texto):
+        return len(texto), len(texto)
+    for fora_das_entidades in (True, False):
+        for separador in SEPARADORES:
+            busca = fim + len(separador)
+            while True:
+                posicao = texto.rfind(separador, inicio + 1, busca)
+                if posicao == -1:
+                    break
+                if not fora_das_entidades or not _dentro_de_entidade(entidades, posicao):
+                    return posicao, posicao + len(separador)
+                busca = posicao + len(separador) - 1
+        if fora_das_entidades:
+            # Sem separador: a entidade cortada no limite passa inteira para o próximo bloco
+            posicao = min((entidade.offset for entidade in entidades
+                           if entidade.offset < fim < entidade.offset + entidade.length), default=fim)
+            if posicao > inicio:
+                return posicao, posicao
+    # Não separa as duas metades de um emoji (par de surrogates)
+    if '\ud800' <= texto[fim - 1] <= '\udbff':
+        fim -= 1
+    return fim, fim
+
+
+def _recortar(texto, entidades, inicio, fim):
+    """Parte com o trecho [inicio, fim) do texto e as entidades ajustadas a ele."""
+    from telethon.helpers import del_surrogate, strip_text
+
+    recortadas = []
+    for entidade in entidades:
+        comeco = max(entidade.offset, inicio)
+        final = min(entidade.offset + entidade.length, fim)
+        if comeco < final:
+            # Entidade dividida entre dois blocos: cada metade mantém a formatação (e o link)
+            recortada = copy.copy(entidade)
+            recortada.offset, recortada.length = comeco - inicio, final - comeco
+            recortadas.append(recortada)
+    trecho = strip_text(texto[inicio:fim], recortadas)
+    return Parte(del_surrogate(trecho), recortadas)
+
+
+def _dividir(texto, entidades, inicio, limite):
+    """Bloco de até 'limite' a partir de 'inicio'; devolve (Parte, começo do próximo bloco)."""
+    fim, proximo = _ponto_de_corte(texto, entidades, inicio, limite)
+    return _recortar(texto, entidades, inicio, fim), proximo
+
+
+def diagramar(texto, limite_legenda=LIMITE_LEGENDA):
+    """
+    Divide o post em legenda (até 'limite_legenda') e continuação (mensagens de
+    até 4096). O markdown é interpretado uma vez, antes de dividir: os cortes são
+    medidos no texto que o Telegram conta e não caem dentro de um link ou de um
+    negrito se houver outro lugar para cortar. A legenda é sempre o começo exato
+    do texto; os blocos juntam o máximo de parágrafos (ou linhas, ou palavras).
+    """
+    from telethon.helpers import add_surrogate
+
+    parte = analisar(texto.strip())
+    unidades, entidades = add_surrogate(parte.texto), parte.entidades
+    legenda, inicio = _dividir(unidades, entidades, 0, limite_legenda)
+    continuacao = []
+    while inicio < len(unidades):
+        bloco, inicio = _dividir(unidades, entidades, inicio, LIMITE_MENSAGEM)
+        if bloco.texto:
+            continuacao.append(bloco)
+    return Diagramacao(legenda, continuacao)
+
+
+# -----------------------------------------------------------------------------
+# Cache das diagramações por post: o id do post é o hash do texto, então a
+# entrada nunca fica velha e o markdown só é interpretado uma vez por post.
+# -----------------------------------------------------------------------------
+class CacheLegendas:
+    def __init__(self, maximo=1024):
+        """
+        :param maximo: Quantidade de posts guardados (os usados há mais tempo saem primeiro).
+        """
+        self.maximo = maximo
+        self._itens = OrderedDict()
+
+    def obter(self, post_id, texto, limite_legenda=LIMITE_LEGENDA):
+        chave = (post_id, limite_legenda)
+        diagramacao = self._itens.get(chave)
+        if diagramacao is None:
+            diagramacao = self._itens[chave] = diagramar(texto, limite_legenda)
+            if len(self._itens) > self.maximo:
+                self._itens.popitem(last=False)
+        else:
+            self._itens.move_to_end(chave)
+        return diagramacao
+
+
+# Cache único usado pelos envios
+LEGENDAS = CacheLegendas()
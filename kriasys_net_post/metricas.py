@@ -0,0 +1,201 @@
+# metricas.py
+import asyncio
+import bisect
+import json
+import logging
+import time
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+# -----------------------------------------------------------------------------
+# Métricas do bot: contadores (envios, falhas, FloodWaits, bytes) e tempos das
+# operações mais caras (conexão, get_entity, conversão, send_file, gravação do
+# estado). Tudo fica em memória e custa só uma soma por evento; a formatação
+# acontece apenas quando alguém lê o endpoint HTTP ou o arquivo JSON.
+# -----------------------------------------------------------------------------
+PREFIXO = 'kriasys_'
+# Limites (segundos) dos baldes do histograma de tempos
+LIMITES_PADRAO = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+
+class Temporizador:
+    __slots__ = ('baldes', 'quantidade', 'soma', 'maximo')
+
+    def __init__(self):
+        self.baldes = [0] * (len(LIMITES_PADRAO) + 1)
+        self.quantidade = 0
+        self.soma = 0.0
+        self.maximo = 0.0
+
+    def observar(self, segundos):
+        self.baldes[bisect.bisect_left(LIMITES_PADRAO, segundos)] += 1
+        self.quantidade += 1
+        self.soma += segundos
+        if segundos > self.maximo:
+            self.maximo = segundos
+
+
+def percentil(valores, p):
+    """Percentil 'p' (0 a 100) de uma lista de valores (0.0 se estiver vazia)."""
+    if not valores:
+        return 0.0
+    ordenados = sorted(valores)
+    return ordenados[min(len(ordenados) - 1, int(round(p / 100 * (len(ordenados) - 1))))]
+
+
+def _rotulos(rotulos):
+    return tuple(sorted(rotulos.items()))
+
+
+def _formatar_rotulos(rotulos, extra=()):
+    pares = list(rotulos) + list(extra)
+    if not pares:
+        return ''
+    return '{' + ','.join(f'{nome}="{valor}"' for nome, valor in pares) + '}'
+
+
+class Metricas:
+    def __init__(self):
+        self.zerar()
+
+    def zerar(self):
+        # (nome, rótulos) -> valor / Temporizador
+        self.contadores = {}
+        self.temporizadores = {}
+        self.inicio = time.time()
+
+    def incrementar(self, nome, valor=1, **rotulos):
+        chave = (nome, _rotulos(rotulos))
+        self.contadores[chave] = self.contadores.get(chave, 0) + valor
+
+    def observar(self, nome, segundos, **rotulos):
+        chave = (nome, _rotulos(rotulos))
+        temporizador = self.temporizadores.get(chave)
+        if temporizador is None:
+            temporizador = self.temporizadores[chave] = Temporizador()
+        temporizador.observar(segundos)
+
+    @contextmanager
+    def cronometrar(self, nome, **rotulos):
+        """Mede o tempo do bloco (funciona também em volta de await)."""
+        inicio = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observar(nome, time.perf_counter() - inicio, **rotulos)
+
+    def total(self, nome):
+        """Soma do contador em todos os rótulos."""
+        return sum(valor for (chave, _), valor in self.contadores.items() if chave == nome)
+
+    def tempo_total(self, nome):
+        """Soma dos tempos observados (segundos) em todos os rótulos."""
+        return sum(t.soma for (chave, _), t in self.temporizadores.items() if chave == nome)
+
+    def contagem(self, nome):
+        """Quantidade de tempos observados em todos os rótulos."""
+        return sum(t.quantidade for (chave, _), t in self.temporizadores.items() if chave == nome)
+
+    def como_dict(self):
+        contadores = {}
+        for (nome, rotulos), valor in sorted(self.contadores.items()):
+            contadores[nome + _formatar_rotulos(rotulos)] = valor
+        temporizadores = {}
+        for (nome, rotulos), t in sorted(self.temporizadores.items()):
+            temporizadores[nome + _formatar_rotulos(rotulos)] = {
+                'quantidade': t.quantidade,
+                'soma_s': round(t.soma, 6),
+                'media_s': round(t.soma / t.quantidade, 6) if t.quantidade else 0.0,
+                'maximo_s': round(t.maximo, 6),
+            }
+        return {
+            'gerado_em': time.time(),
+            'desde': self.inicio,
+            'contadores': contadores,
+            'temporizadores': temporizadores,
+        }
+
+    def texto_prometheus(self):
+        """Formato de exposição de texto do Prometheus."""
+        linhas = []
+        tipos_escritos = set()
+        for (nome, rotulos), valor in sorted(self.contadores.items()):
+            metrica = PREFIXO + nome
+            if metrica not in tipos_escritos:
+                linhas.append(f'# TYPE {metrica} counter')
+                tipos_escritos.add(metrica)
+            linhas.append(f'{metrica}{_formatar_rotulos(rotulos)} {valor}')
+        for (nome, rotulos), t in sorted(self.temporizadores.items()):
+            metrica = f'{PREFIXO}{nome}_segundos'
+            if metrica not in tipos_escritos:
+                linhas.append(f'# TYPE {metrica} histogram')
+                tipos_escritos.add(metrica)
+            acumulado = 0
+            for limite, quantidade in zip(LIMITES_PADRAO, t.baldes):
+                acumulado += quantidade
+                linhas.append(f'{metrica}_bucket{_formatar_rotulos(rotulos, [("le", limite)])} {acumulado}')
+            linhas.append(f'{metrica}_bucket{_formatar_rotulos(rotulos, [("le", "+Inf")])} {t.quantidade}')
+            linhas.append(f'{metrica}_sum{_formatar_rotulos(rotulos)} {t.soma}')
+            linhas.append(f'{metrica}_count{_formatar_rotulos(rotulos)} {t.quantidade}')
+        return '\n'.join(linhas) + '\n'
+
+
+# Registro único usado por todos os módulos
+METRICAS = Metricas()
+
+
+# -----------------------------------------------------------------------------
+# Endpoint HTTP local: /metrics (Prometheus) e /metrics.json
+# -----------------------------------------------------------------------------
+async def _atender(leitor, escritor, metricas):
+    try:
+        linha = await leitor.readline()
+        # Descarta os cabeçalhos da requisição
+        while (await leitor.readline()).strip():
+            pass
+        partes = linha.decode('latin-1').split()
+        caminho = partes[1] if len(partes) > 1 else '/'
+        if caminho == '/metrics':
+            status, tipo, corpo = '200 OK', 'text/plain; version=0.0.4', metricas.texto_prometheus()
+        elif caminho == '/metrics.json':
+            status, tipo, corpo = '200 OK', 'application/json', json.dumps(metricas.como_dict())
+        else:
+            status, tipo, corpo = '404 Not Found', 'text/plain', 'Use /metrics ou /metrics.json\n'
+        dados = corpo.encode('utf-8')
+        escritor.write(
+            f'HTTP/1.1 {status}\r\nContent-Type: {tipo}\r\nContent-Length: {len(dados)}\r\n'
+            f'Connection: close\r\n\r\n'.encode('latin-1') + dados
+        )
+        await escritor.drain()
+    except (ConnectionError, asyncio.IncompleteReadError):
+        pass
+    finally:
+        escritor.close()
+
+
+async def servir_http(porta, host='127.0.0.1', metricas=METRICAS):
+    """Inicia o servidor HTTP das métricas e devolve o asyncio.Server."""
+    servidor = await asyncio.start_server(
+        lambda leitor, escritor: _atender(leitor, escritor, metricas), host, porta
+    )
+    logger.info("Métricas disponíveis em http://%s:%d/metrics", host, porta)
+    return servidor
+
+
+def gravar_metricas(caminho, metricas=METRICAS):
+    """Grava as métricas em JSON uma vez (também chamada no encerramento do bot)."""
+    # Importado aqui: estado.py também usa as métricas
+    from estado import _gravar_atomico
+
+    try:
+        _gravar_atomico(caminho, metricas.como_dict())
+    except OSError as e:
+        logger.warning("Não foi possível gravar as métricas em '%s': %s", caminho, e)
+
+
+async def gravar_periodicamente(caminho, intervalo=60, metricas=METRICAS):
+    """Grava as métricas em JSON a cada 'intervalo' segundos."""
+    while True:
+        await asyncio.sleep(intervalo)
+        gravar_metricas(caminho, metricas)
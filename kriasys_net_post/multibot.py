@@ -0,0 +1,219 @@
+# multibot.py
+import argparse
+import asyncio
+import logging
+import os
+import signal
+
+from esquema import ConfigInvalida
+from estado import abrir_estado
+from fila import abrir_fila
+from metricas import gravar_metricas
+from postar_kriasys import (Servico, chaves_de_indice, criar_alvos, criar_scheduler, encerrar_metricas,
+                            indexar_conteudo, iniciar_metricas, ler_config, mostrar_erros)
+from preconversao import PASTA_CACHE, PipelineMidia
+from similaridade import SIMILARES, SIMILARES_FILE
+
+logger = logging.getLogger(__name__)
+
+# -----------------------------------------------------------------------------
+# Vários bots num único processo. Cada pasta de bot (com config.json,
+# posts.txt, pastas de mídia e sessões) continua isolada: os caminhos do
+# config são relativos à pasta e o estado, a fila e o plano ficam nela.
+# O que é dividido entre todos: o loop de eventos, um único scheduler, a
+# conversão das mídias e as contas: bots que apontam para o mesmo arquivo de
+# sessão usam uma única conexão (com um único token bucket e cache de uploads).
+# As mídias convertidas e o índice de similaridade, que são de todos, ficam na
+# raiz (--raiz), e não no diretório de onde o multibot foi chamado.
+# -----------------------------------------------------------------------------
+CONFIG = 'config.json'
+# Chaves do config de cada bot que não valem aqui (o multibot tem as suas opções)
+CHAVES_IGNORADAS = ('test_mode', 'metrics_port', 'metrics_file')
+
+
+def descobrir_pastas(raiz):
+    """Subpastas de 'raiz' que têm um config.json, em ordem alfabética."""
+    return sorted(
+        os.path.join(raiz, entrada.name) for entrada in os.scandir(raiz)
+        if entrada.is_dir() and os.path.isfile(os.path.join(raiz, entrada.name, CONFIG))
+    )
+
+
+def nome_do_bot(pasta):
+    return os.path.basename(os.path.abspath(pasta))
+
+
+def abrir_bot(pasta):
+    """Lê o config de uma pasta de bot. Levanta ConfigInvalida."""
+    return ler_config(os.path.join(pasta, CONFIG), pasta)
+
+
+def indexar_bot(config):
+    """Lê o conteúdo (posts e mídias) de um bot. Levanta ConfigInvalida."""
+    return {chave: indexar_conteudo(*chave) for chave in chaves_de_indice(config)}
+
+
+def unificar_similaridade(configs, raiz):
+    """
+    O índice de mídias quase iguais é um só no processo (gravado na 'raiz'): se
+    algum bot liga o "media_dedup", todos usam a menor "media_dedup_distance" configurada.
+    O índice é ligado aqui, antes de indexar o conteúdo (como no bot único),
+    para que as mídias quase iguais já sejam agrupadas na primeira leitura.
+    """
+    distancias = sorted({config['media_dedup_distance'] for config in configs if config['media_dedup']})
+    if not distancias:
+        return
+    if len(distancias) > 1:
+        logger.warning("Os bots usam \"media_dedup_distance\" diferentes (%s); vale a menor, %d.",
+                       ', '.join(map(str, distancias)), distancias[0])
+    for config in configs:
+        config['media_dedup_distance'] = distancias[0]
+    SIMILARES.ativar(distancias[0], caminho=os.path.join(raiz, SIMILARES_FILE))
+
+
+class Multibot:
+    def __init__(self, servicos, config_metricas, raiz='.'):
+        """
+        :param servicos: {nome do bot: Servico}.
+        :param config_metricas: metrics_port, metrics_file e metrics_interval_seconds do processo todo.
+        :param raiz: Pasta das mídias convertidas, que são de todos os bots.
+        """
+        self.servicos = servicos
+        self.config_metricas = config_metricas
+        self.raiz = raiz
+        self._parar = None
+
+    def parar(self):
+        if not self._parar.is_set():
+            logger.info("Encerrando: aguardando os envios em andamento...")
+            self._parar.set()
+
+    async def recarregar(self):
+        """SIGHUP: cada bot relê o seu config.json (pastas novas só entram reiniciando)."""
+        for nome, servico in self.servicos.items():
+            logger.info("[%s] Recarregando...", nome)
+            await servico.recarregar()
+
+    def _instalar_sinais(self):
+        loop = asyncio.get_running_loop()
+        sinais = [(signal.SIGTERM, self.parar), (signal.SIGINT, self.parar)]
+        if hasattr(signal, 'SIGHUP'):
+            sinais.append((signal.SIGHUP, lambda: asyncio.ensure_future(self.recarregar())))
+        for sinal, acao in sinais:
+            try:
+                loop.add_signal_handler(sinal, acao)
+            except (NotImplementedError, RuntimeError):
+                pass
+
+    async def executar(self):
+        from contas import PoolContas, RegistroContas
+
+        self._parar = asyncio.Event()
+        scheduler = criar_scheduler()
+        registro = RegistroContas()
+        pipeline = PipelineMidia(os.path.join(self.raiz, PASTA_CACHE))
+        for servico in self.servicos.values():
+            await servico.iniciar(scheduler, PoolContas.do_config(servico.config, registro), pipeline)
+        metricas = await iniciar_metricas(self.config_metricas)
+        self._instalar_sinais()
+
+        scheduler.start()
+        logger.info("%d bot(s) rodando num único scheduler, com %d conta(s) conectada(s).",
+                    len(self.servicos), len(registro.contas))
+        try:
+            await self._parar.wait()
+        finally:
+            scheduler.shutdown(wait=False)
+            # Os envios em andamento de todos os bots terminam juntos (e não um bot depois do outro)
+            await asyncio.gather(*(servico.concluir() for servico in self.servicos.values()))
+            encerrar_metricas(metricas)
+            if self.config_metricas.get('metrics_file'):
+                gravar_metricas(self.config_metricas['metrics_file'])
+            pipeline.encerrar()
+            for servico in self.servicos.values():
+                await servico.pool.encerrar(desconectar=False)
+            await registro.encerrar()
+            logger.info("Bots encerrados.")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Roda várias pastas de bot num único processo.")
+    parser.add_argument('pastas', nargs='*', help="Pastas dos bots (padrão: as subpastas de --raiz com config.json).")
+    parser.add_argument('--raiz', default='.', help="Onde procurar as pastas dos bots e onde ficam as mídias "
+                                                    "convertidas e o índice de similaridade (padrão: diretório atual).")
+    parser.add_argument('--check', action='store_true', help="Só valida os bots e sai.")
+    parser.add_argument('--pid-file', help="Grava o PID do processo neste arquivo (para kill -HUP / -TERM).")
+    parser.add_argument('--log-level', default='INFO', choices=('DEBUG', 'INFO', 'WARNING', 'ERROR'))
+    parser.add_argument('--metrics-port', type=int, help="Porta HTTP das métricas de todos os bots.")
+    parser.add_argument('--metrics-file', help="Arquivo JSON das métricas de todos os bots.")
+    parser.add_argument('--metrics-interval', type=int, default=60, help="Segundos entre as gravações do --metrics-file.")
+    args = parser.parse_args()
+    logging.basicConfig(level=args.log_level, format='%(asctime)s %(levelname)s %(name)s: %(message)s')
+
+    raiz = os.path.abspath(args.raiz)
+    pastas = args.pastas or descobrir_pastas(raiz)
+    if not pastas:
+        logger.error("Nenhuma pasta com %s encontrada em '%s'.", CONFIG, raiz)
+        exit(1)
+    nomes = [nome_do_bot(pasta) for pasta in pastas]
+    repetidos = sorted({nome for nome in nomes if nomes.count(nome) > 1})
+    if repetidos:
+        logger.error("Pastas de bot com o mesmo nome: %s.", ', '.join(repetidos))
+        exit(1)
+
+    # Um bot com erros fica de fora sem impedir os outros de rodar
+    configs, falhas = {}, 0
+    for nome, pasta in zip(nomes, pastas):
+        try:
+            configs[nome] = (pasta, abrir_bot(pasta))
+        except ConfigInvalida as e:
+            mostrar_erros(e.erros, os.path.join(pasta, CONFIG))
+            falhas += 1
+    unificar_similaridade([config for _, config in configs.values()], raiz)
+    carregados = {}
+    for nome, (pasta, config) in configs.items():
+        try:
+            carregados[nome] = (pasta, config, indexar_bot(config))
+        except ConfigInvalida as e:
+            mostrar_erros(e.erros, os.path.join(pasta, CONFIG))
+            falhas += 1
+    if args.check:
+        logger.info("%d bot(s) válido(s), %d com erros.", len(carregados), falhas)
+        exit(1 if falhas else 0)
+    if not carregados:
+        exit(1)
+    if falhas:
+        logger.warning("%d bot(s) com erros ficaram de fora.", falhas)
+
+    servicos, abertos = {}, []
+    try:
+        for nome, (pasta, config, indices) in carregados.items():
+            for chave in CHAVES_IGNORADAS:
+                if config.get(chave):
+                    logger.warning("[%s] \"%s\" não vale no multibot e será ignorado.", nome, chave)
+            estado = abrir_estado(config, pasta)
+            fila = abrir_fila(config, pasta)
+            abertos += [fila, estado]
+            servicos[nome] = Servico(os.path.join(pasta, CONFIG), config, estado, criar_alvos(config, estado, indices),
+                                     fila, pasta, prefixo=f'{nome}/', nivel_de_log=False)
+        if args.pid_file:
+            with open(args.pid_file, 'w') as f:
+                f.write(f"{os.getpid()}\n")
+        config_metricas = {
+            'metrics_port': args.metrics_port,
+            'metrics_file': args.metrics_file,
+            'metrics_interval_seconds': args.metrics_interval,
+        }
+        try:
+            asyncio.run(Multibot(servicos, config_metricas, raiz).executar())
+        except KeyboardInterrupt:
+            logger.info("Bots interrompidos pelo usuário.")
+    finally:
+        for aberto in abertos:
+            aberto.fechar()
+        if args.pid_file and os.path.exists(args.pid_file):
+            os.remove(args.pid_file)
+
+
+if __name__ == '__main__':
+    main()
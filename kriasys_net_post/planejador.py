@@ -0,0 +1,235 @@
+# planejador.py
+import argparse
+import json
+import logging
+import os
+import random
+from datetime import date, datetime, time, timedelta
+
+from estado import _gravar_atomico
+
+logger = logging.getLogger(__name__)
+
+# -----------------------------------------------------------------------------
+# Arquivo com o plano das semanas: horários já sorteados de cada alvo.
+# A semente garante que a mesma semana dá sempre o mesmo plano (inclusive na
+# prévia de semanas futuras), e o plano gravado garante que um reinício no
+# meio da semana não sorteia tudo de novo.
+# -----------------------------------------------------------------------------
+PLANO_FILE = 'plano.json'
+NOMES_DIAS = ["Seg", "Ter", "Qua", "Qui", "Sex", "Sab", "Dom"]
+
+# Chaves do alvo que definem o plano: se mudarem no config.json, a semana é recalculada
+CHAVES_DO_PLANO = (
+    'scheduled_times', 'variation_minutes', 'postar_dias_da_semana',
+    'numero_de_dias_por_semana', 'dias_exatos',
+)
+
+
+# -----------------------------------------------------------------------------
+# Função para parsear os nomes de dias exatos em formato CronTrigger (0 a 6)
+# -----------------------------------------------------------------------------
+def parse_dias_exatos(dias_lista):
+    """
+    Converte strings como 'segunda', 'terca', 'quarta', etc.
+    em números (0=segunda, 1=terça, ... 6=domingo).
+    Se algum dia for inválido, levanta ValueError.
+    """
+    mapping = {
+        # Você pode expandir se quiser abreviações:
+        'seg': 0, 'segunda': 0, 'segunda-feira': 0,
+        'ter': 1, 'terca': 1, 'terça': 1, 'terça-feira': 1,
+        'qua': 2, 'quarta': 2, 'quarta-feira': 2,
+        'qui': 3, 'quinta': 3, 'quinta-feira': 3,
+        'sex': 4, 'sexta': 4, 'sexta-feira': 4,
+        'sab': 5, 'sábado': 5, 'sabado': 5,
+        'dom': 6, 'domingo': 6
+    }
+    result = []
+    for dia in dias_lista:
+        dia_lower = dia.strip().lower()
+        if dia_lower in mapping:
+            result.append(mapping[dia_lower])
+        else:
+            raise ValueError(f"Dia da semana inválido no config: '{dia}'")
+    # Remover duplicados e retornar
+    return list(set(result))
+
+# -----------------------------------------------------------------------------
+# Função para converter uma string de horário 'HH:MM' para hora e minuto inteiros
+# -----------------------------------------------------------------------------
+def parse_time(time_str):
+    """Converte 'HH:MM' em (hora, minuto). Levanta ValueError se o horário for inválido."""
+    try:
+        hora, minuto = map(int, time_str.split(':'))
+    except (AttributeError, ValueError):
+        raise ValueError(f"Horário '{time_str}' está no formato inválido. Use 'HH:MM'.") from None
+    if not (0 <= hora <= 23 and 0 <= minuto <= 59):
+        raise ValueError(f"Horário '{time_str}' está fora do intervalo 00:00 a 23:59.")
+    return hora, minuto
+
+def horario_valido(time_str):
+    """True se o horário está no formato 'HH:MM' (usado na validação do config)."""
+    try:
+        parse_time(time_str)
+    except ValueError:
+        return False
+    return True
+
+def inicio_da_semana(dia):
+    """Segunda-feira da semana do dia informado."""
+    return dia - timedelta(days=dia.weekday())
+
+# -----------------------------------------------------------------------------
+# Dias em que o alvo posta numa semana: todos, os 'dias_exatos' ou
+# 'numero_de_dias_por_semana' dias sorteados (um sorteio novo a cada semana).
+# -----------------------------------------------------------------------------
+def dias_da_semana(config_alvo, rng):
+    if not config_alvo.get('postar_dias_da_semana', False):
+        return list(range(0, 7))
+    dias_exatos = config_alvo.get('dias_exatos', [])
+    if dias_exatos:
+        return sorted(parse_dias_exatos(dias_exatos))
+    numero_dias_semana = config_alvo.get('numero_de_dias_por_semana', 7)
+    return sorted(rng.sample(range(0, 7), numero_dias_semana))
+
+# -----------------------------------------------------------------------------
+# Calcula os horários concretos de uma semana. Cada horário de 'scheduled_times'
+# recebe uma variação sorteada entre -variation_minutes e +variation_minutes
+# (sem começar antes da meia-noite do dia, como antes).
+# -----------------------------------------------------------------------------
+def calcular_semana(config_alvo, segunda, semente):
+    rng = random.Random(f"{semente}:{config_alvo['nome']}:{segunda.isoformat()}")
+    variacao = config_alvo['variation_minutes']
+    horarios = []
+    for dia in dias_da_semana(config_alvo, rng):
+        data = segunda + timedelta(days=dia)
+        for scheduled_time in config_alvo['scheduled_times']:
+            hora, minuto = parse_time(scheduled_time)
+            earliest_minutes = max(0, hora * 60 + minuto - variacao)
+            atraso = rng.randint(0, variacao * 2)
+            quando = datetime.combine(data, time()) + timedelta(minutes=earliest_minutes + atraso)
+            horarios.append({
+                'data': data.isoformat(),
+                'slot': f"{hora:02d}:{minuto:02d}",
+                'quando': quando.isoformat(timespec='minutes'),
+            })
+    horarios.sort(key=lambda item: item['quando'])
+    return horarios
+
+
+# -----------------------------------------------------------------------------
+# Plano persistente das semanas de todos os alvos (plano.json)
+# -----------------------------------------------------------------------------
+class Planejador:
+    def __init__(self, caminho=PLANO_FILE, somente_leitura=False):
+        """
+        :param caminho: Arquivo do plano.
+        :param somente_leitura: Não grava nada (prévia): sem plano.json, a semente é só desta execução.
+        """
+        self.caminho = caminho
+        self.somente_leitura = somente_leitura
+        self.semente = None
+        self.alvos = {}
+        self._carregar()
+
+    def _carregar(self):
+        if os.path.exists(self.caminho):
+            try:
+                with open(self.caminho, 'r', encoding='utf-8') as f:
+                    dados = json.load(f)
+                self.semente = dados['semente']
+                self.alvos = dados.get('alvos', {})
+            except (OSError, ValueError, KeyError) as e:
+                logger.warning("Plano inválido em '%s', será refeito: %s", self.caminho, e)
+        if self.semente is None:
+            self.semente = random.getrandbits(64)
+            self.salvar()
+
+    def salvar(self):
+        if self.somente_leitura:
+            return
+        _gravar_atomico(self.caminho, {'semente': self.semente, 'alvos': self.alvos})
+
+    @staticmethod
+    def _assinatura(config_alvo):
+        return json.dumps({chave: config_alvo.get(chave) for chave in CHAVES_DO_PLANO}, sort_keys=True)
+
+    def prever(self, config_alvo, segunda):
+        """Plano da semana (gravado, se houver e ainda valer para o config atual; senão calculado)."""
+        gravado = self.alvos.get(config_alvo['nome'], {}).get(segunda.isoformat())
+        if gravado and gravado['assinatura'] == self._assinatura(config_alvo):
+            return gravado['horarios']
+        return calcular_semana(config_alvo, segunda, self.semente)
+
+    def planejado_em(self, config_alvo, segunda):
+        """Quando o plano gravado da semana foi sorteado (None se não houver um que valha para o config)."""
+        gravado = self.alvos.get(config_alvo['nome'], {}).get(segunda.isoformat())
+        if not gravado or gravado['assinatura'] != self._assinatura(config_alvo) or 'planejado_em' not in gravado:
+            return None
+        return datetime.fromisoformat(gravado['planejado_em'])
+
+    def semana(self, config_alvo, segunda):
+        """Igual a prever(), mas grava o plano para que reinícios usem os mesmos horários."""
+        horarios = self.prever(config_alvo, segunda)
+        semanas = self.alvos.setdefault(config_alvo['nome'], {})
+        if semanas.get(segunda.isoformat(), {}).get('horarios') is not horarios:
+            semanas[segunda.isoformat()] = {
+                'assinatura': self._assinatura(config_alvo),
+                'horarios': horarios,
+                'planejado_em': datetime.now().isoformat(timespec='seconds'),
+            }
+            self.salvar()
+        return horarios
+
+    def limpar(self, segunda_atual):
+        """
+        Remove do arquivo as semanas que já terminaram, menos a anterior (os seus
+        últimos horários ainda podem ser recuperados se o bot estava desligado).
+        """
+        mudou = False
+        anterior = (segunda_atual - timedelta(weeks=1)).isoformat()
+        for semanas in self.alvos.values():
+            for inicio in [s for s in semanas if s < anterior]:
+                del semanas[inicio]
+                mudou = True
+        if mudou:
+            self.salvar()
+
+
+# -----------------------------------------------------------------------------
+# Prévia (dry-run): imprime os posts planejados das próximas semanas sem enviar nada
+# -----------------------------------------------------------------------------
+def imprimir_plano(alvos, planejador, semanas=2):
+    agora = datetime.now()
+    segunda = inicio_da_semana(date.today())
+    for numero in range(semanas):
+        inicio = segunda + timedelta(weeks=numero)
+        print(f"Semana de {inicio:%d/%m/%Y}:")
+        for config_alvo in alvos:
+            horarios = planejador.prever(config_alvo, inicio)
+            print(f"  [{config_alvo['nome']}] {len(horarios)} post(s)")
+            for item in horarios:
+                quando = datetime.fromisoformat(item['quando'])
+                passou = " (já passou)" if quando <= agora else ""
+                print(f"    {NOMES_DIAS[quando.weekday()]} {quando:%d/%m %H:%M} "
+                      f"(horário base {item['slot']}){passou}")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Mostra os posts planejados das próximas semanas, sem enviar nada."
+    )
+    parser.add_argument('semanas', type=int, nargs='?', default=2,
+                        help="Quantidade de semanas a mostrar (padrão: 2).")
+    parser.add_argument('--config', default='config.json', help="Arquivo de configuração.")
+    args = parser.parse_args()
+
+    from postar_kriasys import carregar_config
+    config = carregar_config(args.config)
+    # Só lê o plano.json: a prévia não grava nada
+    imprimir_plano(config['targets'], Planejador(somente_leitura=True), args.semanas)
+
+
+if __name__ == '__main__':
+    main()
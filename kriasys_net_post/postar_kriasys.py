@@ -1,507 +1,1341 @@
 # kriasys.py
+import argparse
+import copy
 import json
+import logging
 import os
 import random
-import re
+import signal
+import time
 import asyncio
-from telethon import TelegramClient
-from telethon.errors import SessionPasswordNeededError
-from PIL import Image
 import tempfile
-from datetime import datetime, timedelta
-from apscheduler.schedulers.asyncio import AsyncIOScheduler
-from apscheduler.triggers.cron import CronTrigger
+from datetime import date, datetime, timedelta
+# Telethon, PIL e APScheduler são importados só onde são usados: validar o
+# config, ver o plano ou rodar sem mídias não paga o tempo de carregá-los.
+from preconversao import PipelineMidia
+from estado import abrir_estado
+from esquema import (BOOLEANO, INTEIRO, LISTA, NULO, NUMERO, OBJETO, OBRIGATORIO, OPCIONAL, TEXTO,
+                     ConfigInvalida, aplicar, campo, do_tipo)
+from fila import Entrega, EnvioIncompleto, abrir_fila, midia_do_envio
+from planejador import NOMES_DIAS, PLANO_FILE, Planejador, horario_valido, inicio_da_semana, parse_dias_exatos
+from conteudo import IndiceConteudo, id_post
+from legenda import LEGENDAS, LIMITE_LEGENDA, LIMITE_MENSAGEM
+from rotacao import PESO_REACAO, SelecionadorPonderado
+from similaridade import DISTANCIA_MAXIMA, DISTANCIA_PADRAO, SIMILARES
+from metricas import METRICAS, gravar_metricas, gravar_periodicamente, servir_http
+
+logger = logging.getLogger('kriasys')
+
+# Níveis aceitos em "log_level"
+NIVEIS_DE_LOG = ('DEBUG', 'INFO', 'WARNING', 'ERROR')
+
+# -----------------------------------------------------------------------------
+# Pasta de mídias usada para cada tipo de post
+# -----------------------------------------------------------------------------
+PASTAS_POR_TIPO = {
+    'usuario': 'imagens_usuario',
+    'revenda': 'imagens_revenda',
+}
+
+# -----------------------------------------------------------------------------
+# Chaves que cada alvo herda do nível principal do config.json quando não
+# as define (horários, regras de dias, arquivos de posts, de mídia e álbuns).
+# -----------------------------------------------------------------------------
+CHAVES_DO_ALVO = (
+    'target_id', 'scheduled_times', 'posts_per_day', 'variation_minutes',
+    'postar_dias_da_semana', 'numero_de_dias_por_semana', 'dias_exatos',
+    'posts_path', 'pastas_midia', 'albuns', 'caption_limit',
+    'rotation', 'rotation_cooldown', 'rotation_weights', 'engagement_refresh_minutes',
+)
+
+# Modos de rotação aceitos em "rotation"
+MODOS_DE_ROTACAO = ('shuffle', 'weighted')
+# Dias em que o engajamento de um post enviado ainda é atualizado
+DIAS_DE_ENGAJAMENTO = 7
+
+# Quantidade de mídias aceita pelo Telegram num álbum
+MIDIAS_POR_ALBUM = (2, 10)
 
 # -----------------------------------------------------------------------------
-# NOVO: Definir um arquivo de estado para gravar em disco quais itens já foram usados
+# Esquema das chaves simples de cada alvo (tipo, valor padrão e regra).
+# As verificações que dependem de mais de uma chave ficam em validar_alvo.
 # -----------------------------------------------------------------------------
-STATE_FILE = 'state.json'
+CAMPOS_DO_ALVO = (
+    campo('scheduled_times', LISTA, [],
+          "'scheduled_times' deve ser uma lista de horários no formato 'HH:MM' (00:00 a 23:59).",
+          regra=lambda horarios: all(horario_valido(horario) for horario in horarios)),
+    campo('variation_minutes', INTEIRO, OBRIGATORIO, "'variation_minutes' deve ser um número inteiro."),
+    campo('postar_dias_da_semana', BOOLEANO, False,
+          "'postar_dias_da_semana' deve ser um valor booleano (true ou false)."),
+    # "dias_exatos" é opcional. Se existir, deve ser lista de strings.
+    campo('dias_exatos', LISTA, OPCIONAL,
+          "'dias_exatos' deve ser uma lista de strings (ex: ['terca','quinta'])."),
+    # "posts_path" e "pastas_midia" são opcionais: arquivo de posts e pasta de
+    # mídias de cada tipo de post (padrão: posts.txt, imagens_usuario, imagens_revenda).
+    campo('posts_path', TEXTO, 'posts.txt', "'posts_path' deve ser o caminho de um arquivo."),
+    campo('pastas_midia', OBJETO, dict(PASTAS_POR_TIPO),
+          "'pastas_midia' deve mapear cada tipo de post para uma pasta (ex: {'usuario': 'imagens_usuario'}).",
+          regra=lambda pastas: bool(pastas) and all(isinstance(p, str) for p in pastas.values())),
+    # "caption_limit" é opcional: tamanho máximo da legenda (padrão: 1024, o limite
+    # do Telegram; 2048 para contas Premium). O texto que passar vai em seguida.
+    campo('caption_limit', INTEIRO, LIMITE_LEGENDA,
+          f"'caption_limit' deve ser um inteiro entre 1 e {LIMITE_MENSAGEM}.",
+          regra=lambda limite: 1 <= limite <= LIMITE_MENSAGEM),
+    # "albuns" é opcional: tipos de post enviados como álbum, cada um com o tipo
+    # de mídia usado (um tipo de 'pastas_midia') e quantas mídias vão no álbum.
+    # Ex: {"galeria": {"midias": "usuario", "quantidade": 4}}
+    campo('albuns', OBJETO, {},
+          "'albuns' deve mapear cada tipo de post de álbum para as suas mídias "
+          "(ex: {'galeria': {'midias': 'usuario', 'quantidade': 4}})."),
+    # Rotação (opcional): "rotation" é 'shuffle' (padrão: ciclo sem repetir) ou
+    # 'weighted' (sorteio por peso). No modo 'weighted', "rotation_cooldown" impede
+    # que um item saia de novo nos próximos N sorteios do mesmo pool,
+    # "rotation_weights" dá o peso de cada item (pelo id, pelo nome do arquivo de
+    # mídia ou pelo tipo de post) e "engagement_refresh_minutes" diz de quanto em
+    # quanto tempo os pesos são ajustados pelas visualizações e reações (0 desliga).
+    campo('rotation', TEXTO, 'shuffle', f"'rotation' deve ser um destes: {', '.join(MODOS_DE_ROTACAO)}.",
+          regra=lambda modo: modo in MODOS_DE_ROTACAO),
+    campo('rotation_cooldown', INTEIRO, 0, "'rotation_cooldown' deve ser um inteiro maior ou igual a zero.",
+          regra=lambda valor: valor >= 0),
+    campo('engagement_refresh_minutes', INTEIRO, 60,
+          "'engagement_refresh_minutes' deve ser um inteiro maior ou igual a zero.",
+          regra=lambda valor: valor >= 0),
+    campo('rotation_weights', OBJETO, {},
+          "'rotation_weights' deve mapear itens para pesos positivos (ex: {'promo.jpg': 3, 'revenda': 0.5}).",
+          regra=lambda pesos: all(do_tipo(peso, NUMERO) and peso > 0 for peso in pesos.values())),
+)
+
+# -----------------------------------------------------------------------------
+# Função para validar um alvo (canal ou grupo) e preencher os valores padrão.
+# Os erros são anexados a 'erros' (com o prefixo do alvo) em vez de encerrar.
+# -----------------------------------------------------------------------------
+def validar_alvo(alvo, erros, prefixo=''):
+    # Converter target_id para inteiro (sem aspas)
+    try:
+        alvo['target_id'] = int(alvo['target_id'])
+    except (KeyError, TypeError, ValueError):
+        erros.append(f"{prefixo}'target_id' deve ser um número inteiro.")
 
-def load_state():
-    """Carrega o estado do ciclo (quais posts e mídias ainda faltam) do arquivo STATE_FILE."""
-    if os.path.exists(STATE_FILE):
+    validas = aplicar(alvo, CAMPOS_DO_ALVO, erros, prefixo)
+
+    # Verificar se 'posts_per_day' corresponde ao número de 'scheduled_times'
+    if 'scheduled_times' in validas and alvo.get('posts_per_day') != len(alvo['scheduled_times']):
+        erros.append(f"{prefixo}'posts_per_day' deve corresponder ao número de horários em 'scheduled_times'.")
+
+    if alvo['postar_dias_da_semana'] is True:
+        if 'numero_de_dias_por_semana' not in alvo:
+            erros.append(f"{prefixo}'numero_de_dias_por_semana' deve ser definido quando "
+                         "'postar_dias_da_semana' está ativo.")
+        elif (not do_tipo(alvo['numero_de_dias_por_semana'], INTEIRO)
+              or not 1 <= alvo['numero_de_dias_por_semana'] <= 7):
+            erros.append(f"{prefixo}'numero_de_dias_por_semana' deve ser um inteiro entre 1 e 7.")
+
+    if 'dias_exatos' in validas:
         try:
-            with open(STATE_FILE, 'r', encoding='utf-8') as f:
-                return json.load(f)
-        except:
-            # Se houver qualquer problema para carregar, retorna estado vazio
-            return {}
-    else:
-        return {}
+            parse_dias_exatos(alvo['dias_exatos'])
+        except (ValueError, AttributeError) as e:
+            erros.append(f"{prefixo}Não foi possível interpretar dias_exatos: {e}")
 
-def save_state(state):
-    """Salva o estado atual no arquivo STATE_FILE."""
-    with open(STATE_FILE, 'w', encoding='utf-8') as f:
-        json.dump(state, f, ensure_ascii=False, indent=4)
+    # Cada álbum precisa de um tipo de mídia de 'pastas_midia' e de 2 a 10 mídias
+    if 'albuns' in validas and 'pastas_midia' in validas:
+        pastas = alvo['pastas_midia']
+        minimo, maximo = MIDIAS_POR_ALBUM
+        for tipo, album in alvo['albuns'].items():
+            if (not isinstance(album, dict) or album.get('midias') not in pastas
+                    or not do_tipo(album.get('quantidade'), INTEIRO)
+                    or not minimo <= album['quantidade'] <= maximo):
+                erros.append(f"{prefixo}O álbum '{tipo}' precisa de 'midias' (um tipo de 'pastas_midia') "
+                             f"e de 'quantidade' ({minimo} a {maximo}).")
+            if tipo in pastas:
+                erros.append(f"{prefixo}'{tipo}' não pode ser ao mesmo tempo um tipo de 'pastas_midia' e de 'albuns'.")
+
+    return alvo
 
 # -----------------------------------------------------------------------------
-# Função para carregar configurações do arquivo config.json
+# Esquema das chaves simples do nível principal do config.json
 # -----------------------------------------------------------------------------
-def carregar_config(config_path='config.json'):
+CAMPOS_DO_CONFIG = (
+    # Se test_mode não existir no JSON, definimos como False por padrão
+    campo('test_mode', BOOLEANO, False, "'test_mode' deve ser true ou false."),
+    # "log_level" é opcional: DEBUG, INFO (padrão), WARNING ou ERROR.
+    campo('log_level', TEXTO, 'INFO', f"'log_level' deve ser um destes: {', '.join(NIVEIS_DE_LOG)}.",
+          regra=lambda nivel: nivel in NIVEIS_DE_LOG),
+    # Métricas (opcionais): "metrics_port" liga o endpoint HTTP local
+    # (/metrics no formato do Prometheus e /metrics.json) e "metrics_file" grava
+    # um JSON a cada "metrics_interval_seconds" (padrão: 60).
+    campo('metrics_port', INTEIRO + NULO, None, "'metrics_port' deve ser um número de porta (1 a 65535).",
+          regra=lambda porta: porta is None or 0 < porta < 65536),
+    campo('metrics_file', TEXTO + NULO, None, "'metrics_file' deve ser o caminho de um arquivo."),
+    campo('metrics_interval_seconds', INTEIRO, 60, "'metrics_interval_seconds' deve ser um inteiro positivo.",
+          regra=lambda valor: valor > 0),
+    # "state_backend" é opcional: 'json' (padrão, state.json + journal) ou 'sqlite'.
+    campo('state_backend', TEXTO, 'json', "'state_backend' deve ser 'json' ou 'sqlite'.",
+          regra=lambda valor: valor in ('json', 'sqlite')),
+    # "reload_interval_seconds" é opcional: intervalo para verificar se posts.txt
+    # ou as pastas de mídia mudaram (padrão: 30 segundos).
+    campo('reload_interval_seconds', INTEIRO, 30, "'reload_interval_seconds' deve ser um inteiro positivo.",
+          regra=lambda valor: valor > 0),
+    # Limites de envio da conta: quantos envios ao mesmo tempo e o intervalo
+    # mínimo (segundos) entre o início de dois envios.
+    campo('max_concurrent_sends', INTEIRO, 3, "'max_concurrent_sends' deve ser um inteiro positivo.",
+          regra=lambda valor: valor > 0),
+    campo('min_send_interval_seconds', NUMERO, 1,
+          "'min_send_interval_seconds' deve ser um número maior ou igual a zero.",
+          regra=lambda valor: valor >= 0),
+    # "upload_workers" é opcional: partes aguardando resposta ao mesmo tempo no
+    # upload de arquivos acima de 10 MB (vídeos), na mesma conexão. Padrão: 4;
+    # 1 volta ao upload do Telethon, uma parte de cada vez.
+    campo('upload_workers', INTEIRO, 4, "'upload_workers' deve ser um inteiro positivo.",
+          regra=lambda valor: valor > 0),
+    # "media_dedup" é opcional: agrupa as mídias quase iguais (hash perceptual) num
+    # único item da rotação. "media_dedup_distance" é quantos bits (de 64) podem
+    # ser diferentes entre duas mídias do mesmo grupo (padrão: 6).
+    campo('media_dedup', BOOLEANO, False, "'media_dedup' deve ser true ou false."),
+    campo('media_dedup_distance', INTEIRO, DISTANCIA_PADRAO,
+          f"'media_dedup_distance' deve ser um inteiro de 0 a {DISTANCIA_MAXIMA}.",
+          regra=lambda valor: 0 <= valor <= DISTANCIA_MAXIMA),
+    # Fila de envios (fila.sqlite3): tentativas por post, espera inicial entre
+    # tentativas (dobra a cada falha) e horas de atraso após as quais o post é descartado.
+    *(campo(chave, INTEIRO, padrao, f"'{chave}' deve ser um inteiro positivo.", regra=lambda valor: valor > 0)
+      for chave, padrao in (('queue_max_attempts', 5), ('queue_retry_seconds', 60), ('queue_expire_hours', 24))),
+    # "transport" é opcional: 'telegram' (padrão) ou 'fake' (Telegram falso local,
+    # sem rede nem credenciais, configurado em "fake_transport").
+    campo('transport', TEXTO, 'telegram', "'transport' deve ser 'telegram' ou 'fake'.",
+          regra=lambda valor: valor in ('telegram', 'fake')),
+    campo('fake_transport', OBJETO, {}, "'fake_transport' deve ser um objeto (ex: {\"latency_ms\": 50})."),
+    # "accounts" é opcional: lista de contas (sessões) usadas para enviar. Cada conta
+    # herda api_id, api_hash e os limites de envio do nível principal e pode
+    # definir 'rate_per_minute' e 'burst' (token bucket). Sem ela, usa session_name.
+    campo('accounts', LISTA, [{'session': 'session_name'}],
+          "'accounts' deve ser uma lista com pelo menos uma conta.", regra=bool),
+)
+
+# -----------------------------------------------------------------------------
+# Funções para ler e validar o config.json. Todos os erros são juntados e
+# devolvidos de uma vez em ConfigInvalida; carregar_config mostra os erros e
+# encerra o programa, enquanto a recarga (SIGHUP) mantém o config anterior.
+# -----------------------------------------------------------------------------
+def ler_config(config_path='config.json', pasta=None):
+    """
+    Lê e valida o config.json. Com 'pasta', os caminhos relativos do config
+    passam a ser relativos a ela em vez do diretório atual (multibot.py).
+    """
     try:
         with open(config_path, 'r', encoding='utf-8') as f:
             config = json.load(f)
-            # Converter target_id para inteiro (sem aspas)
-            config['target_id'] = int(config['target_id'])
-
-            # Verificar se 'scheduled_times' é uma lista
-            if not isinstance(config.get('scheduled_times', []), list):
-                print("Erro: 'scheduled_times' deve ser uma lista de horários no formato 'HH:MM'.")
-                exit(1)
-
-            # Verificar se 'posts_per_day' corresponde ao número de 'scheduled_times'
-            if config.get('posts_per_day') != len(config.get('scheduled_times', [])):
-                print("Erro: 'posts_per_day' deve corresponder ao número de horários em 'scheduled_times'.")
-                exit(1)
-
-            # Verificar se 'variation_minutes' é um inteiro
-            if not isinstance(config.get('variation_minutes'), int):
-                print("Erro: 'variation_minutes' deve ser um número inteiro.")
-                exit(1)
-
-            # Se test_mode não existir no JSON, definimos como False por padrão
-            if 'test_mode' not in config:
-                config['test_mode'] = False
-
-            # -----------------------------------------------------------------------------
-            # Verificar e atribuir default para postar_dias_da_semana
-            # -----------------------------------------------------------------------------
-            if 'postar_dias_da_semana' in config:
-                if not isinstance(config['postar_dias_da_semana'], bool):
-                    print("Erro: 'postar_dias_da_semana' deve ser um valor booleano (true ou false).")
-                    exit(1)
-                if config['postar_dias_da_semana']:
-                    if 'numero_de_dias_por_semana' not in config:
-                        print("Erro: 'numero_de_dias_por_semana' deve ser definido quando 'postar_dias_da_semana' está ativo.")
-                        exit(1)
-                    if not isinstance(config['numero_de_dias_por_semana'], int) or not (1 <= config['numero_de_dias_por_semana'] <=7):
-                        print("Erro: 'numero_de_dias_por_semana' deve ser um inteiro entre 1 e 7.")
-                        exit(1)
-            else:
-                # Definir padrão se não existir
-                config['postar_dias_da_semana'] = False
-
-            # -----------------------------------------------------------------------------
-            # "dias_exatos" (novo) é opcional. Se existir, deve ser lista de strings.
-            # -----------------------------------------------------------------------------
-            if 'dias_exatos' in config:
-                if not isinstance(config['dias_exatos'], list):
-                    print("Erro: 'dias_exatos' deve ser uma lista de strings (ex: ['terca','quinta']).")
-                    exit(1)
-
-            return config
-
     except FileNotFoundError:
-        print(f"Erro: O arquivo {config_path} não foi encontrado.")
-        exit(1)
+        raise ConfigInvalida([f"O arquivo {config_path} não foi encontrado."])
     except json.JSONDecodeError:
-        print(f"Erro: O arquivo {config_path} não está em formato JSON válido.")
-        exit(1)
-    except ValueError:
-        print(f"Erro: 'target_id' deve ser um número inteiro.")
-        exit(1)
+        raise ConfigInvalida([f"O arquivo {config_path} não está em formato JSON válido."])
+    if not isinstance(config, dict):
+        raise ConfigInvalida([f"O arquivo {config_path} deve conter um objeto JSON."])
+    config = validar_config(config)
+    if pasta is not None:
+        resolver_caminhos(config, pasta)
+    return config
 
-# -----------------------------------------------------------------------------
-# Função para ler e parsear os posts do arquivo posts.txt, capturando o tipo
-# -----------------------------------------------------------------------------
-def carregar_posts(posts_path='posts.txt'):
+def resolver_caminhos(config, pasta):
+    """Junta 'pasta' aos caminhos relativos de um config já validado (os absolutos ficam como estão)."""
+    def resolver(caminho):
+        return os.path.normpath(os.path.join(pasta, caminho))
+
+    for alvo in config['targets']:
+        alvo['posts_path'] = resolver(alvo['posts_path'])
+        alvo['pastas_midia'] = {tipo: resolver(caminho) for tipo, caminho in alvo['pastas_midia'].items()}
+    # O arquivo de sessão (e o cache de uploads ao lado dele) também fica na pasta do bot
+    for conta in config['accounts']:
+        conta['session'] = resolver(conta['session'])
+    if config.get('metrics_file'):
+        config['metrics_file'] = resolver(config['metrics_file'])
+
+def validar_config(config):
+    erros = []
+    validas = aplicar(config, CAMPOS_DO_CONFIG, erros)
+    transporte_falso = config['transport'] == 'fake'
+
+    if 'accounts' in validas:
+        contas = config['accounts']
+        for posicao, conta in enumerate(contas):
+            if not isinstance(conta, dict) or not isinstance(conta.get('session'), str):
+                erros.append(f"A conta {posicao + 1} de 'accounts' deve ter uma 'session' (nome do arquivo de sessão).")
+                continue
+            for chave in ('rate_per_minute', 'burst'):
+                if chave in conta and (not do_tipo(conta[chave], NUMERO) or conta[chave] <= 0):
+                    erros.append(f"'{chave}' da conta '{conta['session']}' deve ser um número positivo.")
+            # O Telegram falso não precisa de credenciais
+            sem_credenciais = ('api_id' not in conta and 'api_id' not in config
+                               or 'api_hash' not in conta and 'api_hash' not in config)
+            if sem_credenciais and not transporte_falso:
+                erros.append(f"A conta '{conta['session']}' precisa de 'api_id' e 'api_hash'.")
+        sessoes = [conta['session'] for conta in contas if isinstance(conta, dict) and 'session' in conta]
+        if len(set(map(str, sessoes))) != len(sessoes):
+            erros.append("Cada conta de 'accounts' deve ter uma 'session' diferente.")
+
+    # -----------------------------------------------------------------------------
+    # "targets" é opcional: lista de canais/grupos, cada um com seus horários,
+    # regras de dias, posts e mídias. Sem ela, o próprio config é o único alvo.
+    # -----------------------------------------------------------------------------
+    if 'targets' in config:
+        alvos = []
+        if not isinstance(config['targets'], list) or not config['targets']:
+            erros.append("'targets' deve ser uma lista com pelo menos um alvo.")
+        else:
+            for posicao, alvo in enumerate(config['targets']):
+                if not isinstance(alvo, dict):
+                    erros.append(f"O alvo {posicao + 1} de 'targets' deve ser um objeto.")
+                    continue
+                combinado = {chave: copy.deepcopy(config[chave]) for chave in CHAVES_DO_ALVO
+                             if chave in config and chave != 'target_id'}
+                combinado.update(alvo)
+                combinado.setdefault('nome', str(combinado.get('target_id', posicao + 1)))
+                # Cada alvo tem a sua rotação dentro do mesmo arquivo de estado
+                combinado.setdefault('state_prefix', f"{combinado['nome']}:")
+                alvos.append(validar_alvo(combinado, erros, prefixo=f"[{combinado['nome']}] "))
+            nomes = [alvo['nome'] for alvo in alvos]
+            if len(set(nomes)) != len(nomes):
+                erros.append("Cada alvo de 'targets' deve ter um 'nome' diferente.")
+    else:
+        alvo = {chave: copy.deepcopy(config[chave]) for chave in CHAVES_DO_ALVO if chave in config}
+        alvo['nome'] = 'principal'
+        # Sem prefixo: mantém as chaves de estado que já existiam ('posts', 'midias_usuario', ...)
+        alvo['state_prefix'] = ''
+        alvos = [validar_alvo(alvo, erros)]
+
+    if erros:
+        raise ConfigInvalida(erros)
+    config['targets'] = alvos
+    return config
+
+def mostrar_erros(erros, config_path):
+    for erro in erros:
+        logger.error(erro)
+    if len(erros) > 1:
+        logger.error("%d erros em %s.", len(erros), config_path)
+
+def carregar_config(config_path='config.json'):
     try:
-        with open(posts_path, 'r', encoding='utf-8') as f:
-            conteudo = f.read()
-        # Expressão regular para capturar o tipo e o texto entre -- INICIO tipo e -- FIM
-        padrao = r'-- INICIO (\w+)\s*(.*?)\s*-- FIM'
-        matches = re.findall(padrao, conteudo, re.DOTALL)
-        posts = [(tipo.strip(), post.strip()) for tipo, post in matches]
-        if not posts:
-            print("Erro: Nenhum post encontrado no arquivo posts.txt.")
-            exit(1)
-        return posts
-    except FileNotFoundError:
-        print(f"Erro: O arquivo {posts_path} não foi encontrado.")
+        return ler_config(config_path)
+    except ConfigInvalida as e:
+        mostrar_erros(e.erros, config_path)
         exit(1)
 
 # -----------------------------------------------------------------------------
-# Função para listar mídias (imagens e vídeos) em uma pasta específica
+# Função para carregar os posts e as mídias no índice de conteúdo. O que
+# estiver faltando vira ConfigInvalida (a recarga do config não derruba o bot);
+# carregar_conteudo mostra os erros e encerra o programa.
 # -----------------------------------------------------------------------------
-def listar_imagens(pasta):
-    # Agora incluindo também vídeos .mp4 como mídia válida
-    extensoes_validas = (
-        '.jpg', '.jpeg', '.png', '.gif', '.bmp', 
-        '.webp', '.tiff', '.svg', '.heic', '.mp4'
-    )
+def indexar_conteudo(posts_path='posts.txt', pastas=tuple(PASTAS_POR_TIPO.values())):
+    indice = IndiceConteudo(posts_path, pastas)
     try:
-        arquivos = [
-            os.path.join(pasta, nome)
-            for nome in os.listdir(pasta)
-            if nome.lower().endswith(extensoes_validas)
-        ]
-        if not arquivos:
-            print(f"Erro: Nenhum arquivo de mídia válido encontrado na pasta '{pasta}'.")
-            exit(1)
-        return arquivos
-    except FileNotFoundError:
-        print(f"Erro: A pasta '{pasta}' não foi encontrada.")
+        indice.verificar()
+    except FileNotFoundError as e:
+        raise ConfigInvalida([f"O arquivo ou pasta '{e.filename}' não foi encontrado."])
+    erros = []
+    if not indice.posts:
+        erros.append(f"Nenhum post encontrado no arquivo {posts_path}.")
+    for pasta in pastas:
+        if not indice.midias[pasta]:
+            erros.append(f"Nenhum arquivo de mídia válido encontrado na pasta '{pasta}'.")
+    if erros:
+        raise ConfigInvalida(erros)
+    return indice
+
+def carregar_conteudo(posts_path='posts.txt', pastas=tuple(PASTAS_POR_TIPO.values())):
+    try:
+        return indexar_conteudo(posts_path, pastas)
+    except ConfigInvalida as e:
+        mostrar_erros(e.erros, posts_path)
         exit(1)
 
 # -----------------------------------------------------------------------------
 # Função para converter imagens .webp para .png
 # -----------------------------------------------------------------------------
 def converter_webp_para_png(caminho_imagem):
+    from PIL import Image
+
     try:
-        with Image.open(caminho_imagem) as img:
+        with METRICAS.cronometrar('conversao_webp'), Image.open(caminho_imagem) as img:
             # Cria um arquivo temporário para salvar a imagem convertida
             temp_file = tempfile.NamedTemporaryFile(delete=False, suffix='.png')
             img.convert('RGBA').save(temp_file.name, 'PNG')
             return temp_file.name
     except Exception as e:
-        print(f"Erro ao converter {caminho_imagem} para PNG: {e}")
+        logger.error("Erro ao converter %s para PNG: %s", caminho_imagem, e)
         return None
 
+# -----------------------------------------------------------------------------
+# Prepara a mídia para upload: usa a versão já convertida pelo PipelineMidia
+# quando existir; senão .webp vira .png temporário e o resto vai como está.
+# Devolve (arquivo, temporario) ou (None, False) se a conversão falhar.
+# -----------------------------------------------------------------------------
+def preparar_midia(caminho_midia, pipeline=None):
+    convertido = pipeline.obter(caminho_midia) if pipeline else None
+    if convertido:
+        return convertido, False
+
+    extensao = os.path.splitext(caminho_midia)[1].lower()
+    if extensao == '.webp':
+        convertido = converter_webp_para_png(caminho_midia)
+        if not convertido:
+            logger.error("Não foi possível converter a imagem .webp.")
+            return None, False
+        return convertido, True
+    return caminho_midia, False
+
+# -----------------------------------------------------------------------------
+# Id estável de um item quando a lista não vem do índice de conteúdo:
+# posts viram um hash curto do tipo + texto, mídias usam o próprio caminho.
+# -----------------------------------------------------------------------------
+def id_item(item):
+    if isinstance(item, (tuple, list)):
+        return id_post(*item)
+    return item
+
 # -----------------------------------------------------------------------------
 # Classe para selecionar itens aleatoriamente e ciclar indefinidamente,
 # sem repetir até completar o ciclo, e com persistência de estado.
+# O estado guarda só a permutação de ids e um cursor para o próximo item.
 # -----------------------------------------------------------------------------
 class SelecionadorAleatorio:
-    def __init__(self, itens, state_key):
+    def __init__(self, itens, state_key, estado, apelidos=None):
         """
-        :param itens: Lista completa de itens (posts ou mídias).
+        :param itens: Itens do ciclo: dicionário {id: item} ou lista (posts ou mídias).
         :param state_key: String para diferenciar o estado ('posts', 'midias_usuario', 'midias_revenda').
+        :param estado: EstadoRotacao compartilhado por todos os selecionadores.
+        :param apelidos: Mapa opcional id_antigo -> id_atual para aproveitar estados antigos.
         """
         self.state_key = state_key
-        self.itens_original = itens.copy()
-        
-        # Carrega o estado
-        self.state = load_state()
-        
-        # Se não existir algo no estado para essa key, cria um novo shuffle
-        if self.state_key not in self.state:
-            random.shuffle(self.itens_original)
-            self.state[self.state_key] = self.itens_original.copy()
-            save_state(self.state)
-        
-        # Aqui usamos a lista do estado como "itens atuais"
-        self.itens = self.state[self.state_key].copy()
+        self.estado = estado
+        self.itens_por_id = self._indexar(itens)
+
+        entrada = self.estado.obter(self.state_key)
+        if entrada is None:
+            # Se não existir algo no estado para essa key, cria um novo shuffle
+            self._novo_ciclo()
+            return
+
+        apelidos = apelidos or {}
+        if 'legado' in entrada:
+            # Estado no formato antigo (lista com os itens que faltavam, o próximo no fim):
+            # mantém o ciclo atual; os itens que não estão na lista já foram usados
+            restantes = [apelidos.get(id_item(item), id_item(item))
+                         for item in reversed(entrada['legado'])]
+            faltando = set(restantes)
+            consumidos = [item_id for item_id in self.itens_por_id if item_id not in faltando]
+            self.perm = consumidos + restantes
+            self.cursor = len(consumidos)
+        else:
+            self.perm = [apelidos.get(item_id, item_id) for item_id in entrada['perm']]
+            self.cursor = entrada['cursor']
+        # Itens adicionados ou removidos enquanto o bot estava parado
+        self._mesclar(forcar_gravacao='legado' in entrada or bool(apelidos))
+
+    @staticmethod
+    def _indexar(itens):
+        if isinstance(itens, dict):
+            # O índice de conteúdo troca o dicionário inteiro a cada mudança,
+            # então não é preciso copiar (catálogos grandes não ficam duplicados)
+            return itens
+        return {id_item(item): item for item in itens}
+
+    def _novo_ciclo(self, evitar=()):
+        self.perm = list(self.itens_por_id)
+        random.shuffle(self.perm)
+        if evitar:
+            # Itens que acabaram de sair (ex.: no mesmo álbum) vão para o fim do novo ciclo
+            evitar = set(evitar)
+            self.perm = ([item_id for item_id in self.perm if item_id not in evitar]
+                         + [item_id for item_id in self.perm if item_id in evitar])
+        self.cursor = 0
+        self.estado.definir_permutacao(self.state_key, self.perm, self.cursor)
+
+    def _mesclar(self, forcar_gravacao=False):
+        """
+        Ajusta o ciclo atual à lista de itens sem perder o progresso: ids que
+        sumiram saem da permutação e ids novos entram em posições aleatórias
+        da parte que ainda não foi usada.
+        """
+        vistos = set()
+        consumidos, restantes = [], []
+        for posicao, item_id in enumerate(self.perm):
+            if item_id not in self.itens_por_id or item_id in vistos:
+                continue
+            vistos.add(item_id)
+            (consumidos if posicao < self.cursor else restantes).append(item_id)
+        novos = [item_id for item_id in self.itens_por_id if item_id not in vistos]
+
+        mudou = len(consumidos) + len(restantes) != len(self.perm) or bool(novos)
+        if novos:
+            random.shuffle(novos)
+            total = len(restantes) + len(novos)
+            posicoes_novas = set(random.sample(range(total), len(novos)))
+            it_restantes, it_novos = iter(restantes), iter(novos)
+            restantes = [next(it_novos) if i in posicoes_novas else next(it_restantes)
+                         for i in range(total)]
+        self.perm = consumidos + restantes
+        self.cursor = len(consumidos)
+        if mudou or forcar_gravacao:
+            self.estado.definir_permutacao(self.state_key, self.perm, self.cursor)
+        return mudou
 
     def proximo(self):
         """
         Retorna o próximo item sem repetir até esgotar o ciclo.
         Quando esgota, inicia novo shuffle.
         """
-        # Se não houver mais itens no estado (ciclo acabou), reinicia
-        if not self.itens:
-            random.shuffle(self.itens_original)
-            self.itens = self.itens_original.copy()
-            # Atualiza o estado
-            self.state[self.state_key] = self.itens
-            save_state(self.state)
-
-        # Pega o último item
-        item = self.itens.pop()
-        # Atualiza a lista no estado com o item removido
-        self.state[self.state_key] = self.itens
-        save_state(self.state)
-
-        return item
+        return self.itens_por_id[self.proximo_id()]
+
+    def proximo_id(self):
+        """Igual a proximo(), mas devolve apenas o id do item."""
+        if not self.itens_por_id:
+            raise IndexError(f"Nenhum item disponível para '{self.state_key}'.")
+        # Se não houver mais itens no ciclo, reinicia
+        if self.cursor >= len(self.perm):
+            self._novo_ciclo()
+        item_id = self.perm[self.cursor]
+        self.cursor += 1
+        # Só o novo cursor é gravado, não a lista inteira
+        self.estado.avancar(self.state_key, self.cursor)
+        return item_id
+
+    def proximos(self, quantidade):
+        """
+        Retorna 'quantidade' itens diferentes de uma vez (ex.: as mídias de um álbum).
+        Se o ciclo fechar no meio, o novo ciclo começa pelos itens que não estão
+        no álbum: nenhum item se repete dentro do álbum e cada ciclo continua
+        passando por todos os itens uma única vez.
+        """
+        if not self.itens_por_id:
+            raise IndexError(f"Nenhum item disponível para '{self.state_key}'.")
+        ids = []
+        for _ in range(min(quantidade, len(self.itens_por_id))):
+            if self.cursor >= len(self.perm):
+                self._novo_ciclo(evitar=ids)
+            ids.append(self.perm[self.cursor])
+            self.cursor += 1
+        self.estado.avancar(self.state_key, self.cursor)
+        return [self.itens_por_id[item_id] for item_id in ids]
 
     def reset(self):
         """Se quiser reiniciar completamente o ciclo (não é obrigatório usar)."""
-        random.shuffle(self.itens_original)
-        self.itens = self.itens_original.copy()
-        self.state[self.state_key] = self.itens
-        save_state(self.state)
+        self._novo_ciclo()
 
     def set_itens(self, novos_itens):
         """
-        Se quiser trocar a lista original por uma nova (não é obrigatório usar).
+        Troca a lista de itens de forma incremental: o ciclo em andamento
+        continua, itens novos entram nele e itens removidos saem.
         """
-        self.itens_original = novos_itens.copy()
-        random.shuffle(self.itens_original)
-        self.itens = self.itens_original.copy()
-        self.state[self.state_key] = self.itens
-        save_state(self.state)
+        self.itens_por_id = self._indexar(novos_itens)
+        if self._mesclar():
+            logger.info("Rotação '%s' atualizada: %d itens.", self.state_key, len(self.itens_por_id))
 
 # -----------------------------------------------------------------------------
-# Função para parsear os nomes de dias exatos em formato CronTrigger (0 a 6)
+# Classe que representa um alvo (canal ou grupo) com seus próprios horários,
+# regras de dias, posts, pastas de mídia e estado de rotação.
 # -----------------------------------------------------------------------------
-def parse_dias_exatos(dias_lista):
+class Alvo:
+    def __init__(self, config_alvo, indice, estado):
+        """
+        :param config_alvo: Configuração já validada do alvo (um item de config['targets']).
+        :param indice: IndiceConteudo com os posts e as pastas de mídia do alvo.
+        :param estado: EstadoRotacao compartilhado; as chaves recebem o 'state_prefix' do alvo.
+        """
+        self.config = config_alvo
+        self.nome = config_alvo['nome']
+        self.target_id = config_alvo['target_id']
+        # Tipos de post enviados como álbum: tipo -> {'midias': tipo de mídia, 'quantidade': n}
+        self.albuns = config_alvo.get('albuns', {})
+        self.indice = indice
+        prefixo = config_alvo['state_prefix']
+
+        # Os selecionadores se inscrevem no índice para receber posts e mídias novos sem reiniciar o ciclo
+        self.selecionador_posts = self._criar_selecionador(indice.posts, f'{prefixo}posts', estado)
+        self._inscricoes = [('posts', self.selecionador_posts.set_itens)]
+        self.selecionadores_midias = {}
+        for tipo_midia, pasta in config_alvo['pastas_midia'].items():
+            selecionador = self._criar_selecionador(
+                indice.midias[pasta], f'{prefixo}midias_{tipo_midia}', estado,
+                apelidos=indice.apelidos_midias(pasta)
+            )
+            self._inscricoes.append((pasta, selecionador.set_itens))
+            self.selecionadores_midias[tipo_midia] = selecionador
+        for chave, callback in self._inscricoes:
+            indice.inscrever(chave, callback)
+
+    def desligar(self):
+        """Para de receber as atualizações do índice (alvo trocado na recarga do config)."""
+        for chave, callback in self._inscricoes:
+            self.indice.desinscrever(chave, callback)
+
+    def _criar_selecionador(self, itens, state_key, estado, apelidos=None):
+        """Selecionador do modo de rotação do alvo ('shuffle' ou 'weighted')."""
+        if self.config.get('rotation') == 'weighted':
+            return SelecionadorPonderado(itens, state_key, estado,
+                                         self.config['rotation_weights'], self.config['rotation_cooldown'])
+        return SelecionadorAleatorio(itens, state_key, estado, apelidos=apelidos)
+
+    def aplicar_engajamento(self, pontos_posts, pontos_midias):
+        """
+        Ajusta os pesos da rotação ponderada pelo engajamento médio
+        ({post_id: pontos} e {caminho_da_midia: pontos}).
+        """
+        if self.config.get('rotation') != 'weighted':
+            return
+        self.selecionador_posts.aplicar_engajamento(pontos_posts)
+        for tipo_midia, pasta in self.config['pastas_midia'].items():
+            ids = self.indice.apelidos_midias(pasta)
+            self.selecionadores_midias[tipo_midia].aplicar_engajamento(
+                {ids[caminho]: pontos for caminho, pontos in pontos_midias.items() if caminho in ids}
+            )
+
+    def selecionar(self):
+        """
+        Escolhe o próximo post (sem repetir até o ciclo fechar) e a mídia do tipo dele
+        (ou a lista de mídias, se o tipo for de álbum).
+        Devolve (post_id, tipo, texto, midia) ou None se não houver o que postar.
+        """
+        # O texto só é lido do posts.txt agora, a partir do offset guardado no índice
+        post = None
+        for _ in range(len(self.indice.posts) + 1):
+            post_id = self.selecionador_posts.proximo_id()
+            post = self.indice.ler_post(post_id)
+            if post is not None:
+                break
+        if post is None:
+            logger.error("[%s] Nenhum post disponível em %s.", self.nome, self.indice.posts_path)
+            return None
+        tipo, texto = post
+
+        album = self.albuns.get(tipo)
+        if album is not None:
+            midias = self.selecionadores_midias[album['midias']].proximos(album['quantidade'])
+            return post_id, tipo, texto, midias
+
+        # Selecionar a mídia correspondente ao tipo do post
+        if tipo not in self.selecionadores_midias:
+            logger.warning("[%s] Tipo de post inválido: %s. Pulando este post.", self.nome, tipo)
+            return None
+        return post_id, tipo, texto, self.selecionadores_midias[tipo].proximo()
+
+# -----------------------------------------------------------------------------
+# Função para criar os alvos do config. Alvos que usam os mesmos arquivos
+# compartilham um único índice de conteúdo (leitura e hash feitos uma vez só).
+# -----------------------------------------------------------------------------
+def criar_alvos(config, estado, indices=None):
+    """'indices' (chave_de_indice -> IndiceConteudo) evita ler de novo o que já foi indexado."""
+    if config['media_dedup']:
+        SIMILARES.ativar(config['media_dedup_distance'])
+    indices = dict(indices or {})
+    for chave in chaves_de_indice(config):
+        if chave not in indices:
+            indices[chave] = carregar_conteudo(*chave)
+    return [Alvo(config_alvo, indices[chave_de_indice(config_alvo)], estado) for config_alvo in config['targets']]
+
+def chave_de_indice(config_alvo):
+    """Alvos com o mesmo arquivo de posts e as mesmas pastas usam o mesmo índice."""
+    return config_alvo['posts_path'], tuple(sorted(set(config_alvo['pastas_midia'].values())))
+
+def chaves_de_indice(config):
+    return list(dict.fromkeys(chave_de_indice(config_alvo) for config_alvo in config['targets']))
+
+def indices_dos_alvos(alvos):
+    """Lista os índices de conteúdo distintos usados pelos alvos."""
+    return list({id(alvo.indice): alvo.indice for alvo in alvos}.values())
+
+# -----------------------------------------------------------------------------
+# Envia um post já selecionado usando a conta recebida do pool e devolve a
+# Entrega (todas as mensagens do post, a conta e o chat) para o histórico.
+# Erros (inclusive FloodWait) sobem para o pool decidir o que fazer; depois
+# que a primeira parte saiu, sobem como EnvioIncompleto (não dá para repetir).
+# -----------------------------------------------------------------------------
+async def enviar_post(gerenciador, alvo, post_id, post_selecionado, midia_selecionada, pipeline=None, preparar=None,
+                      registrar=None):
     """
-    Converte strings como 'segunda', 'terca', 'quarta', etc. 
-    em números (0=segunda, 1=terça, ... 6=domingo).
-    Se algum dia for inválido, levanta ValueError.
+    :param preparar: Função caminho -> (arquivo, temporario) usada no upload; por
+                     padrão, preparar_midia com o 'pipeline' (o modo rajada passa
+                     as mídias que já preparou).
+    :param registrar: Função Entrega -> None chamada antes da continuação do texto,
+                      com as mensagens que já saíram (a fila grava os ids).
     """
-    mapping = {
-        # Você pode expandir se quiser abreviações:
-        'seg': 0, 'segunda': 0, 'segunda-feira': 0,
-        'ter': 1, 'terca': 1, 'terça': 1, 'terça-feira': 1,
-        'qua': 2, 'quarta': 2, 'quarta-feira': 2,
-        'qui': 3, 'quinta': 3, 'quinta-feira': 3,
-        'sex': 4, 'sexta': 4, 'sexta-feira': 4,
-        'sab': 5, 'sábado': 5, 'sabado': 5,
-        'dom': 6, 'domingo': 6
-    }
-    result = []
-    for dia in dias_lista:
-        dia_lower = dia.strip().lower()
-        if dia_lower in mapping:
-            result.append(mapping[dia_lower])
-        else:
-            raise ValueError(f"Dia da semana inválido no config: '{dia}'")
-    # Remover duplicados e retornar
-    return list(set(result))
-
-# -----------------------------------------------------------------------------
-# Função principal para postar a mensagem com a imagem ou vídeo correspondente ao tipo
-# -----------------------------------------------------------------------------
-async def postar_mensagem(config, posts, midias_usuario, midias_revenda):
-    # Inicializar os selecionadores aleatórios se ainda não existirem
-    if not hasattr(postar_mensagem, "selecionador_posts"):
-        postar_mensagem.selecionador_posts = SelecionadorAleatorio(posts, 'posts')
-    if not hasattr(postar_mensagem, "selecionador_midias_usuario"):
-        postar_mensagem.selecionador_midias_usuario = SelecionadorAleatorio(midias_usuario, 'midias_usuario')
-    if not hasattr(postar_mensagem, "selecionador_midias_revenda"):
-        postar_mensagem.selecionador_midias_revenda = SelecionadorAleatorio(midias_revenda, 'midias_revenda')
-
-    # Selecionar um post aleatoriamente (sem repetir até ciclo fechar)
-    tipo, post_selecionado = postar_mensagem.selecionador_posts.proximo()
-
-    # Selecionar a mídia correspondente ao tipo do post
-    if tipo == 'usuario':
-        midia_selecionada = postar_mensagem.selecionador_midias_usuario.proximo()
-    elif tipo == 'revenda':
-        midia_selecionada = postar_mensagem.selecionador_midias_revenda.proximo()
-    else:
-        print(f"Tipo de post inválido: {tipo}. Pulando este post.")
-        return
+    from cache_midia import enviar_album, enviar_midia
+    from upload_paralelo import formatacao
 
-    print(f"Post selecionado: {post_selecionado[:50]}... (Tipo: {tipo})")
-    print(f"Mídia selecionada: {midia_selecionada}")
+    if preparar is None:
+        preparar = lambda caminho: preparar_midia(caminho, pipeline)
 
-    # Verificar o comprimento do post
-    if len(post_selecionado) > 1300:
-        enviar_com_midia = False
-        print("O post excede 1300 caracteres. Será enviado sem a imagem.")
-    else:
-        enviar_com_midia = True
-
-    extensao = os.path.splitext(midia_selecionada)[1].lower()
-
-    # Se for .webp, converter para .png
-    if enviar_com_midia and extensao == '.webp':
-        midia_para_enviar = converter_webp_para_png(midia_selecionada)
-        if not midia_para_enviar:
-            print("Erro: Não foi possível converter a imagem .webp.")
-            midia_para_enviar = None
-            enviar_com_midia = False
-    elif enviar_com_midia:
-        midia_para_enviar = midia_selecionada
-    else:
-        midia_para_enviar = None
+    # Verificar se a entidade (grupo ou canal) existe e está acessível.
+    # O cliente já está conectado e a entidade fica em cache após a primeira busca
+    # (cada conta tem o seu cache, pois o access_hash é diferente por conta).
+    entity = await gerenciador.obter_entidade(alvo.target_id)
 
-    # Inicializar o cliente Telethon
-    client = TelegramClient('session_name', config['api_id'], config['api_hash'])
+    # A legenda é medida como o Telegram mede (depois do markdown). Posts longos
+    # saem com a mídia e o começo do texto; o resto vem logo depois, como texto.
+    diagramacao = LEGENDAS.obter(post_id, post_selecionado, alvo.config['caption_limit'])
+    legenda = diagramacao.legenda
+    if diagramacao.continuacao:
+        logger.info("[%s] O post não cabe na legenda. O texto será dividido em %d mensagem(ns).",
+                    alvo.nome, len(diagramacao.continuacao) + 1)
 
+    # Enviar a mensagem (imagem ou vídeo) com a legenda ou apenas texto.
+    # A mídia passa pelo cache de uploads: se já foi enviada antes (inclusive
+    # para outro alvo), só a referência é reenviada.
+    if isinstance(midia_selecionada, list):
+        # Álbum: todas as mídias num único envio, com a legenda na primeira
+        mensagem = await enviar_album(
+            gerenciador, entity, midia_selecionada, legenda.texto,
+            preparar, legenda.entidades
+        )
+        if mensagem is not None:
+            logger.info("[%s] Álbum com %d mídias enviado com sucesso (conta '%s')!",
+                        alvo.nome, len(mensagem), gerenciador.session)
+    else:
+        mensagem = await enviar_midia(
+            gerenciador, entity, midia_selecionada, legenda.texto,
+            preparar, legenda.entidades
+        )
+        if mensagem is not None:
+            logger.info("[%s] Mensagem com mídia enviada com sucesso (conta '%s')!", alvo.nome, gerenciador.session)
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug(gerenciador.cache_midia.resumo())
+    mensagens = mensagem if isinstance(mensagem, list) else [mensagem]
+    continuacao = diagramacao.continuacao
+    if mensagem is None:
+        # Sem mídia: o post inteiro vai como texto, em mensagens de até 4096 caracteres
+        texto = LEGENDAS.obter(post_id, post_selecionado, LIMITE_MENSAGEM)
+        mensagem = await gerenciador.enviar(lambda client: client.send_message(
+            entity, texto.legenda.texto, **formatacao(texto.legenda.entidades)
+        ))
+        logger.info("[%s] Mensagem de texto enviada com sucesso (conta '%s')!", alvo.nome, gerenciador.session)
+        mensagens = [mensagem]
+        continuacao = texto.continuacao
+    if continuacao and registrar is not None:
+        registrar(Entrega(list(mensagens), gerenciador.session, alvo.target_id))
     try:
-        await client.start()
-        print("Cliente iniciado com sucesso.")
+        for parte in continuacao:
+            mensagens.append(await enviar_continuacao(gerenciador, entity, parte))
     except Exception as e:
-        print(f"Erro ao iniciar o cliente Telethon: {e}")
+        # A mídia já está no canal: repetir o post a mandaria de novo
+        raise EnvioIncompleto(Entrega(mensagens, gerenciador.session, alvo.target_id), e) from e
+    return Entrega(mensagens, gerenciador.session, alvo.target_id)
+
+async def enviar_continuacao(gerenciador, entity, parte):
+    """
+    Envia o resto do texto pela mesma conta, logo em seguida. A primeira parte
+    já saiu, então um FloodWait aqui é esperado nesta conta em vez de devolver
+    o post inteiro para o pool (o que repetiria a mídia).
+    """
+    from telethon.errors import FloodWaitError
+    from upload_paralelo import formatacao
+
+    while True:
+        try:
+            return await gerenciador.executar(lambda client: client.send_message(
+                entity, parte.texto, **formatacao(parte.entidades)
+            ))
+        except FloodWaitError as e:
+            gerenciador.estacionar(e.seconds)
+            await gerenciador.aguardar_liberacao()
+
+# -----------------------------------------------------------------------------
+# Função para planejar um post: escolhe o post e a mídia agora e grava na fila
+# de envios com o horário exato em que devem sair. A chave evita que o mesmo
+# horário seja planejado duas vezes.
+# -----------------------------------------------------------------------------
+def planejar_post(fila, alvo, executar_em, chave):
+    if fila.existe(chave):
+        logger.info("[%s] Envio '%s' já está na fila. Ignorando.", alvo.nome, chave)
         return
+    selecao = alvo.selecionar()
+    if selecao is None:
+        return
+    post_id, tipo, post_selecionado, midia_selecionada = selecao
 
-    # Verificar se a entidade (grupo ou canal) existe e está acessível
-    try:
-        entity = await client.get_entity(config['target_id'])
-        entity_name = (entity.title if hasattr(entity, 'title') 
-                       else (entity.username if hasattr(entity, 'username') 
-                             else 'Nome Desconhecido'))
-        print(f"Entidade encontrada: {entity_name}")
-    except Exception as e:
-        print(f"Erro ao encontrar a entidade: {e}")
-        await client.disconnect()
+    logger.debug("[%s] Post selecionado: %.50s... (Tipo: %s)", alvo.nome, post_selecionado, tipo)
+    logger.debug("[%s] Mídia selecionada: %s", alvo.nome, midia_selecionada)
+    fila.agendar(chave, alvo.nome, post_id, midia_selecionada, executar_em.timestamp())
+    logger.info("[%s] Post agendado para %s.", alvo.nome, executar_em.strftime('%d/%m %H:%M'))
+
+# -----------------------------------------------------------------------------
+# Função principal para postar a mensagem com a imagem ou vídeo correspondente ao tipo.
+# Chamada pela fila de envios; se der erro, a fila tenta de novo mais tarde.
+# -----------------------------------------------------------------------------
+async def postar_mensagem(alvo, pool, post_id, midia_selecionada, pipeline=None, registrar=None):
+    await alvo.indice.atualizar_posts()
+    post = alvo.indice.ler_post(post_id)
+    if post is None:
+        logger.warning("[%s] O post planejado foi removido de %s. Envio cancelado.", alvo.nome, alvo.indice.posts_path)
         return
+    tipo, post_selecionado = post
+    if isinstance(midia_selecionada, list):
+        midia_selecionada = completar_album(alvo, tipo, midia_selecionada)
+    elif not os.path.exists(midia_selecionada) and tipo in alvo.selecionadores_midias:
+        # A mídia planejada foi apagada da pasta: usa a próxima da rotação
+        midia_selecionada = alvo.selecionadores_midias[tipo].proximo()
 
-    # Enviar a mensagem (imagem ou vídeo) com a legenda ou apenas texto
-    try:
-        if enviar_com_midia and midia_para_enviar:
-            await client.send_file(
-                config['target_id'],
-                midia_para_enviar,
-                caption=post_selecionado  # Envia o conteúdo do post como legenda
-            )
-            print("Mensagem com mídia enviada com sucesso!")
+    logger.info("[%s] Enviando post: %.50s... (Tipo: %s)", alvo.nome, post_selecionado, tipo)
+
+    # O pool escolhe uma conta disponível; em FloodWait o post volta para a fila
+    return await pool.executar(lambda gerenciador: enviar_post(
+        gerenciador, alvo, post_id, post_selecionado, midia_selecionada, pipeline, registrar=registrar
+    ))
+
+def completar_album(alvo, tipo, midias):
+    """Troca as mídias do álbum que foram apagadas da pasta pelas próximas da rotação."""
+    existentes = [midia for midia in midias if os.path.exists(midia)]
+    album = alvo.albuns.get(tipo)
+    if album is not None and len(existentes) < len(midias):
+        for midia in alvo.selecionadores_midias[album['midias']].proximos(len(midias) - len(existentes)):
+            if midia not in existentes:
+                existentes.append(midia)
+    return existentes
+
+def criar_executor(alvos, pool, pipeline, fila):
+    """
+    Função usada pela fila para enviar cada envio planejado no alvo certo.
+    O alvo é procurado a cada envio: a recarga do config troca a lista 'alvos' no lugar.
+    As mensagens que já saíram ficam gravadas na fila antes da continuação do texto.
+    """
+    async def executar(envio):
+        alvo = next((alvo for alvo in alvos if alvo.nome == envio['alvo']), None)
+        if alvo is None:
+            logger.warning("Alvo '%s' não existe mais no config.json. Envio '%s' cancelado.", envio['alvo'], envio['chave'])
+            return
+        # A mensagem devolvida fica na fila para buscar o engajamento depois
+        return await postar_mensagem(alvo, pool, envio['post_id'], midia_do_envio(envio), pipeline,
+                                     registrar=lambda entrega: fila.registrar_mensagens(envio['id'], entrega))
+
+    return executar
+
+# -----------------------------------------------------------------------------
+# Inicia as tarefas que vigiam os arquivos de posts e as pastas de mídia
+# (polling de mtime). Mídias novas também entram na fila de conversão.
+# -----------------------------------------------------------------------------
+def vigiar_conteudo(config, indices, pipeline):
+    return [vigiar_indice(config, indice, indices, pipeline) for indice in indices]
+
+def vigiar_indice(config, indice, indices, pipeline):
+    """Vigia um índice; 'indices' é a lista (atual) de todos, usada na reconversão."""
+    def reconverter(_midias):
+        asyncio.ensure_future(pipeline.preparar(todas_as_midias(indices)))
+
+    for pasta in indice.pastas:
+        indice.inscrever(pasta, reconverter)
+    return asyncio.ensure_future(indice.vigiar(config['reload_interval_seconds']))
+
+# -----------------------------------------------------------------------------
+# Engajamento dos posts enviados: as visualizações e reações das mensagens dos
+# últimos dias são buscadas de tempos em tempos, gravadas na fila e usadas para
+# ajustar os pesos dos alvos com rotação ponderada.
+# -----------------------------------------------------------------------------
+def contar_reacoes(mensagem):
+    reacoes = getattr(mensagem, 'reactions', None)
+    if reacoes is None:
+        return 0
+    return sum(resultado.count for resultado in reacoes.results)
+
+async def buscar_mensagens(gerenciador, target_id, mensagem_ids):
+    entity = await gerenciador.obter_entidade(target_id)
+    return await gerenciador.executar(lambda client: client.get_messages(entity, ids=mensagem_ids))
+
+async def atualizar_engajamento(fila, alvos, pool, lote=100):
+    desde = time.time() - DIAS_DE_ENGAJAMENTO * 86400
+    for alvo in alvos:
+        if alvo.config.get('rotation') != 'weighted' or not alvo.config['engagement_refresh_minutes']:
+            continue
+        envios = fila.enviados_desde(alvo.nome, desde)
+        for inicio in range(0, len(envios), lote):
+            parte = envios[inicio:inicio + lote]
+            mensagens = await pool.executar(lambda gerenciador: buscar_mensagens(
+                gerenciador, alvo.target_id, [envio['mensagem_id'] for envio in parte]
+            ))
+            # Mensagens apagadas voltam como None e mantêm a última contagem
+            fila.registrar_engajamento([
+                (envio['id'], mensagem.views or 0, contar_reacoes(mensagem))
+                for envio, mensagem in zip(parte, mensagens) if mensagem is not None
+            ])
+        alvo.aplicar_engajamento(*fila.engajamento(alvo.nome, PESO_REACAO))
+        logger.info("[%s] Pesos da rotação atualizados com o engajamento de %d post(s).", alvo.nome, len(envios))
+
+async def vigiar_engajamento(fila, alvos, pool):
+    ponderados = [alvo for alvo in alvos
+                  if alvo.config.get('rotation') == 'weighted' and alvo.config['engagement_refresh_minutes']]
+    if not ponderados:
+        return
+    # Começa com o engajamento já gravado, sem esperar a primeira busca
+    for alvo in ponderados:
+        alvo.aplicar_engajamento(*fila.engajamento(alvo.nome, PESO_REACAO))
+    intervalo = min(alvo.config['engagement_refresh_minutes'] for alvo in ponderados) * 60
+    while True:
+        await asyncio.sleep(intervalo)
+        try:
+            await atualizar_engajamento(fila, ponderados, pool)
+        except Exception as e:
+            logger.error("Erro ao atualizar o engajamento dos posts: %s", e)
+
+def todas_as_midias(indices):
+    """Caminhos de todas as mídias de todos os índices, sem repetição."""
+    return list(dict.fromkeys(c for indice in indices for c in indice.todas_midias()))
+
+# -----------------------------------------------------------------------------
+# Inicia o endpoint HTTP e/ou a gravação periódica das métricas, se configurados.
+# Devolve as tarefas e servidores para serem encerrados no fim.
+# -----------------------------------------------------------------------------
+async def iniciar_metricas(config):
+    abertos = []
+    if config.get('metrics_port'):
+        try:
+            abertos.append(await servir_http(config['metrics_port']))
+        except OSError as e:
+            logger.error("Não foi possível abrir a porta %d das métricas: %s", config['metrics_port'], e)
+    if config.get('metrics_file'):
+        abertos.append(asyncio.create_task(
+            gravar_periodicamente(config['metrics_file'], config['metrics_interval_seconds'])
+        ))
+    return abertos
+
+def encerrar_metricas(abertos):
+    for aberto in abertos:
+        if isinstance(aberto, asyncio.Task):
+            aberto.cancel()
         else:
-            await client.send_message(
-                config['target_id'],
-                post_selecionado
-            )
-            print("Mensagem de texto enviada com sucesso!")
-    except Exception as e:
-        print(f"Erro ao enviar mensagem: {e}")
-    finally:
-        # Se a imagem foi convertida, remover o arquivo temporário
-        if enviar_com_midia and extensao == '.webp' and midia_para_enviar:
-            try:
-                os.remove(midia_para_enviar)
-            except Exception as e:
-                print(f"Erro ao remover arquivo temporário: {e}")
-        await client.disconnect()
+            aberto.close()
 
 # -----------------------------------------------------------------------------
-# Função para agendar os posts com base em horários específicos,
-# agora com a variação para mais ou para menos.
+# Função para agendar uma semana de posts de um alvo: os horários (já com a
+# variação sorteada) vêm do planejador e cada um vira um job de disparo único.
 # -----------------------------------------------------------------------------
-def agendar_posts(config, posts, midias_usuario, midias_revenda):
+def agendar_semana(scheduler, planejador, alvo, fila, segunda, prefixo=''):
+    """'prefixo' separa os jobs de cada bot quando vários usam o mesmo scheduler."""
+    from apscheduler.triggers.date import DateTrigger
+
+    agora = datetime.now()
+    horarios = planejador.semana(alvo.config, segunda)
+    agendados = 0
+    for item in horarios:
+        quando = datetime.fromisoformat(item['quando'])
+        if quando <= agora:
+            continue
+        # Mesma chave usada na fila: o mesmo horário nunca gera dois posts
+        chave = f"{alvo.nome}:{item['data']}:{item['slot']}"
+        scheduler.add_job(
+            disparar_post,
+            trigger=DateTrigger(run_date=quando),
+            args=[fila, alvo, quando, chave],
+            id=prefixo + chave,
+            replace_existing=True,
+            # Com o loop ocupado (gravação em disco, hash, reindexação) o disparo atrasa;
+            # ele ainda vale enquanto a fila aceitaria o envio, e só uma vez
+            misfire_grace_time=int(fila.expira_em_horas * 3600),
+            coalesce=True,
+            name=f"[{alvo.nome}] Post {item['data']} {item['slot']} ±{alvo.config['variation_minutes']} min"
+        )
+        agendados += 1
+    dias = sorted({datetime.fromisoformat(item['quando']).weekday() for item in horarios})
+    logger.info("[%s] Semana de %s: %d post(s) agendado(s) (dias: %s).", alvo.nome,
+                segunda.strftime('%d/%m'), agendados, ', '.join(NOMES_DIAS[d] for d in dias))
+
+def enfileirar_atrasados(planejador, alvo, fila, segunda):
+    """
+    Horários do plano gravado que passaram com o bot desligado (depois de o plano
+    ser sorteado e há menos de 'queue_expire_hours') e que não estão na fila:
+    o post é escolhido agora e sai logo, pela fila. Devolve quantos entraram.
+    """
+    planejado_em = planejador.planejado_em(alvo.config, segunda)
+    if planejado_em is None:
+        return 0
+    agora = datetime.now()
+    limite = agora - timedelta(hours=fila.expira_em_horas)
+    atrasados = 0
+    for item in planejador.prever(alvo.config, segunda):
+        quando = datetime.fromisoformat(item['quando'])
+        chave = f"{alvo.nome}:{item['data']}:{item['slot']}"
+        if max(planejado_em, limite) < quando <= agora and not fila.existe(chave):
+            planejar_post(fila, alvo, quando, chave)
+            atrasados += 1
+    if atrasados:
+        logger.warning("[%s] %d horário(s) da semana de %s passaram com o bot desligado; "
+                       "os posts entraram na fila.", alvo.nome, atrasados, segunda.strftime('%d/%m'))
+    return atrasados
+
+async def disparar_post(fila, alvo, quando, chave):
+    # Roda no loop de eventos (a fila não pode ser usada de outra thread)
+    await alvo.indice.atualizar_posts()
+    planejar_post(fila, alvo, quando, chave)
+
+# -----------------------------------------------------------------------------
+# Função para agendar as semanas de todos os alvos. A semana atual e a próxima
+# ficam sempre agendadas; toda segunda-feira a semana seguinte é planejada
+# (com um novo sorteio de dias, quando for o caso).
+# -----------------------------------------------------------------------------
+def agendar_alvos(scheduler, planejador, alvos, fila, prefixo=''):
+    from apscheduler.triggers.cron import CronTrigger
+
+    def planejar_semanas():
+        segunda = inicio_da_semana(date.today())
+        planejador.limpar(segunda)
+        for alvo in alvos:
+            # Horários já passados (bot desligado) da semana anterior e da atual
+            for semana in (segunda - timedelta(weeks=1), segunda):
+                enfileirar_atrasados(planejador, alvo, fila, semana)
+            for semana in (segunda, segunda + timedelta(weeks=1)):
+                agendar_semana(scheduler, planejador, alvo, fila, semana, prefixo)
+
+    async def replanejar():
+        for indice in indices_dos_alvos(alvos):
+            await indice.atualizar_posts()
+        planejar_semanas()
+
+    planejar_semanas()
+    scheduler.add_job(
+        replanejar,
+        trigger=CronTrigger(day_of_week='mon', hour=0, minute=0),
+        id=prefixo + 'planejamento_semanal',
+        replace_existing=True,
+        misfire_grace_time=3600,
+        coalesce=True,
+        name="Planejamento semanal dos posts"
+    )
+
+def criar_scheduler():
+    """Scheduler dos posts, com aviso no log quando um job perde o horário."""
+    from apscheduler.events import EVENT_JOB_MISSED
+    from apscheduler.schedulers.asyncio import AsyncIOScheduler
+
+    def avisar_perdido(evento):
+        logger.warning("O job '%s' perdeu o horário (%s) e não foi executado; um post perdido volta "
+                       "para a fila no próximo início ou planejamento semanal.",
+                       evento.job_id, evento.scheduled_run_time.strftime('%d/%m %H:%M'))
+
     scheduler = AsyncIOScheduler()
+    scheduler.add_listener(avisar_perdido, EVENT_JOB_MISSED)
+    return scheduler
 
-    def parse_time(time_str):
-        """Converte uma string de horário 'HH:MM' para hora e minuto inteiros."""
-        try:
-            hora, minuto = map(int, time_str.split(':'))
-            return hora, minuto
-        except ValueError:
-            print(f"Erro: Horário '{time_str}' está no formato inválido. Use 'HH:MM'.")
-            exit(1)
+def desagendar_alvo(scheduler, nome, prefixo=''):
+    """Remove os jobs de post de um alvo (alvo removido ou alterado na recarga do config)."""
+    for job in scheduler.get_jobs():
+        if job.id.startswith(f"{prefixo}{nome}:"):
+            job.remove()
 
-    postar_dias = config.get('postar_dias_da_semana', False)
+# -----------------------------------------------------------------------------
+# Chaves do config.json que só valem depois de reiniciar o bot: a recarga
+# (SIGHUP) não desconecta as contas nem reabre o estado, a fila e as métricas.
+# -----------------------------------------------------------------------------
+CHAVES_SO_NO_INICIO = (
+    'test_mode', 'api_id', 'api_hash', 'accounts', 'transport', 'fake_transport', 'state_backend',
+    'max_concurrent_sends', 'min_send_interval_seconds', 'upload_workers',
+    'queue_max_attempts', 'queue_retry_seconds', 'queue_expire_hours',
+    'metrics_port', 'metrics_file', 'metrics_interval_seconds',
+    'reload_interval_seconds', 'media_dedup', 'media_dedup_distance',
+)
+# Segundos que o encerramento espera os envios já iniciados terminarem
+ESPERA_NO_ENCERRAMENTO = 60
 
-    # -----------------------------------------------------------------------------
-    # Se postar_dias_da_semana = True, definimos a lista de dias_selecionados
-    # -----------------------------------------------------------------------------
-    if postar_dias:
-        # Se dias_exatos estiver definido e não for vazio, usamos ele;
-        # caso contrário, sorteamos aleatoriamente numero_de_dias_por_semana
-        dias_exatos = config.get('dias_exatos', [])
-        if dias_exatos:
-            # Converter para índices 0..6
+# -----------------------------------------------------------------------------
+# Serviço de agendamento (modo daemon): todos os alvos num único scheduler e
+# num único pool de contas. Jobs de alvos diferentes no mesmo horário rodam ao
+# mesmo tempo (os limites de envio ficam em cada conta).
+# SIGTERM/SIGINT: para de planejar, espera os envios em andamento e encerra
+# gravando o estado e a fila. SIGHUP: relê o config.json sem desconectar.
+# O multibot.py roda vários serviços (um por pasta de bot) com iniciar() e
+# concluir(), dividindo o scheduler, as contas e a conversão das mídias.
+# -----------------------------------------------------------------------------
+class Servico:
+    def __init__(self, config_path, config, estado, alvos, fila, pasta=None, prefixo='', nivel_de_log=True):
+        """
+        :param config_path: Caminho do config.json (relido no SIGHUP).
+        :param config: Config já validado.
+        :param estado: EstadoRotacao compartilhado pelos alvos.
+        :param alvos: Alvos criados com criar_alvos; a lista é trocada no lugar na recarga.
+        :param fila: FilaEnvios aberta.
+        :param pasta: Pasta do bot (caminhos relativos do config e plano.json); None = diretório atual.
+        :param prefixo: Prefixo dos ids dos jobs no scheduler (compartilhado com outros bots).
+        :param nivel_de_log: Se o "log_level" do config vale para o processo na recarga.
+        """
+        self.config_path = config_path
+        self.config = config
+        self.estado = estado
+        self.alvos = alvos
+        self.fila = fila
+        self.pasta = pasta
+        self.prefixo = prefixo
+        self.nivel_de_log = nivel_de_log
+        self.indices = {chave_de_indice(alvo.config): alvo.indice for alvo in alvos}
+        # Lista de todos os índices usada na reconversão das mídias (também trocada no lugar)
+        self._lista_indices = list(self.indices.values())
+        self._vigias = {}
+        self._tarefas = []
+        self._parar = None
+        self._recarga = None
+
+    def parar(self):
+        if not self._parar.is_set():
+            logger.info("Encerrando: aguardando os envios em andamento...")
+            self._parar.set()
+
+    def _instalar_sinais(self):
+        loop = asyncio.get_running_loop()
+        sinais = [(signal.SIGTERM, self.parar), (signal.SIGINT, self.parar)]
+        if hasattr(signal, 'SIGHUP'):
+            sinais.append((signal.SIGHUP, lambda: asyncio.ensure_future(self.recarregar())))
+        for sinal, acao in sinais:
             try:
-                dias_selecionados = parse_dias_exatos(dias_exatos)
-            except ValueError as e:
-                print(f"Erro ao interpretar dias_exatos: {e}")
-                exit(1)
-            print(f"Dias exatos definidos no config: {dias_exatos} (índices: {dias_selecionados})")
-        else:
-            numero_dias_semana = config.get('numero_de_dias_por_semana', 7)
-            dias_disponiveis = list(range(0,7))  # 0=segunda, 6=domingo
-            dias_selecionados = random.sample(dias_disponiveis, numero_dias_semana)
-            nomes_dias = ["Seg", "Ter", "Qua", "Qui", "Sex", "Sab", "Dom"]
-            print("Dias selecionados aleatoriamente para postar esta semana: " +
-                  ", ".join(nomes_dias[d] for d in dias_selecionados))
-    else:
-        # Se postar_dias_da_semana = False, iremos postar todos os dias (0..6)
-        dias_selecionados = list(range(0,7))
-
-    # Wrapper que será chamado no horário programado
-    async def job_wrapper(hora_programada, minuto_programado):
-        # Valor total em minutos do horário programado
-        total_scheduled_minutes = hora_programada * 60 + minuto_programado
-
-        # Define o intervalo de variação (tanto para mais quanto para menos).
-        variation = config['variation_minutes']
-
-        # Cálculo do horário "mais cedo" possível (earliest_minutes)
-        earliest_minutes = total_scheduled_minutes - variation
-        if earliest_minutes < 0:
-            earliest_minutes = 0
-
-        # Quanto de atraso aleatório iremos aplicar (0 até variation*2)
-        max_delay = variation * 2
-        random_delay = random.randint(0, max_delay)
-
-        print(f"[DEBUG] Horário base: {hora_programada:02d}:{minuto_programado:02d}")
-        print(f"[DEBUG] Horário 'earliest' (minutos absolutos): {earliest_minutes}")
-        print(f"[DEBUG] Variação ±{variation} min => delay sorteado: {random_delay} min")
-
-        # Aguarda o delay sorteado para efetivamente postar
-        await asyncio.sleep(random_delay * 60)
-
-        # Finalmente, chama a função que posta
-        await postar_mensagem(config, posts, midias_usuario, midias_revenda)
-
-    # Para cada horário em scheduled_times, cria um job no scheduler
-    for scheduled_time in config['scheduled_times']:
-        hora, minuto = parse_time(scheduled_time)
-        variation = config['variation_minutes']
-        total_scheduled_minutes = hora * 60 + minuto
-        earliest_minutes = total_scheduled_minutes - variation
-        if earliest_minutes < 0:
-            earliest_minutes = 0
-        hour_earliest = earliest_minutes // 60
-        minute_earliest = earliest_minutes % 60
-
-        if postar_dias:
-            # Agendar apenas para os dias 'dias_selecionados'
-            for dia in dias_selecionados:
-                trigger = CronTrigger(day_of_week=dia, hour=hour_earliest, minute=minute_earliest)
-                scheduler.add_job(
-                    job_wrapper,
-                    trigger=trigger,
-                    args=[hora, minuto],
-                    name=f"Post semanal (var. ±{variation}) - {scheduled_time} - Dia {dia}"
-                )
-                print(f"Agendado: Post no dia {dia} (0=Seg,...,6=Dom) às {scheduled_time} ±{variation} min.")
-        else:
-            # Usamos CronTrigger para disparar diariamente
-            trigger = CronTrigger(hour=hour_earliest, minute=minute_earliest)
-            scheduler.add_job(
-                job_wrapper,
-                trigger=trigger,
-                args=[hora, minuto],
-                name=f"Post diário (var. ±{variation}) - {scheduled_time}"
-            )
-            print(f"Agendado: Post diário em torno de {scheduled_time} (±{variation} min).")
+                loop.add_signal_handler(sinal, acao)
+            except (NotImplementedError, RuntimeError):
+                # Windows: só o Ctrl+C (KeyboardInterrupt), sem recarga por sinal
+                pass
 
-    # Iniciar o scheduler
-    scheduler.start()
-    print("Scheduler iniciado e funcionando. Aguarde os horários para postar...")
+    def _vigiar(self, chave, indice):
+        self._vigias[chave] = vigiar_indice(self.config, indice, self._lista_indices, self.pipeline)
 
-    # Manter o loop rodando
-    try:
-        asyncio.get_event_loop().run_forever()
-    except (KeyboardInterrupt, SystemExit):
-        pass
+    async def iniciar(self, scheduler, pool, pipeline):
+        """
+        Agenda os alvos em 'scheduler' (que quem chamou inicia), conecta o 'pool'
+        e começa a vigiar o conteúdo e a drenar a fila.
+        """
+        self._recarga = asyncio.Lock()
+        self.scheduler = scheduler
+        self.pool = pool
+        self.pipeline = pipeline
+        self.planejador = Planejador(os.path.join(self.pasta or '', PLANO_FILE))
+
+        # Horários da semana já sorteados e gravados em plano.json
+        agendar_alvos(self.scheduler, self.planejador, self.alvos, self.fila, self.prefixo)
+
+        # Conectar as contas uma vez antes de iniciar o scheduler
+        await self.pool.iniciar()
+
+        # Converter as mídias em segundo plano enquanto o scheduler já está rodando
+        self._tarefas = [asyncio.create_task(self.pipeline.preparar(todas_as_midias(self._lista_indices)))]
+
+        # Recarregar posts e pastas de mídia quando mudarem, sem reiniciar o bot
+        for chave, indice in self.indices.items():
+            self._vigiar(chave, indice)
+
+        # Os jobs só gravam os posts na fila; quem envia (e tenta de novo) é o trabalhador da fila.
+        # Posts que estavam pendentes quando o bot parou são enviados agora.
+        self.fila.recuperar()
+        self._trabalhador = asyncio.create_task(
+            self.fila.trabalhar(criar_executor(self.alvos, self.pool, self.pipeline, self.fila)))
+        # Pesos da rotação ponderada ajustados pelas visualizações e reações
+        self._engajamento = asyncio.create_task(vigiar_engajamento(self.fila, self.alvos, self.pool))
+
+    async def concluir(self):
+        """
+        Chamado depois de parar o scheduler: nada novo começa a ser enviado, o
+        que já saiu termina (até ESPERA_NO_ENCERRAMENTO) e as tarefas são canceladas.
+        O pool e o pipeline ficam para quem os criou.
+        """
+        self._trabalhador.cancel()
+        restantes = await self.fila.concluir_em_andamento(ESPERA_NO_ENCERRAMENTO)
+        if restantes:
+            logger.warning("%d envio(s) não terminaram a tempo e ficam como incertos na fila.", restantes)
+        for tarefa in [*self._tarefas, self._engajamento, *self._vigias.values()]:
+            tarefa.cancel()
+
+    async def executar(self):
+        from contas import PoolContas
+
+        self._parar = asyncio.Event()
+        # Um único pool de contas conectado para todos os jobs do scheduler e as
+        # mídias convertidas uma única vez e guardadas em disco
+        scheduler = criar_scheduler()
+        await self.iniciar(scheduler, PoolContas.do_config(self.config), PipelineMidia())
+        metricas = await iniciar_metricas(self.config)
+        self._instalar_sinais()
+
+        scheduler.start()
+        logger.info("Scheduler iniciado e funcionando. Aguarde os horários para postar...")
+        try:
+            await self._parar.wait()
+        finally:
+            # Nada novo é planejado nem começa a ser enviado; o que já saiu termina
+            scheduler.shutdown(wait=False)
+            await self.concluir()
+            encerrar_metricas(metricas)
+            if self.config.get('metrics_file'):
+                gravar_metricas(self.config['metrics_file'])
+            self.pipeline.encerrar()
+            await self.pool.encerrar()
+            logger.info("Bot encerrado.")
+
+    async def recarregar(self):
+        """Relê o config.json e aplica as mudanças dos alvos; se houver erro, mantém o config atual."""
+        async with self._recarga:
+            logger.info("Recarregando %s...", self.config_path)
+            try:
+                novo = await asyncio.to_thread(ler_config, self.config_path, self.pasta)
+                # Índices novos (outro posts_path ou outras pastas) são lidos fora do loop
+                for chave in chaves_de_indice(novo):
+                    if chave not in self.indices:
+                        self.indices[chave] = await asyncio.to_thread(indexar_conteudo, *chave)
+            except ConfigInvalida as e:
+                mostrar_erros(e.erros, self.config_path)
+                logger.error("O config não foi recarregado; o atual continua valendo.")
+                return
+            self._aplicar(novo)
+
+    def _aplicar(self, novo):
+        if self.nivel_de_log:
+            logging.getLogger().setLevel(novo['log_level'])
+        ignoradas = [chave for chave in CHAVES_SO_NO_INICIO if novo.get(chave) != self.config.get(chave)]
+        if ignoradas:
+            logger.warning("Estas mudanças só valem depois de reiniciar o bot: %s.", ', '.join(ignoradas))
+
+        atuais = {alvo.nome: alvo for alvo in self.alvos}
+        alvos = []
+        for config_alvo in novo['targets']:
+            atual = atuais.pop(config_alvo['nome'], None)
+            if atual is not None and atual.config == config_alvo:
+                # Alvo sem mudanças: mantém o selecionador e os jobs já agendados
+                alvos.append(atual)
+                continue
+            if atual is not None:
+                atual.desligar()
+                desagendar_alvo(self.scheduler, atual.nome, self.prefixo)
+            alvo = Alvo(config_alvo, self.indices[chave_de_indice(config_alvo)], self.estado)
+            segunda = inicio_da_semana(date.today())
+            for semana in (segunda, segunda + timedelta(weeks=1)):
+                agendar_semana(self.scheduler, self.planejador, alvo, self.fila, semana, self.prefixo)
+            logger.info("[%s] Alvo %s.", alvo.nome, 'atualizado' if atual is not None else 'adicionado')
+            alvos.append(alvo)
+        for removido in atuais.values():
+            removido.desligar()
+            desagendar_alvo(self.scheduler, removido.nome, self.prefixo)
+            logger.info("[%s] Alvo removido; os envios que já estavam na fila serão cancelados.", removido.nome)
+        # Trocados no lugar: o executor da fila e o planejamento semanal usam estas listas
+        self.alvos[:] = alvos
+
+        # Índices que nenhum alvo usa mais deixam de ser vigiados
+        usados = set(chaves_de_indice(novo))
+        for chave in [chave for chave in self.indices if chave not in usados]:
+            del self.indices[chave]
+            vigia = self._vigias.pop(chave, None)
+            if vigia is not None:
+                vigia.cancel()
+        self._lista_indices[:] = self.indices.values()
+        for chave, indice in self.indices.items():
+            if chave not in self._vigias:
+                self._vigiar(chave, indice)
+
+        # Os alvos com rotação ponderada podem ter mudado
+        self._engajamento.cancel()
+        self._engajamento = asyncio.create_task(vigiar_engajamento(self.fila, self.alvos, self.pool))
+        self.config = dict(novo, **{chave: self.config.get(chave) for chave in CHAVES_SO_NO_INICIO})
+        logger.info("Config recarregado: %d alvo(s).", len(self.alvos))
 
 # -----------------------------------------------------------------------------
-# Função para modo de teste: enviar posts a cada 10 segundos
+# Função para modo de teste: enviar posts a cada 10 segundos (para todos os alvos ao mesmo tempo).
+# Com 'rodadas', para depois dessa quantidade de posts por alvo (usado pelo benchmark).
 # -----------------------------------------------------------------------------
-async def modo_teste(config, posts, midias_usuario, midias_revenda):
-    while True:
-        await postar_mensagem(config, posts, midias_usuario, midias_revenda)
-        # Intervalo de 10 segundos entre cada post no modo de teste
-        await asyncio.sleep(10)
+async def modo_teste(config, alvos, fila, intervalo=10, rodadas=None):
+    from contas import PoolContas
+
+    # As contas são iniciadas uma vez e reaproveitadas em todos os posts de teste
+    pool = PoolContas.do_config(config)
+    await pool.iniciar()
+    metricas = await iniciar_metricas(config)
+    pipeline = PipelineMidia()
+    indices = indices_dos_alvos(alvos)
+    # Enquanto a conversão não termina, as mídias são convertidas na hora como antes
+    conversao = asyncio.create_task(pipeline.preparar(todas_as_midias(indices)))
+    vigias = vigiar_conteudo(config, indices, pipeline)
+    fila.recuperar()
+    trabalhador = asyncio.create_task(fila.trabalhar(criar_executor(alvos, pool, pipeline, fila)))
+    engajamento = asyncio.create_task(vigiar_engajamento(fila, alvos, pool))
+    try:
+        rodada = 0
+        while rodadas is None or rodada < rodadas:
+            # Os posts de teste também passam pela fila, para serem enviados na hora
+            agora = datetime.now()
+            for alvo in alvos:
+                await alvo.indice.atualizar_posts()
+                planejar_post(fila, alvo, agora, f"{alvo.nome}:teste:{agora:%Y-%m-%d %H:%M:%S.%f}")
+            rodada += 1
+            # Intervalo de 10 segundos entre cada post no modo de teste
+            await asyncio.sleep(intervalo)
+        await fila.aguardar_envios()
+    finally:
+        encerrar_metricas(metricas)
+        trabalhador.cancel()
+        engajamento.cancel()
+        conversao.cancel()
+        for vigia in vigias:
+            vigia.cancel()
+        pipeline.encerrar()
+        await pool.encerrar()
 
 # -----------------------------------------------------------------------------
 # Função principal que coordena o fluxo do programa
 # -----------------------------------------------------------------------------
 def main():
-    config = carregar_config()
-    posts = carregar_posts()
-    midias_usuario = listar_imagens('imagens_usuario')
-    midias_revenda = listar_imagens('imagens_revenda')
-
-    if not posts:
-        print("Erro: Nenhum post encontrado no arquivo posts.txt.")
-        return
+    parser = argparse.ArgumentParser(description="Posta os posts e as mídias nos canais/grupos do config.json.")
+    parser.add_argument('--config', default='config.json', help="Arquivo de configuração (padrão: config.json).")
+    parser.add_argument('--check', action='store_true',
+                        help="Só valida o config.json, os posts e as pastas de mídia, e sai.")
+    parser.add_argument('--pid-file', help="Grava o PID do processo neste arquivo (para kill -HUP / -TERM).")
+    parser.add_argument('--rajada', type=int, metavar='N',
+                        help="Envia N posts para cada alvo o mais rápido possível (backfill) e sai.")
+    parser.add_argument('--rajada-trabalhadores', type=int, default=4, metavar='N',
+                        help="Posts preparados ao mesmo tempo no modo rajada (padrão: 4).")
+    parser.add_argument('--rajada-por-minuto', type=float, metavar='N',
+                        help="Limite geral de envios por minuto no modo rajada (além do limite de cada conta).")
+    args = parser.parse_args()
 
-    if not midias_usuario:
-        print("Erro: Nenhuma mídia encontrada na pasta 'imagens_usuario'.")
+    # Nível INFO até ler o config.json; depois vale o "log_level"
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(name)s: %(message)s')
+    config = carregar_config(args.config)
+    logging.getLogger().setLevel(config['log_level'])
+    if args.check:
+        for chave in chaves_de_indice(config):
+            carregar_conteudo(*chave)
+        logger.info("Config válido: %d alvo(s).", len(config['targets']))
         return
+    # Um único estado compartilhado por todos os alvos e selecionadores
+    estado = abrir_estado(config)
+    alvos = criar_alvos(config, estado)
+    # Fila persistente dos posts planejados (sobrevive a reinícios)
+    fila = abrir_fila(config)
+    if args.pid_file:
+        with open(args.pid_file, 'w') as f:
+            f.write(f"{os.getpid()}\n")
 
-    if not midias_revenda:
-        print("Erro: Nenhuma mídia encontrada na pasta 'imagens_revenda'.")
-        return
+    codigo_de_saida = 0
+    try:
+        if args.rajada:
+            from rajada import executar_rajada
 
-    # Se test_mode estiver ativo, executa o modo de teste
-    if config.get('test_mode', False):
-        print("Modo de teste ativado. Enviaremos posts a cada 10 segundos, indefinidamente.")
-        try:
-            asyncio.run(modo_teste(config, posts, midias_usuario, midias_revenda))
-        except (KeyboardInterrupt, SystemExit):
-            print("Bot interrompido pelo usuário.")
-    else:
-        # Caso contrário, segue a lógica de agendamento
-        agendar_posts(config, posts, midias_usuario, midias_revenda)
+            try:
+                relatorio = asyncio.run(executar_rajada(config, alvos, fila, args.rajada, args.rajada_trabalhadores,
+                                                        por_minuto=args.rajada_por_minuto))
+                # Rajada incompleta: quem chamou (script, cron) fica sabendo pelo código de saída
+                codigo_de_saida = 1 if relatorio['falhas'] else 0
+            except KeyboardInterrupt:
+                logger.info("Rajada interrompida pelo usuário.")
+        # Se test_mode estiver ativo, executa o modo de teste
+        elif config.get('test_mode', False):
+            logger.info("Modo de teste ativado. Enviaremos posts a cada 10 segundos, indefinidamente.")
+            try:
+                asyncio.run(modo_teste(config, alvos, fila))
+            except (KeyboardInterrupt, SystemExit):
+                logger.info("Bot interrompido pelo usuário.")
+        else:
+            # Caso contrário, segue a lógica de agendamento (até SIGTERM ou Ctrl+C)
+            try:
+                asyncio.run(Servico(args.config, config, estado, alvos, fila).executar())
+            except KeyboardInterrupt:
+                # Ctrl+C ainda na conexão (ou no Windows, sem add_signal_handler)
+                logger.info("Bot interrompido pelo usuário.")
+    finally:
+        # O journal do estado é compactado e a fila (SQLite) é fechada
+        fila.fechar()
+        estado.fechar()
+        if args.pid_file and os.path.exists(args.pid_file):
+            os.remove(args.pid_file)
+    if codigo_de_saida:
+        exit(codigo_de_saida)
 
 # -----------------------------------------------------------------------------
 # Ponto de entrada do script
 # -----------------------------------------------------------------------------
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    main()
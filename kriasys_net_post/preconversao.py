@@ -0,0 +1,221 @@
+# preconversao.py
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from metricas import METRICAS
+
+logger = logging.getLogger(__name__)
+
+# -----------------------------------------------------------------------------
+# Limites usados na conversão. O Telegram reduz fotos para 2560px no lado maior
+# e recusa fotos acima de 10 MB, então não adianta enviar nada maior que isso.
+# -----------------------------------------------------------------------------
+PASTA_CACHE = '.midia_convertida'
+LADO_MAXIMO = 2560
+TAMANHO_MAXIMO = 10 * 1024 * 1024
+QUALIDADE_JPEG = 87
+QUALIDADE_MINIMA = 55
+EXTENSOES_CONVERTIVEIS = ('.webp', '.png', '.bmp', '.tiff', '.jpg', '.jpeg')
+
+
+# -----------------------------------------------------------------------------
+# Funções executadas nos processos do pool (precisam ficar no nível do módulo)
+# -----------------------------------------------------------------------------
+def _hash_arquivo(caminho, tamanho_bloco=1024 * 1024):
+    sha = hashlib.sha256()
+    with open(caminho, 'rb') as f:
+        for bloco in iter(lambda: f.read(tamanho_bloco), b''):
+            sha.update(bloco)
+    return sha.hexdigest()
+
+
+def _converter(origem, pasta_cache):
+    """
+    Converte uma imagem em JPEG dentro dos limites do Telegram.
+    Devolve (hash_origem, caminho_convertido, tempo_cpu). Se a origem já for
+    um JPEG dentro dos limites, o próprio arquivo de origem é devolvido.
+    """
+    inicio = time.process_time()
+    hash_origem, destino = _converter_arquivo(origem, pasta_cache)
+    return hash_origem, destino, time.process_time() - inicio
+
+
+def _converter_arquivo(origem, pasta_cache):
+    from PIL import Image
+
+    hash_origem = _hash_arquivo(origem)
+    destino = os.path.join(pasta_cache, hash_origem + '.jpg')
+    if os.path.exists(destino):
+        # Mesmo conteúdo já convertido antes (inclusive em outra execução)
+        return hash_origem, destino
+
+    with Image.open(origem) as img:
+        extensao = os.path.splitext(origem)[1].lower()
+        if (extensao in ('.jpg', '.jpeg')
+                and max(img.size) <= LADO_MAXIMO
+                and os.path.getsize(origem) <= TAMANHO_MAXIMO):
+            return hash_origem, origem
+
+        img.draft('RGB', (LADO_MAXIMO, LADO_MAXIMO))
+        if img.mode in ('RGBA', 'LA', 'P'):
+            # JPEG não tem transparência: aplica a imagem sobre fundo branco
+            rgba = img.convert('RGBA')
+            fundo = Image.new('RGB', rgba.size, (255, 255, 255))
+            fundo.paste(rgba, mask=rgba.split()[3])
+            imagem = fundo
+        else:
+            imagem = img.convert('RGB')
+        imagem.thumbnail((LADO_MAXIMO, LADO_MAXIMO), Image.LANCZOS)
+
+        fd, temporario = tempfile.mkstemp(dir=pasta_cache, suffix='.tmp')
+        os.close(fd)
+        qualidade = QUALIDADE_JPEG
+        while True:
+            imagem.save(temporario, 'JPEG', quality=qualidade, optimize=True, progressive=True)
+            if os.path.getsize(temporario) <= TAMANHO_MAXIMO or qualidade <= QUALIDADE_MINIMA:
+                break
+            qualidade -= 10
+        os.replace(temporario, destino)
+    return hash_origem, destino
+
+
+# -----------------------------------------------------------------------------
+# Classe que converte todas as mídias das pastas uma única vez, em um pool de
+# processos, e guarda o resultado em disco para ser reaproveitado entre execuções.
+# -----------------------------------------------------------------------------
+class PipelineMidia:
+    def __init__(self, pasta_cache=PASTA_CACHE, processos=None):
+        """
+        :param pasta_cache: Pasta onde ficam os arquivos convertidos e o índice.
+        :param processos: Quantidade de processos de conversão (padrão: número de CPUs).
+        """
+        self.pasta_cache = pasta_cache
+        self.processos = processos
+        self.caminho_indice = os.path.join(pasta_cache, 'indice.json')
+        self.indice = {}
+        self._executor = None
+        self._lock = None
+        # Tempo de CPU gasto nas conversões (somado de todos os processos)
+        self.tempo_cpu = 0.0
+        os.makedirs(pasta_cache, exist_ok=True)
+        self._carregar_indice()
+
+    def _carregar_indice(self):
+        if not os.path.exists(self.caminho_indice):
+            return
+        try:
+            with open(self.caminho_indice, 'r', encoding='utf-8') as f:
+                self.indice = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning("Índice de mídias convertidas inválido, será refeito: %s", e)
+            self.indice = {}
+
+    def _salvar_indice(self):
+        fd, temporario = tempfile.mkstemp(dir=self.pasta_cache, suffix='.tmp')
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(self.indice, f, ensure_ascii=False, separators=(',', ':'))
+        os.replace(temporario, self.caminho_indice)
+
+    @staticmethod
+    def _assinatura(caminho):
+        st = os.stat(caminho)
+        return st.st_mtime_ns, st.st_size
+
+    def _entrada_atual(self, origem):
+        """Devolve a entrada do índice se a origem não mudou e o convertido ainda existe."""
+        entrada = self.indice.get(origem)
+        if entrada is None:
+            return None
+        try:
+            mtime, tamanho = self._assinatura(origem)
+        except OSError:
+            return None
+        if (entrada['mtime'] != mtime or entrada['tamanho'] != tamanho
+                or not os.path.exists(entrada['convertido'])):
+            return None
+        return entrada
+
+    def obter(self, origem):
+        """Devolve o caminho já convertido para a mídia, ou None se ainda não estiver pronto."""
+        entrada = self._entrada_atual(origem)
+        return entrada['convertido'] if entrada else None
+
+    async def preparar(self, arquivos):
+        """
+        Converte (no pool de processos) tudo o que ainda não está no cache,
+        remove do índice as mídias que mudaram ou sumiram e apaga os
+        convertidos que não são mais usados. Uma mídia que só não está em
+        'arquivos' continua no cache: com vários bots no mesmo pipeline
+        (multibot), cada um passa só as suas.
+        """
+        # Uma preparação por vez (o recarregamento das pastas pode pedir outra no meio)
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            await self._preparar(arquivos)
+
+    async def _preparar(self, arquivos):
+        arquivos = {a for a in arquivos
+                    if os.path.splitext(a)[1].lower() in EXTENSOES_CONVERTIVEIS}
+        pendentes = [a for a in arquivos if self._entrada_atual(a) is None]
+
+        # Mídias removidas das pastas (ou alteradas, cujo convertido ficou velho) saem do índice
+        for origem in list(self.indice):
+            if self._entrada_atual(origem) is None:
+                del self.indice[origem]
+
+        if pendentes:
+            logger.info("Convertendo %d mídia(s) em segundo plano...", len(pendentes))
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(max_workers=self.processos)
+            loop = asyncio.get_running_loop()
+
+            async def converter(origem):
+                try:
+                    mtime, tamanho = self._assinatura(origem)
+                    hash_origem, convertido, tempo_cpu = await loop.run_in_executor(
+                        self._executor, _converter, origem, self.pasta_cache
+                    )
+                except Exception as e:
+                    logger.error("Erro ao converter %s: %s", origem, e)
+                    METRICAS.incrementar('conversoes_falhas_total')
+                    self.indice.pop(origem, None)
+                    return
+                self.tempo_cpu += tempo_cpu
+                METRICAS.observar('conversao_cpu', tempo_cpu)
+                self.indice[origem] = {
+                    'hash': hash_origem,
+                    'mtime': mtime,
+                    'tamanho': tamanho,
+                    'convertido': convertido,
+                }
+
+            await asyncio.gather(*(converter(origem) for origem in pendentes))
+
+        self._remover_orfaos()
+        self._salvar_indice()
+        if pendentes:
+            logger.info("Conversão de mídias concluída.")
+
+    def _remover_orfaos(self):
+        """Apaga da pasta de cache os convertidos que nenhuma mídia usa mais."""
+        em_uso = {os.path.abspath(e['convertido']) for e in self.indice.values()}
+        em_uso.add(os.path.abspath(self.caminho_indice))
+        for nome in os.listdir(self.pasta_cache):
+            caminho = os.path.abspath(os.path.join(self.pasta_cache, nome))
+            if caminho not in em_uso:
+                try:
+                    os.remove(caminho)
+                except OSError as e:
+                    logger.error("Erro ao remover convertido antigo %s: %s", nome, e)
+
+    def encerrar(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
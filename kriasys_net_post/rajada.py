@@ -0,0 +1,215 @@
+# rajada.py
+import asyncio
+import logging
+import os
+import time
+from collections import namedtuple
+from datetime import datetime
+
+from metricas import METRICAS, percentil
+
+logger = logging.getLogger(__name__)
+
+# -----------------------------------------------------------------------------
+# Modo rajada (backfill): envia uma leva de posts o mais rápido que os limites
+# das contas permitem, como um pipeline de duas etapas ligadas por filas
+# limitadas:
+#
+#   seleção -> [fila] -> preparação (N trabalhadores) -> [fila] -> envio
+#
+# A preparação não escolhe nada: recebe o post já selecionado, diagrama a legenda,
+# consulta o cache de uploads das contas e converte (fora do loop) só as mídias
+# que ainda vão precisar de upload. O envio segue o ritmo do token bucket de
+# cada conta e, opcionalmente, de um limite geral por minuto. Enquanto um post
+# é enviado, os próximos já estão sendo preparados; as filas limitadas evitam
+# que a preparação corra muito à frente (e encha o disco de temporários).
+# -----------------------------------------------------------------------------
+TRABALHADORES_PADRAO = 4
+# Posts prontos esperando o envio (e selecionados esperando a preparação)
+TAMANHO_FILA_PADRAO = 8
+
+# Sinal de fim de cada etapa
+FIM = None
+
+Selecionado = namedtuple('Selecionado', 'alvo chave post_id tipo texto midia selecionado_em')
+# arquivos: caminho -> (arquivo, temporario) das mídias que foram convertidas na preparação
+Preparado = namedtuple('Preparado', 'selecionado arquivos preparado_em')
+
+
+def _caminhos(midia):
+    return midia if isinstance(midia, list) else [midia]
+
+
+def _remover_temporarios(arquivos):
+    for arquivo, temporario in arquivos.values():
+        if temporario and arquivo and os.path.exists(arquivo):
+            try:
+                os.remove(arquivo)
+            except OSError as e:
+                logger.error("Erro ao remover arquivo temporário: %s", e)
+
+
+async def executar_rajada(config, alvos, fila, quantidade, trabalhadores=TRABALHADORES_PADRAO,
+                          tamanho_fila=TAMANHO_FILA_PADRAO, por_minuto=None):
+    """
+    Envia 'quantidade' posts para cada alvo e devolve o relatório (dicionário).
+
+    :param trabalhadores: Posts preparados ao mesmo tempo.
+    :param tamanho_fila: Tamanho máximo de cada fila entre as etapas.
+    :param por_minuto: Limite geral de envios por minuto (além do limite de cada conta).
+    """
+    # Importados aqui: postar_kriasys importa este módulo só no modo rajada
+    from cliente_telegram import LimitadorTaxa
+    from contas import PoolContas
+    from legenda import LEGENDAS
+    from postar_kriasys import enviar_post, preparar_midia
+    from preconversao import PipelineMidia
+
+    pool = PoolContas.do_config(config)
+    await pool.iniciar()
+    pipeline = PipelineMidia()
+    limitador = LimitadorTaxa(por_minuto, 1) if por_minuto else None
+    selecionados = asyncio.Queue(tamanho_fila)
+    preparados = asyncio.Queue(tamanho_fila)
+    # Envios ao mesmo tempo: o pool ainda limita cada conta pelas suas vagas e pelo token bucket
+    remetentes = sum(conta.max_envios_simultaneos for conta in pool.contas)
+    tempos = {'preparacao': [], 'espera': [], 'envio': []}
+    contagem = {'enviados': 0, 'falhas': 0}
+    # Chaves dos posts que ficaram como 'falhou' na fila (ex.: FloodWait em todas as tentativas)
+    falhos = []
+    flood_antes = METRICAS.total('floodwait_total')
+    bytes_antes = METRICAS.total('bytes_enviados_total')
+
+    async def selecionar():
+        # A rotação (e o estado) só é mexida aqui, numa única tarefa
+        try:
+            for rodada in range(quantidade):
+                for alvo in alvos:
+                    await alvo.indice.atualizar_posts()
+                    selecao = alvo.selecionar()
+                    if selecao is None:
+                        continue
+                    post_id, tipo, texto, midia = selecao
+                    chave = f"{alvo.nome}:rajada:{datetime.now():%Y-%m-%d %H:%M:%S.%f}:{rodada}"
+                    await selecionados.put(Selecionado(alvo, chave, post_id, tipo, texto, midia, time.time()))
+        finally:
+            for _ in range(trabalhadores):
+                await selecionados.put(FIM)
+
+    async def preparar():
+        while True:
+            item = await selecionados.get()
+            if item is FIM:
+                return
+            inicio = time.perf_counter()
+            LEGENDAS.obter(item.post_id, item.texto, item.alvo.config['caption_limit'])
+            arquivos = {}
+            for caminho in _caminhos(item.midia):
+                # Mídia já no cache de todas as contas: vai só a referência, nada a converter
+                no_cache = True
+                for conta in pool.contas:
+                    if await conta.cache_midia.consultar(caminho) is None:
+                        no_cache = False
+                        break
+                if no_cache:
+                    continue
+                arquivos[caminho] = await asyncio.to_thread(preparar_midia, caminho, pipeline)
+            tempos['preparacao'].append(time.perf_counter() - inicio)
+            await preparados.put(Preparado(item, arquivos, time.perf_counter()))
+
+    async def enviar():
+        while True:
+            item = await preparados.get()
+            if item is FIM:
+                return
+            if limitador is not None:
+                await limitador.adquirir()
+            selecionado, arquivos = item.selecionado, item.arquivos
+            tempos['espera'].append(time.perf_counter() - item.preparado_em)
+
+            def preparado(caminho):
+                # Numa nova tentativa (outra conta) o temporário pode já ter sido apagado
+                arquivo, temporario = arquivos.get(caminho, (None, False))
+                if arquivo and os.path.exists(arquivo):
+                    return arquivo, temporario
+                return preparar_midia(caminho, pipeline)
+
+            inicio = time.perf_counter()
+            try:
+                entrega = await pool.executar(lambda gerenciador: enviar_post(
+                    gerenciador, selecionado.alvo, selecionado.post_id, selecionado.texto,
+                    selecionado.midia, pipeline, preparado
+                ))
+            except Exception as e:
+                duracao = time.perf_counter() - inicio
+                contagem['falhas'] += 1
+                falhos.append(selecionado.chave)
+                logger.error("[%s] Falha no envio da rajada: %s", selecionado.alvo.nome, e)
+                # Post pela metade (EnvioIncompleto): os ids do que saiu ficam no histórico
+                fila.registrar_envio(selecionado.chave, selecionado.alvo.nome, selecionado.post_id,
+                                     selecionado.midia, selecionado.selecionado_em, getattr(e, 'entrega', None),
+                                     erro=str(e), duracao=duracao)
+            else:
+                duracao = time.perf_counter() - inicio
+                contagem['enviados'] += 1
+                METRICAS.incrementar('envios_total', alvo=selecionado.alvo.nome)
+                fila.registrar_envio(selecionado.chave, selecionado.alvo.nome, selecionado.post_id,
+                                     selecionado.midia, selecionado.selecionado_em, entrega, duracao=duracao)
+            finally:
+                tempos['envio'].append(time.perf_counter() - inicio)
+                _remover_temporarios(arquivos)
+
+    logger.info("Rajada: %d post(s) por alvo, %d alvo(s), %d preparação(ões) e %d envio(s) ao mesmo tempo.",
+                quantidade, len(alvos), trabalhadores, remetentes)
+    inicio = time.perf_counter()
+    etapas = [asyncio.create_task(selecionar())]
+    preparacao = [asyncio.create_task(preparar()) for _ in range(trabalhadores)]
+    envio = [asyncio.create_task(enviar()) for _ in range(remetentes)]
+    try:
+        await asyncio.gather(*etapas, *preparacao)
+        for _ in range(remetentes):
+            await preparados.put(FIM)
+        await asyncio.gather(*envio)
+    finally:
+        for tarefa in etapas + preparacao + envio:
+            tarefa.cancel()
+        # Posts preparados que não chegaram a ser enviados (interrupção)
+        while not preparados.empty():
+            item = preparados.get_nowait()
+            if item is not FIM:
+                _remover_temporarios(item.arquivos)
+        pipeline.encerrar()
+        await pool.encerrar()
+    duracao = time.perf_counter() - inicio
+
+    relatorio = {
+        'enviados': contagem['enviados'],
+        'falhas': contagem['falhas'],
+        'falhos': falhos,
+        'duracao_s': duracao,
+        'posts_por_segundo': contagem['enviados'] / duracao if duracao else 0.0,
+        'preparacao_p50_ms': percentil(tempos['preparacao'], 50) * 1000,
+        'preparacao_p99_ms': percentil(tempos['preparacao'], 99) * 1000,
+        'espera_p50_ms': percentil(tempos['espera'], 50) * 1000,
+        'envio_p50_ms': percentil(tempos['envio'], 50) * 1000,
+        'envio_p99_ms': percentil(tempos['envio'], 99) * 1000,
+        'floodwaits': METRICAS.total('floodwait_total') - flood_antes,
+        'bytes_enviados': METRICAS.total('bytes_enviados_total') - bytes_antes,
+    }
+    imprimir_relatorio(relatorio)
+    return relatorio
+
+
+def imprimir_relatorio(relatorio):
+    logger.info("Rajada concluída: %d enviado(s), %d falha(s) em %.1f s (%.2f posts/s).",
+                relatorio['enviados'], relatorio['falhas'], relatorio['duracao_s'], relatorio['posts_por_segundo'])
+    logger.info("Preparação p50 %.0f ms / p99 %.0f ms | espera pelo envio p50 %.0f ms | "
+                "envio p50 %.0f ms / p99 %.0f ms",
+                relatorio['preparacao_p50_ms'], relatorio['preparacao_p99_ms'], relatorio['espera_p50_ms'],
+                relatorio['envio_p50_ms'], relatorio['envio_p99_ms'])
+    logger.info("%d FloodWait(s), %d bytes enviados.", relatorio['floodwaits'], relatorio['bytes_enviados'])
+    if relatorio['falhas']:
+        # Não são repetidos: a rajada termina, mas o resumo (e o código de saída) avisa
+        logger.error("%d post(s) não foram enviados e ficaram como 'falhou' na fila: %s. "
+                     "Veja com: python historico.py listar --status falhou --chave \"<alvo>:rajada:\"",
+                     relatorio['falhas'], ', '.join(relatorio['falhos']))
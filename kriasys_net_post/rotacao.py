@@ -0,0 +1,236 @@
+# rotacao.py
+import logging
+import os
+import random
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+# -----------------------------------------------------------------------------
+# Rotação ponderada ('rotation': 'weighted'): cada item é sorteado com
+# probabilidade proporcional ao seu peso (o de 'rotation_weights' vezes o
+# multiplicador vindo do engajamento), e os últimos 'rotation_cooldown' itens
+# usados ficam com peso zero até saírem da janela. O sorteio e cada mudança
+# de peso custam O(log n), então pools muito grandes continuam rápidos.
+# -----------------------------------------------------------------------------
+# Quanto vale uma reação em relação a uma visualização no engajamento
+PESO_REACAO = 10
+# Limites do multiplicador de engajamento (em relação à média do pool)
+MULTIPLICADOR_MINIMO = 0.25
+MULTIPLICADOR_MAXIMO = 4.0
+
+
+# -----------------------------------------------------------------------------
+# Árvore de Fenwick (Binary Indexed Tree) com as somas parciais dos pesos
+# -----------------------------------------------------------------------------
+class ArvoreFenwick:
+    # Atualizações antes de reconstruir a árvore (evita acumular erro de ponto flutuante)
+    MAX_ATUALIZACOES = 100000
+
+    def __init__(self, pesos):
+        self.pesos = [float(peso) for peso in pesos]
+        self.tamanho = len(self.pesos)
+        self._construir()
+
+    def _construir(self):
+        # Construção em O(n): cada nó repassa a sua soma para o pai
+        self.arvore = [0.0] + self.pesos
+        for posicao in range(1, self.tamanho + 1):
+            pai = posicao + (posicao & -posicao)
+            if pai <= self.tamanho:
+                self.arvore[pai] += self.arvore[posicao]
+        self._atualizacoes = 0
+
+    def total(self):
+        soma = 0.0
+        posicao = self.tamanho
+        while posicao > 0:
+            soma += self.arvore[posicao]
+            posicao -= posicao & -posicao
+        return soma
+
+    def definir(self, indice, peso):
+        """Troca o peso do item 'indice' (base 0)."""
+        delta = peso - self.pesos[indice]
+        if not delta:
+            return
+        self.pesos[indice] = peso
+        self._atualizacoes += 1
+        if self._atualizacoes >= self.MAX_ATUALIZACOES:
+            self._construir()
+            return
+        posicao = indice + 1
+        while posicao <= self.tamanho:
+            self.arvore[posicao] += delta
+            posicao += posicao & -posicao
+
+    def buscar(self, valor):
+        """Índice (base 0) do item em que a soma acumulada dos pesos passa de 'valor'."""
+        posicao = 0
+        passo = 1 << self.tamanho.bit_length()
+        while passo:
+            proxima = posicao + passo
+            if proxima <= self.tamanho and self.arvore[proxima] <= valor:
+                posicao = proxima
+                valor -= self.arvore[proxima]
+            passo >>= 1
+        return min(posicao, self.tamanho - 1)
+
+    def sortear(self, rng=random):
+        """Sorteia um índice com probabilidade proporcional ao peso, ou None se todos forem zero."""
+        total = self.total()
+        if total <= 0:
+            return None
+        indice = self.buscar(rng.random() * total)
+        if self.pesos[indice] <= 0:
+            # Resto de arredondamento na ponta: reconstrói e tenta de novo
+            self._construir()
+            indice = self.buscar(rng.random() * self.total())
+        return indice
+
+
+def peso_configurado(pesos, item_id, item):
+    """
+    Peso de 'rotation_weights' para o item: pelo id, pelo nome do arquivo
+    (mídias) ou pelo tipo do post. Sem nada configurado, o peso é 1.
+    """
+    if item_id in pesos:
+        return pesos[item_id]
+    if isinstance(item, str):
+        return pesos.get(os.path.basename(item), 1.0)
+    return pesos.get(getattr(item, 'tipo', None), 1.0)
+
+
+def multiplicadores(pontos_por_item):
+    """
+    Converte o engajamento médio de cada item (visualizações + reações) em
+    multiplicador de peso: 1 na média do pool, limitado entre 0,25 e 4.
+    """
+    if not pontos_por_item:
+        return {}
+    media = sum(pontos_por_item.values()) / len(pontos_por_item)
+    return {
+        item_id: min(MULTIPLICADOR_MAXIMO, max(MULTIPLICADOR_MINIMO, (pontos + 1) / (media + 1)))
+        for item_id, pontos in pontos_por_item.items()
+    }
+
+
+# -----------------------------------------------------------------------------
+# Selecionador ponderado, com a mesma interface do SelecionadorAleatorio.
+# O estado guarda só a janela de itens em espera (os usados por último).
+# -----------------------------------------------------------------------------
+class SelecionadorPonderado:
+    def __init__(self, itens, state_key, estado, pesos=None, cooldown=0):
+        """
+        :param itens: Dicionário {id: item} (posts ou mídias do índice de conteúdo).
+        :param state_key: Chave da rotação no estado ('posts', 'midias_usuario', ...).
+        :param estado: EstadoRotacao compartilhado por todos os selecionadores.
+        :param pesos: Dicionário de 'rotation_weights' (id, nome do arquivo ou tipo do post -> peso).
+        :param cooldown: Quantos sorteios um item fica sem poder sair de novo.
+        """
+        self.state_key = state_key
+        # Chave própria: trocar de 'shuffle' para 'weighted' (e voltar) não mistura os estados
+        self.chave_estado = f'{state_key}:recentes'
+        self.estado = estado
+        self.pesos = pesos or {}
+        self.cooldown = cooldown
+        self.multiplicadores = {}
+        entrada = estado.obter(self.chave_estado)
+        self.recentes = deque(entrada['perm'] if entrada else [])
+        self.itens_por_id = itens
+        self._reconstruir()
+
+    def _janela(self):
+        # Com menos itens que a janela, pelo menos um item fica livre para sair
+        return max(0, min(self.cooldown, len(self.ids) - 1))
+
+    def _peso(self, item_id):
+        if item_id in self._em_espera:
+            return 0.0
+        base = peso_configurado(self.pesos, item_id, self.itens_por_id[item_id])
+        return base * self.multiplicadores.get(item_id, 1.0)
+
+    def _reconstruir(self):
+        self.ids = list(self.itens_por_id)
+        self.posicoes = {item_id: posicao for posicao, item_id in enumerate(self.ids)}
+        recentes = [item_id for item_id in self.recentes if item_id in self.posicoes]
+        janela = self._janela()
+        self.recentes = deque(recentes[len(recentes) - janela:] if janela else [])
+        self._em_espera = set(self.recentes)
+        self.arvore = ArvoreFenwick([self._peso(item_id) for item_id in self.ids])
+
+    def _usar(self, item_id):
+        """Põe o item na janela de espera e libera o mais antigo quando a janela enche."""
+        janela = self._janela()
+        if not janela:
+            return
+        self.recentes.append(item_id)
+        self._em_espera.add(item_id)
+        self.arvore.definir(self.posicoes[item_id], 0.0)
+        while len(self.recentes) > janela:
+            antigo = self.recentes.popleft()
+            if antigo not in self.recentes:
+                self._em_espera.discard(antigo)
+                self.arvore.definir(self.posicoes[antigo], self._peso(antigo))
+
+    def _gravar(self):
+        if self.cooldown:
+            self.estado.definir_permutacao(self.chave_estado, list(self.recentes), len(self.recentes))
+
+    def _sortear(self, excluidos=()):
+        indice = self.arvore.sortear()
+        if indice is None:
+            # Todos os itens livres já saíram (ex.: álbum maior que o que sobrou fora da espera)
+            livres = [item_id for item_id in self.ids if item_id not in excluidos]
+            return random.choice(livres)
+        return self.ids[indice]
+
+    def proximo(self):
+        """Sorteia o próximo item de acordo com os pesos, respeitando o cooldown."""
+        return self.itens_por_id[self.proximo_id()]
+
+    def proximo_id(self):
+        """Igual a proximo(), mas devolve apenas o id do item."""
+        if not self.ids:
+            raise IndexError(f"Nenhum item disponível para '{self.state_key}'.")
+        item_id = self._sortear()
+        self._usar(item_id)
+        self._gravar()
+        return item_id
+
+    def proximos(self, quantidade):
+        """Sorteia 'quantidade' itens diferentes de uma vez (ex.: as mídias de um álbum)."""
+        if not self.ids:
+            raise IndexError(f"Nenhum item disponível para '{self.state_key}'.")
+        escolhidos = []
+        for _ in range(min(quantidade, len(self.ids))):
+            item_id = self._sortear(excluidos=escolhidos)
+            escolhidos.append(item_id)
+            # Fora do sorteio até o fim do álbum, mesmo sem cooldown
+            self.arvore.definir(self.posicoes[item_id], 0.0)
+        for item_id in escolhidos:
+            self._usar(item_id)
+        for item_id in escolhidos:
+            if item_id not in self._em_espera:
+                self.arvore.definir(self.posicoes[item_id], self._peso(item_id))
+        self._gravar()
+        return [self.itens_por_id[item_id] for item_id in escolhidos]
+
+    def reset(self):
+        """Libera todos os itens da janela de espera."""
+        self.recentes.clear()
+        self._reconstruir()
+        self._gravar()
+
+    def set_itens(self, novos_itens):
+        """Troca os itens (recarga a quente); a janela de espera é mantida."""
+        self.itens_por_id = novos_itens
+        self._reconstruir()
+        logger.info("Rotação '%s' atualizada: %d itens.", self.state_key, len(self.ids))
+
+    def aplicar_engajamento(self, pontos_por_item):
+        """Recalcula os pesos com o engajamento médio de cada item ({id: pontos})."""
+        self.multiplicadores = multiplicadores(
+            {item_id: pontos for item_id, pontos in pontos_por_item.items() if item_id in self.posicoes}
+        )
+        self._reconstruir()
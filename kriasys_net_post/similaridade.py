@@ -0,0 +1,289 @@
+# similaridade.py
+import argparse
+import io
+import json
+import logging
+import os
+import shutil
+import subprocess
+import threading
+from collections import namedtuple
+
+from estado import _gravar_atomico
+
+logger = logging.getLogger(__name__)
+
+# -----------------------------------------------------------------------------
+# Índice de similaridade das mídias ("media_dedup"): cada imagem (e o primeiro
+# quadro-chave de cada vídeo) recebe um hash perceptual de 64 bits (dHash).
+# Mídias cujos hashes diferem em poucos bits são quase iguais (a mesma arte em
+# _0/_1/_2, cópias " (1).webp" recomprimidas, ...) e formam um grupo, que a
+# rotação trata como uma mídia só. O índice fica em disco e só os arquivos
+# novos ou alterados são recalculados.
+# -----------------------------------------------------------------------------
+SIMILARES_FILE = '.midia_similares.json'
+VERSAO_INDICE = 1
+# Bits diferentes (de 64) aceitos entre duas mídias do mesmo grupo
+DISTANCIA_PADRAO = 6
+# Acima disso quase qualquer par de imagens seria considerado igual
+DISTANCIA_MAXIMA = 11
+EXTENSOES_VIDEO = ('.mp4',)
+# Divisão do hash para achar os pares próximos sem comparar todos com todos
+FAIXAS = 4
+BITS_FAIXA = 64 // FAIXAS
+
+
+def dhash(imagem):
+    """dHash de 64 bits: compara o brilho de pixels vizinhos na imagem reduzida para 9x8."""
+    from PIL import Image
+
+    reduzida = imagem.convert('L').resize((9, 8), Image.LANCZOS)
+    pixels = list(reduzida.getdata())
+    bits = 0
+    for linha in range(8):
+        for coluna in range(8):
+            esquerda = pixels[linha * 9 + coluna]
+            bits = (bits << 1) | (esquerda > pixels[linha * 9 + coluna + 1])
+    return bits
+
+
+def _hash_imagem(caminho):
+    from PIL import Image
+
+    with Image.open(caminho) as img:
+        # JPEG pode ser decodificado já reduzido: bem mais rápido em fotos grandes
+        img.draft('L', (64, 64))
+        return dhash(img), img.size[0] * img.size[1]
+
+
+def _hash_video(caminho):
+    """Hash do primeiro quadro-chave depois de 1 segundo (precisa do ffmpeg instalado)."""
+    from PIL import Image
+
+    ffmpeg = shutil.which('ffmpeg')
+    if ffmpeg is None:
+        return None, 0
+    try:
+        saida = subprocess.run(
+            [ffmpeg, '-v', 'error', '-ss', '1', '-i', caminho, '-frames:v', '1',
+             '-f', 'image2pipe', '-vcodec', 'png', '-'],
+            capture_output=True, timeout=60, check=True
+        ).stdout
+    except (OSError, subprocess.SubprocessError):
+        return None, 0
+    if not saida:
+        return None, 0
+    with Image.open(io.BytesIO(saida)) as quadro:
+        return dhash(quadro), quadro.size[0] * quadro.size[1]
+
+
+def calcular_phash(caminho):
+    """
+    Devolve (hash, area_em_pixels). O hash é None quando o arquivo não pode ser
+    lido como imagem (ou é um vídeo e o ffmpeg não está instalado): essa mídia
+    só é agrupada com cópias idênticas, como antes.
+    """
+    try:
+        if caminho.lower().endswith(EXTENSOES_VIDEO):
+            return _hash_video(caminho)
+        return _hash_imagem(caminho)
+    except Exception as e:
+        logger.warning("Não foi possível calcular o hash perceptual de %s: %s", caminho, e)
+        return None, 0
+
+
+def distancia(hash_a, hash_b):
+    return bin(hash_a ^ hash_b).count('1')
+
+
+# Estado do índice num instante: os hashes (caminho -> {'mtime', 'tamanho',
+# 'phash', 'area'}), o grupo de cada caminho e os caminhos de cada grupo
+Instantaneo = namedtuple('Instantaneo', 'arquivos grupos por_grupo')
+
+
+class IndicePerceptual:
+    def __init__(self, caminho=SIMILARES_FILE):
+        self.caminho = caminho
+        self.distancia_maxima = DISTANCIA_PADRAO
+        self.ativo = False
+        # O índice é atualizado na thread que vigia as pastas e lido no loop (cache
+        # de uploads, rotação): quem atualiza monta um Instantaneo novo e troca a
+        # referência de uma vez; quem lê pega a referência e nunca espera o lock,
+        # que só ordena as atualizações (o hash de um vídeo pode levar segundos)
+        self._atual = Instantaneo({}, {}, {})
+        self._lock = threading.Lock()
+
+    @property
+    def arquivos(self):
+        return self._atual.arquivos
+
+    def ativar(self, distancia_maxima=DISTANCIA_PADRAO, caminho=None):
+        """Liga o agrupamento e carrega o índice gravado."""
+        caminho = caminho or self.caminho
+        if self.ativo and (distancia_maxima, caminho) == (self.distancia_maxima, self.caminho):
+            return
+        with self._lock:
+            self.caminho = caminho
+            self.distancia_maxima = distancia_maxima
+            self.ativo = True
+            self._atual = self._montar(self._carregar())
+
+    def _carregar(self):
+        """Hashes gravados em disco (os atuais, se não houver um índice válido)."""
+        if not os.path.exists(self.caminho):
+            return self._atual.arquivos
+        try:
+            with open(self.caminho, 'r', encoding='utf-8') as f:
+                dados = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning("Índice de similaridade inválido em '%s', será refeito: %s", self.caminho, e)
+            return self._atual.arquivos
+        if dados.get('versao') != VERSAO_INDICE:
+            return self._atual.arquivos
+        return dados.get('arquivos', {})
+
+    def salvar(self):
+        _gravar_atomico(self.caminho, {'versao': VERSAO_INDICE, 'arquivos': self._atual.arquivos})
+
+    def _montar(self, arquivos):
+        grupos = self._agrupar(arquivos)
+        por_grupo = {}
+        for caminho, grupo in grupos.items():
+            por_grupo.setdefault(grupo, []).append(caminho)
+        return Instantaneo(arquivos, grupos, por_grupo)
+
+    def atualizar(self, pasta, assinaturas):
+        """
+        Recalcula o hash dos arquivos da pasta que são novos ou mudaram e
+        esquece os que sumiram. 'assinaturas' mapeia caminho -> (mtime_ns, tamanho).
+        Devolve True se algo mudou.
+        """
+        with self._lock:
+            arquivos = dict(self._atual.arquivos)
+            mudou = False
+            for caminho, (mtime, tamanho) in assinaturas.items():
+                entrada = arquivos.get(caminho)
+                if entrada and entrada['mtime'] == mtime and entrada['tamanho'] == tamanho:
+                    continue
+                phash, area = calcular_phash(caminho)
+                arquivos[caminho] = {'mtime': mtime, 'tamanho': tamanho, 'phash': phash, 'area': area}
+                mudou = True
+            for caminho in [c for c in arquivos if os.path.dirname(c) == pasta]:
+                if caminho not in assinaturas:
+                    del arquivos[caminho]
+                    mudou = True
+            if mudou:
+                self._atual = self._montar(arquivos)
+                self.salvar()
+            return mudou
+
+    def _agrupar(self, arquivos):
+        """
+        Agrupa os hashes próximos (union-find). Cada hash é dividido em 4 faixas
+        de 16 bits: dois hashes a até distancia_maxima bits têm alguma faixa com
+        no máximo distancia_maxima // 4 bits diferentes, então cada hash só é
+        comparado com os que caem nas variações da sua faixa com esses bits trocados.
+        """
+        tolerancia = self.distancia_maxima // FAIXAS
+        variacoes = [0]
+        for _ in range(tolerancia):
+            variacoes = sorted({v ^ (1 << bit) for v in variacoes for bit in range(BITS_FAIXA)} | set(variacoes))
+        pais = {}
+
+        def raiz(caminho):
+            while pais[caminho] != caminho:
+                pais[caminho] = pais[pais[caminho]]
+                caminho = pais[caminho]
+            return caminho
+
+        baldes = {}
+        mascara = (1 << BITS_FAIXA) - 1
+        for caminho, entrada in arquivos.items():
+            pais[caminho] = caminho
+            phash = entrada['phash']
+            if phash is None:
+                continue
+            for faixa in range(FAIXAS):
+                valor = (phash >> (faixa * BITS_FAIXA)) & mascara
+                for variacao in variacoes:
+                    for outro in baldes.get((faixa, valor ^ variacao), ()):
+                        if (raiz(outro) != raiz(caminho)
+                                and distancia(arquivos[outro]['phash'], phash) <= self.distancia_maxima):
+                            pais[raiz(caminho)] = raiz(outro)
+                baldes.setdefault((faixa, valor), []).append(caminho)
+        return {caminho: raiz(caminho) for caminho in pais}
+
+    def grupos(self):
+        """caminho -> identificador do grupo (um dos caminhos do grupo)."""
+        return self._atual.grupos
+
+    def por_grupo(self):
+        """grupo -> lista dos caminhos do grupo."""
+        return self._atual.por_grupo
+
+    def membros(self, caminho):
+        """Outras mídias do mesmo grupo do caminho (lista vazia se não houver)."""
+        atual = self._atual
+        grupo = atual.grupos.get(caminho)
+        if grupo is None:
+            return []
+        return [outro for outro in atual.por_grupo[grupo] if outro != caminho]
+
+    def agrupar_pasta(self, midias):
+        """
+        Reduz {id: caminho} de uma pasta a uma entrada por grupo: fica a mídia de
+        maior resolução (em empate, o menor caminho) com o seu próprio id.
+        """
+        atual = self._atual
+        melhores = {}
+        for item_id, caminho in midias.items():
+            grupo = atual.grupos.get(caminho, caminho)
+            melhor = melhores.get(grupo)
+            if melhor is None or self._melhor(atual.arquivos, caminho, melhor[1]):
+                melhores[grupo] = (item_id, caminho)
+        return dict(sorted(melhores.values(), key=lambda par: par[1]))
+
+    @staticmethod
+    def _melhor(arquivos, caminho, outro):
+        area = arquivos.get(caminho, {}).get('area', 0)
+        area_outro = arquivos.get(outro, {}).get('area', 0)
+        return (area, outro) > (area_outro, caminho)
+
+
+# Índice único: usado pelo índice de conteúdo (rotação) e pelo cache de uploads
+SIMILARES = IndicePerceptual()
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Indexa as pastas de mídia e mostra os grupos de mídias quase iguais."
+    )
+    parser.add_argument('pastas', nargs='*', help="Pastas de mídia (padrão: as do config.json).")
+    parser.add_argument('--config', default='config.json', help="Arquivo de configuração.")
+    parser.add_argument('--distancia', type=int, help="Bits diferentes aceitos (padrão: o do config.json).")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(name)s: %(message)s')
+
+    from conteudo import EXTENSOES_VALIDAS
+    from postar_kriasys import carregar_config
+    config = carregar_config(args.config)
+    pastas = args.pastas or sorted({pasta for alvo in config['targets'] for pasta in alvo['pastas_midia'].values()})
+    SIMILARES.ativar(args.distancia if args.distancia is not None else config['media_dedup_distance'])
+    for pasta in pastas:
+        assinaturas = {}
+        for entrada in os.scandir(pasta):
+            if entrada.is_file() and entrada.name.lower().endswith(EXTENSOES_VALIDAS):
+                st = entrada.stat()
+                assinaturas[os.path.join(pasta, entrada.name)] = (st.st_mtime_ns, st.st_size)
+        SIMILARES.atualizar(pasta, assinaturas)
+
+    por_grupo = SIMILARES.por_grupo()
+    repetidos = [sorted(membros) for membros in por_grupo.values() if len(membros) > 1]
+    print(f"{len(SIMILARES.arquivos)} mídia(s) em {len(por_grupo)} grupo(s); "
+          f"{len(repetidos)} grupo(s) com mídias quase iguais:")
+    for membros in sorted(repetidos):
+        print("  - " + "\n    ".join(membros))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,259 @@
+# telegram_falso.py
+import asyncio
+import itertools
+import math
+import os
+import random
+import time
+from collections import deque
+from types import SimpleNamespace
+
+from telethon.errors import (FilePartsInvalidError, FileReferenceExpiredError, FloodWaitError,
+                             MediaCaptionTooLongError, MessageIdInvalidError, MessageTooLongError)
+from telethon.helpers import add_surrogate
+from telethon.tl.functions.upload import SaveBigFilePartRequest
+from telethon.tl.types import InputDocument, InputFileBig, InputMediaUploadedDocument, InputPhoto
+
+# -----------------------------------------------------------------------------
+# Telegram falso para rodar o bot sem credenciais e sem rede (modo de teste
+# local e benchmark). Implementa só a parte do TelegramClient que o bot usa:
+# start, is_connected, disconnect, get_entity, send_file (mídia única ou
+# álbum), send_message, get_messages (com visualizações e reações que crescem
+# a cada consulta), edit_message, delete_messages e o upload de arquivos
+# grandes em partes.
+# -----------------------------------------------------------------------------
+EXTENSOES_FOTO = ('.jpg', '.jpeg', '.png', '.webp', '.bmp')
+
+
+# -----------------------------------------------------------------------------
+# "Servidor" compartilhado por todos os clientes falsos do processo: guarda as
+# mídias recebidas e as estatísticas, e simula latência, banda de upload e
+# FloodWait (limite de envios por minuto de cada conta).
+# -----------------------------------------------------------------------------
+class ServidorFalso:
+    def __init__(self):
+        self.configurar()
+        self.zerar()
+
+    def configurar(self, latency_ms=50, upload_mbps=20, limit_per_minute=0, flood_seconds=5,
+                   caption_limit=1024, **_ignorado):
+        """
+        :param latency_ms: Latência (ida e volta) de cada requisição.
+        :param upload_mbps: Banda de upload da conexão de cada cliente (megabits por segundo);
+                            requisições simultâneas do mesmo cliente dividem a banda, só a latência se sobrepõe.
+        :param limit_per_minute: Envios por minuto aceitos de cada conta antes do FloodWait (0 = sem limite).
+        :param flood_seconds: Espera mínima pedida no FloodWait (a real vai até abrir vaga na janela).
+        :param caption_limit: Tamanho máximo da legenda (1024, ou 2048 numa conta Premium).
+        """
+        self.latencia = latency_ms / 1000.0
+        self.banda = upload_mbps * 1_000_000 / 8
+        self.limite_por_minuto = limit_per_minute
+        self.flood_segundos = flood_seconds
+        self.limite_legenda = caption_limit
+
+    def zerar(self):
+        """Apaga as mensagens, as mídias e as estatísticas (ex.: entre rodadas do benchmark)."""
+        self.mensagens = {}
+        # id da mensagem -> mensagem (para o get_messages)
+        self.mensagens_por_id = {}
+        # id da mídia -> mídia recebida (file_reference e se é foto)
+        self.midias = {}
+        self.envios = 0
+        self.bytes_recebidos = 0
+        self.uploads = 0
+        self.reusos = 0
+        self.floodwaits = 0
+        self.edicoes = 0
+        self.apagadas = 0
+        # Requisições de delete_messages (cada uma com até 100 ids)
+        self.requisicoes_apagar = 0
+        self._janelas = {}
+        self._ids = itertools.count(1)
+        # id do arquivo grande -> partes já recebidas
+        self._partes = {}
+
+    def resumo(self):
+        return {
+            'envios': self.envios,
+            'uploads': self.uploads,
+            'reusos': self.reusos,
+            'bytes_recebidos': self.bytes_recebidos,
+            'floodwaits': self.floodwaits,
+        }
+
+    def verificar_flood(self, session):
+        if not self.limite_por_minuto:
+            return
+        agora = time.monotonic()
+        janela = self._janelas.setdefault(session, deque())
+        while janela and agora - janela[0] > 60:
+            janela.popleft()
+        if len(janela) >= self.limite_por_minuto:
+            self.floodwaits += 1
+            # Como no Telegram, a espera vai até a conta ter vaga de novo na janela de 60 s
+            restante = math.ceil(60 - (agora - janela[0]))
+            raise FloodWaitError(request=None, capture=max(self.flood_segundos, restante))
+        janela.append(agora)
+
+    def registrar_mensagem(self, chat_id, texto, midia=None):
+        mensagem = SimpleNamespace(id=next(self._ids), chat_id=chat_id, text=texto,
+                                   photo=None, document=None, views=0, reactions=None)
+        if midia is not None:
+            if midia.foto:
+                mensagem.photo = midia
+            else:
+                mensagem.document = midia
+        self.mensagens.setdefault(chat_id, []).append(mensagem)
+        self.mensagens_por_id[mensagem.id] = mensagem
+        self.envios += 1
+        return mensagem
+
+    def consultar_mensagem(self, chat_id, mensagem_id):
+        """Devolve a mensagem com mais algumas visualizações e reações, ou None se não existir."""
+        mensagem = self.mensagens_por_id.get(mensagem_id)
+        if mensagem is None or mensagem.chat_id != chat_id:
+            return None
+        mensagem.views += random.randint(0, 200)
+        reacoes = (mensagem.reactions.results[0].count if mensagem.reactions else 0) + random.randint(0, 10)
+        mensagem.reactions = SimpleNamespace(results=[SimpleNamespace(count=reacoes)])
+        return mensagem
+
+    def editar_mensagem(self, chat_id, mensagem_id, texto):
+        mensagem = self.mensagens_por_id.get(mensagem_id)
+        if mensagem is None or mensagem.chat_id != chat_id:
+            raise MessageIdInvalidError(request=None)
+        mensagem.text = texto
+        self.edicoes += 1
+        return mensagem
+
+    def apagar_mensagens(self, chat_id, ids):
+        self.requisicoes_apagar += 1
+        for mensagem_id in ids:
+            mensagem = self.mensagens_por_id.get(mensagem_id)
+            if mensagem is not None and mensagem.chat_id == chat_id:
+                del self.mensagens_por_id[mensagem_id]
+                self.mensagens[chat_id].remove(mensagem)
+                self.apagadas += 1
+
+    def registrar_parte(self, arquivo_id, numero, tamanho):
+        self._partes.setdefault(arquivo_id, set()).add(numero)
+        self.bytes_recebidos += tamanho
+
+    def concluir_upload(self, arquivo):
+        """Cria a mídia de um arquivo grande cujas partes já chegaram."""
+        if len(self._partes.pop(arquivo.id, ())) != arquivo.parts:
+            # Como no Telegram: partes que faltam (ou que já foram usadas num envio)
+            raise FilePartsInvalidError(request=None)
+        self.uploads += 1
+        return self.nova_midia(arquivo.name.lower().endswith(EXTENSOES_FOTO))
+
+    def nova_midia(self, foto):
+        midia_id = next(self._ids)
+        midia = SimpleNamespace(id=midia_id, access_hash=random.getrandbits(63),
+                                file_reference=os.urandom(8), foto=foto)
+        self.midias[midia_id] = midia
+        return midia
+
+
+SERVIDOR = ServidorFalso()
+
+
+class ClienteFalso:
+    def __init__(self, session, servidor=SERVIDOR):
+        self.session = session
+        self.servidor = servidor
+        self._conectado = False
+        # Uma única conexão (como no MTProto): os bytes das requisições passam um de cada vez
+        self._conexao = None
+
+    async def start(self):
+        await asyncio.sleep(self.servidor.latencia)
+        self._conexao = asyncio.Lock()
+        self._conectado = True
+        return self
+
+    def is_connected(self):
+        return self._conectado
+
+    async def disconnect(self):
+        self._conectado = False
+
+    async def get_entity(self, entidade_id):
+        await asyncio.sleep(self.servidor.latencia)
+        return SimpleNamespace(id=entidade_id, title=f"Canal falso {entidade_id}")
+
+    async def _transmitir(self, tamanho):
+        async with self._conexao:
+            await asyncio.sleep(tamanho / self.servidor.banda)
+
+    async def _requisicao(self):
+        if not self._conectado:
+            raise ConnectionError("Cliente falso desconectado.")
+        self.servidor.verificar_flood(self.session)
+        await asyncio.sleep(self.servidor.latencia)
+
+    async def send_message(self, entidade, texto, **_formatacao):
+        # Os limites do Telegram contam unidades UTF-16 do texto já sem markdown
+        if len(add_surrogate(texto)) > 4096:
+            raise MessageTooLongError(request=None)
+        await self._requisicao()
+        return self.servidor.registrar_mensagem(entidade.id, texto)
+
+    async def get_messages(self, entidade, ids):
+        await self._requisicao()
+        return [self.servidor.consultar_mensagem(entidade.id, mensagem_id) for mensagem_id in ids]
+
+    async def edit_message(self, entidade, mensagem_id, texto, **_formatacao):
+        await self._requisicao()
+        return self.servidor.editar_mensagem(entidade.id, mensagem_id, texto)
+
+    async def delete_messages(self, entidade, ids):
+        # Como no Telegram, uma requisição apaga até 100 mensagens
+        if len(ids) > 100:
+            raise ValueError("Até 100 mensagens por requisição.")
+        await self._requisicao()
+        self.servidor.apagar_mensagens(entidade.id, ids)
+
+    async def __call__(self, requisicao):
+        """Requisições diretas à API; só o upload de partes de arquivos grandes é usado."""
+        if not isinstance(requisicao, SaveBigFilePartRequest):
+            raise NotImplementedError(f"Requisição não suportada pelo Telegram falso: {type(requisicao).__name__}")
+        if not self._conectado:
+            raise ConnectionError("Cliente falso desconectado.")
+        await self._transmitir(len(requisicao.bytes))
+        await asyncio.sleep(self.servidor.latencia)
+        self.servidor.registrar_parte(requisicao.file_id, requisicao.file_part, len(requisicao.bytes))
+        return True
+
+    async def _receber_midia(self, arquivo):
+        if isinstance(arquivo, (InputPhoto, InputDocument)):
+            # Reenvio por referência: nenhum byte de upload
+            midia = self.servidor.midias.get(arquivo.id)
+            if midia is None or midia.file_reference != arquivo.file_reference:
+                raise FileReferenceExpiredError(request=None)
+            self.servidor.reusos += 1
+            return midia
+        if isinstance(arquivo, InputMediaUploadedDocument):
+            arquivo = arquivo.file
+        if isinstance(arquivo, InputFileBig):
+            # As partes já chegaram por SaveBigFilePartRequest
+            return self.servidor.concluir_upload(arquivo)
+        tamanho = os.path.getsize(arquivo)
+        await self._transmitir(tamanho)
+        self.servidor.bytes_recebidos += tamanho
+        self.servidor.uploads += 1
+        return self.servidor.nova_midia(arquivo.lower().endswith(EXTENSOES_FOTO))
+
+    async def send_file(self, entidade, arquivo, caption=None, **_formatacao):
+        if caption and len(add_surrogate(caption)) > self.servidor.limite_legenda:
+            raise MediaCaptionTooLongError(request=None)
+        await self._requisicao()
+        if isinstance(arquivo, list):
+            # Álbum: uma mensagem por mídia, a legenda fica na primeira
+            if not 1 <= len(arquivo) <= 10:
+                raise ValueError("Um álbum deve ter de 1 a 10 mídias.")
+            midias = [await self._receber_midia(item) for item in arquivo]
+            return [self.servidor.registrar_mensagem(entidade.id, caption if posicao == 0 else '', midia)
+                    for posicao, midia in enumerate(midias)]
+        midia = await self._receber_midia(arquivo)
+        return self.servidor.registrar_mensagem(entidade.id, caption, midia)
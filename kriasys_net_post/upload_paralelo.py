@@ -0,0 +1,122 @@
+# upload_paralelo.py
+import asyncio
+import logging
+import os
+
+from telethon import utils
+from telethon.helpers import generate_random_long
+from telethon.tl.functions.upload import SaveBigFilePartRequest
+from telethon.tl.types import InputFileBig, InputMediaUploadedDocument
+
+from metricas import METRICAS
+
+logger = logging.getLogger(__name__)
+
+# -----------------------------------------------------------------------------
+# Upload de arquivos grandes (vídeos) com as partes em sequência (pipeline). O
+# Telethon envia as partes de um arquivo uma de cada vez, esperando a resposta
+# de cada uma; aqui vários trabalhadores deixam partes pendentes na mesma
+# conexão e o Telegram as junta pelo número da parte. Os bytes continuam
+# passando por uma única conexão MTProto: o ganho é não esperar a ida e volta
+# de cada parte, não somar banda. Só vale para arquivos "grandes" do protocolo
+# (acima de 10 MB). O nome do módulo ficou do tempo em que se falava em
+# "upload paralelo".
+# -----------------------------------------------------------------------------
+LIMITE_ARQUIVO_GRANDE = 10 * 1024 * 1024
+# Maior parte aceita pelo Telegram
+TAMANHO_PARTE = 512 * 1024
+
+
+def _ler_parte(caminho, numero):
+    with open(caminho, 'rb') as f:
+        f.seek(numero * TAMANHO_PARTE)
+        return f.read(TAMANHO_PARTE)
+
+
+async def upload_em_partes(client, caminho, trabalhadores=4):
+    """
+    Envia o arquivo em partes de 512 KB com até 'trabalhadores' partes
+    aguardando resposta ao mesmo tempo e devolve o InputFileBig.
+    """
+    tamanho = os.path.getsize(caminho)
+    total_partes = (tamanho + TAMANHO_PARTE - 1) // TAMANHO_PARTE
+    arquivo_id = generate_random_long()
+    partes = asyncio.Queue()
+    for numero in range(total_partes):
+        partes.put_nowait(numero)
+
+    async def trabalhador():
+        while not partes.empty():
+            numero = partes.get_nowait()
+            # Leitura do disco fora do loop de eventos
+            dados = await asyncio.to_thread(_ler_parte, caminho, numero)
+            if not await client(SaveBigFilePartRequest(arquivo_id, numero, total_partes, dados)):
+                raise ConnectionError(f"O Telegram recusou a parte {numero} de {caminho}.")
+
+    with METRICAS.cronometrar('upload_paralelo'):
+        tarefas = [asyncio.create_task(trabalhador()) for _ in range(min(trabalhadores, total_partes))]
+        try:
+            await asyncio.gather(*tarefas)
+        finally:
+            # Se uma parte falhar, as outras não continuam enviando à toa
+            for tarefa in tarefas:
+                tarefa.cancel()
+    logger.debug("Upload de %s em %d partes (%d trabalhadores).", caminho, total_partes, trabalhadores)
+    return InputFileBig(arquivo_id, total_partes, os.path.basename(caminho))
+
+
+def midia_do_upload(caminho, arquivo):
+    """
+    Mídia do arquivo grande já enviado em partes. O send_file só vê o
+    InputFileBig (sem o arquivo no disco), e os vídeos perderiam a duração, as
+    dimensões e o streaming: os atributos saem aqui do arquivo original, como
+    o Telethon faz no upload normal. Fotos vão como InputFileBig mesmo.
+    """
+    if utils.is_image(caminho):
+        return arquivo
+    atributos, mime = utils.get_attributes(caminho, supports_streaming=utils.is_video(caminho))
+    return InputMediaUploadedDocument(file=arquivo, mime_type=mime or 'application/octet-stream',
+                                      attributes=atributos)
+
+
+async def preparar_upload(client, arquivo, trabalhadores=4):
+    """
+    Devolve o que deve ir para o send_file: arquivos grandes já enviados em
+    partes (InputMediaUploadedDocument, ou InputFileBig nas fotos); o resto
+    (arquivos pequenos e referências do cache) volta como veio.
+    """
+    if (trabalhadores > 1 and isinstance(arquivo, str)
+            and os.path.getsize(arquivo) > LIMITE_ARQUIVO_GRANDE):
+        return midia_do_upload(arquivo, await upload_em_partes(client, arquivo, trabalhadores))
+    return arquivo
+
+
+def formatacao(entidades):
+    """Argumentos do envio quando o markdown já foi interpretado (legenda.py)."""
+    if entidades is None:
+        return {}
+    return {'formatting_entities': entidades, 'parse_mode': None}
+
+
+async def enviar_arquivos(client, entidade, arquivos, legenda, trabalhadores=4, entidades=None, subidos=None):
+    """
+    send_file de uma mídia ou de um álbum (lista), com upload em partes dos arquivos
+    grandes. Com 'entidades', a legenda já vem sem markdown e não é interpretada de novo.
+    'subidos' (posição -> mídia do upload) recebe os arquivos grandes cujas partes já
+    foram enviadas: se o send_file falhar, quem chamou pode guardá-los e uma nova
+    tentativa (nesta chamada ou depois, na mesma conta) não sobe as partes de novo.
+    """
+    if subidos is None:
+        subidos = {}
+    lista = arquivos if isinstance(arquivos, list) else [arquivos]
+    entrada = []
+    for posicao, arquivo in enumerate(lista):
+        if posicao not in subidos:
+            preparado = await preparar_upload(client, arquivo, trabalhadores)
+            if preparado is arquivo:
+                entrada.append(arquivo)
+                continue
+            subidos[posicao] = preparado
+        entrada.append(subidos[posicao])
+    return await client.send_file(entidade, entrada if isinstance(arquivos, list) else entrada[0],
+                                  caption=legenda, **formatacao(entidades))